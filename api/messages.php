@@ -69,6 +69,22 @@ try {
                 $includeHidden = isset($_GET['include_hidden']) && $_GET['include_hidden'] === '1';
             }
             
+            // Catch-up mode: everything after since_id, oldest first, filtered in SQL
+            // so the limit applies after the room filter and callers can page
+            if (isset($_GET['since_id'])) {
+                $sinceId = max(0, (int)$_GET['since_id']);
+                $roomFilter = ($roomId !== null && $security->validateRoomId($roomId)) ? $roomId : null;
+                $messages = $repository->getMessagesSince($sinceId, $limit, $roomFilter, $includeHidden);
+                
+                echo json_encode([
+                    'success' => true,
+                    'messages' => $messages,
+                    'count' => count($messages),
+                    'has_more' => count($messages) >= $limit,
+                ]);
+                break;
+            }
+            
             // For display purposes, include delivered messages too
             $includeDelivered = true; // Always include delivered messages for chat display
             $messages = $repository->getPendingMessages($limit, $includeHidden, $includeDelivered);
@@ -9,6 +9,17 @@ This bot:
 - Generates AI responses using a simple rule-based system (extendable to OpenAI/other APIs)
 - Sends responses via the PHP API
 
+Message handling is fully asynchronous: intake only decodes and queues,
+each room has its own queue worker so rooms proceed independently,
+response generation is bounded by a worker pool, and all HTTP traffic
+goes through one pooled async client.
+
+Many personas can run across many rooms in one process: set
+BOT_PERSONAS_FILE to a JSON file of personas (see
+chatbot-personas.example.json). The host opens one WebSocket per room,
+shared by every persona in that room, and one pooled HTTP client shared
+by all personas.
+
 Usage:
     python chatbot-bot.py
 
@@ -17,15 +28,22 @@ Configuration:
 """
 
 import asyncio
+import base64
+import hashlib
 import websockets
+import httpx
 import json
-import requests
 import os
+from datetime import datetime
+import random
+import sqlite3
 import sys
+import threading
 import time
 import re
-from urllib.parse import quote
-from typing import Optional, Dict, List
+from collections import OrderedDict, deque
+from urllib.parse import quote, unquote
+from typing import Awaitable, Callable, Optional, Dict, List, Tuple
 import logging
 
 # Configure logging
@@ -58,10 +76,79 @@ CONFIG = {
     'response_delay': float(os.getenv('RESPONSE_DELAY', '2.0')),  # Seconds to wait before responding
     'ai_provider': os.getenv('AI_PROVIDER', 'simple'),  # 'simple', 'openai', 'ollama'
     'openai_api_key': os.getenv('OPENAI_API_KEY', ''),
+    'openai_model': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
     'ollama_url': os.getenv('OLLAMA_URL', 'http://localhost:11434'),
     'ollama_model': os.getenv('OLLAMA_MODEL', 'llama2'),
+    'ollama_concurrency': int(os.getenv('OLLAMA_CONCURRENCY', '1')),  # Concurrent Ollama generations (whole host)
+    'openai_concurrency': int(os.getenv('OPENAI_CONCURRENCY', '8')),  # Concurrent OpenAI requests (whole host)
+    'inference_queue_size': int(os.getenv('INFERENCE_QUEUE_SIZE', '50')),  # Requests waiting for a model slot before shedding
+    'inference_deadline': float(os.getenv('INFERENCE_DEADLINE', '30')),  # Seconds after which an unanswered message is dropped
+    'room_deadlines': {},  # Per-room deadline overrides (room_id -> seconds), set in a personas file
+    'room_queue_size': int(os.getenv('ROOM_QUEUE_SIZE', '20')),  # Pending messages per room before dropping
+    'http_max_connections': int(os.getenv('HTTP_MAX_CONNECTIONS', '20')),  # Pooled API/LLM connections
+    'personas_file': os.getenv('BOT_PERSONAS_FILE', ''),  # JSON file of personas for a multi-bot host
+    'state_file': os.getenv('BOT_STATE_FILE', os.path.join('logs', 'chatbot-bot-state.json')),  # Last seen message per room ('' = don't persist)
+    'intents_file': os.getenv('INTENTS_FILE', ''),  # JSON intent rules for the simple responder
+    'mention_aliases': os.getenv('BOT_MENTION_ALIASES', ''),  # Extra names that count as a mention (comma-separated)
+    'stream_responses': os.getenv('STREAM_RESPONSES', '1').lower() in ('1', 'true', 'yes'),  # Stream LLM tokens and stop at the budget
+    'max_response_chars': int(os.getenv('MAX_RESPONSE_CHARS', '500')),  # Reply length budget (0 = unlimited)
+    'max_response_sentences': int(os.getenv('MAX_RESPONSE_SENTENCES', '3')),  # Reply sentence budget (0 = unlimited)
+    'early_first_sentence': os.getenv('EARLY_FIRST_SENTENCE', '0').lower() in ('1', 'true', 'yes'),  # Send sentence one while the rest generates
+    'context_messages': int(os.getenv('CONTEXT_MESSAGES', '20')),  # Messages remembered per room (ring buffer)
+    'context_max_rooms': int(os.getenv('CONTEXT_MAX_ROOMS', '1000')),  # Rooms remembered before the idlest is evicted
+    'context_max_bytes': int(os.getenv('CONTEXT_MAX_BYTES', str(8 * 1024 * 1024))),  # Global cap on remembered text
+    'context_token_budget': int(os.getenv('CONTEXT_TOKEN_BUDGET', '400')),  # Approximate tokens of history sent to the model
+    'cache_max_entries': int(os.getenv('CACHE_MAX_ENTRIES', '1000')),  # LLM replies kept in memory (0 = no cache)
+    'cache_ttl': float(os.getenv('CACHE_TTL', '3600')),  # Seconds a cached reply stays valid
+    'cache_path': os.getenv('CACHE_PATH', ''),  # SQLite file for a persistent cache tier ('' = memory only)
+    'cache_disk_max_entries': int(os.getenv('CACHE_DISK_MAX_ENTRIES', '50000')),
+    'cache_context_free_intents': os.getenv('CACHE_CONTEXT_FREE_INTENTS', 'how_are_you,name,who_are_you,greetings,goodbye,thanks'),  # Intents cached regardless of room history
 }
 
+# Settings shared by every persona of a host (one connection pool, one cache, one server)
+HOST_CONFIG_KEYS = (
+    'ws_host', 'ws_port', 'api_base_url', 'api_secret', 'http_max_connections',
+    'cache_max_entries', 'cache_ttl', 'cache_path', 'cache_disk_max_entries',
+    'context_messages', 'context_max_rooms', 'context_max_bytes',
+    'ollama_concurrency', 'openai_concurrency', 'inference_queue_size', 'state_file',
+)
+
+# Seconds between bot and cache statistics log lines
+STATS_LOG_INTERVAL = 300
+
+# WebSocket reconnects use exponential backoff with full jitter: a random
+# delay between 0 and min(max, base * 2^attempt) seconds
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# A connection that stayed up this long resets the backoff
+RECONNECT_STABLE_SECONDS = 30
+# Initial connects are spread over this many seconds so a fleet restart
+# doesn't hit the server all at once
+RECONNECT_STARTUP_JITTER = 3
+
+# After reconnecting, rooms wait this long so rooms reconnecting together
+# share one catch-up fetch
+CATCH_UP_BATCH_DELAY = 1
+# Messages per catch-up page, and pages fetched before giving up; with
+# several rooms a page covers all of them, so the cap is shared
+CATCH_UP_LIMIT = 500
+CATCH_UP_MAX_PAGES = 20
+# Message IDs remembered per room to skip duplicates
+SEEN_IDS_SIZE = 1000
+
+# Seconds between saves of the last seen message per room
+STATE_SAVE_INTERVAL = 30
+
+# Seconds between keepalive pings
+KEEPALIVE_INTERVAL = 30
+
+# Seconds a room worker waits for new messages before exiting
+ROOM_WORKER_IDLE_TIMEOUT = 60
+
+# HTTP timeouts (seconds)
+API_TIMEOUT = 10
+OLLAMA_TIMEOUT = 30
+
 # Bot personality and responses
 BOT_RESPONSES = {
     'greetings': [
@@ -95,21 +182,646 @@ BOT_RESPONSES = {
     ],
 }
 
+# Built-in intent rules for the simple responder. Higher priority wins when a
+# message matches several intents; an INTENTS_FILE can replace or extend them.
+DEFAULT_INTENTS = [
+    {'name': 'how_are_you', 'priority': 60, 'patterns': ['how are you', 'how r u'],
+     'responses': ["I'm doing great, thanks for asking! How are you?"]},
+    {'name': 'name', 'priority': 60, 'patterns': ["what's your name", 'whats your name', 'what is your name'],
+     'responses': ["I'm {bot_handle}! Nice to meet you!"]},
+    {'name': 'who_are_you', 'priority': 60, 'patterns': ['who are you'],
+     'responses': ["I'm {bot_handle}, a friendly AI chatbot here to chat with you!"]},
+    {'name': 'greetings', 'priority': 50, 'patterns': ['hello', 'hi', 'hey', 'greetings'],
+     'responses': BOT_RESPONSES['greetings']},
+    {'name': 'questions', 'priority': 30, 'patterns': ['?'],
+     'responses': BOT_RESPONSES['questions']},
+    {'name': 'goodbye', 'priority': 20, 'patterns': ['bye', 'goodbye', 'see you', 'farewell'],
+     'responses': BOT_RESPONSES['goodbye']},
+    {'name': 'thanks', 'priority': 10, 'patterns': ['thank*', 'thx'],
+     'responses': BOT_RESPONSES['thanks']},
+]
+
+# Mention patterns every bot answers to besides its handle and aliases
+DEFAULT_MENTION_PATTERNS = ['^bot', '^hey bot', '^hi bot']
+
+
+def compile_pattern(pattern: str) -> Tuple[bool, str]:
+    """
+    Regex source for one rule pattern, and whether it must start a word.
+    
+    Words match whole words only ("hi" does not match "this"), spaces match
+    any whitespace, a leading '^' anchors to the start of the message and a
+    trailing '*' allows any word ending ("thank*" matches "thanks").
+    """
+    anchored = pattern.startswith('^')
+    if anchored:
+        pattern = pattern[1:]
+    prefix = pattern.endswith('*')
+    if prefix:
+        pattern = pattern[:-1]
+    
+    words = pattern.split()
+    if not words:
+        raise ValueError("Empty intent pattern")
+    
+    body = r'\s+'.join(re.escape(word) for word in words)
+    if prefix:
+        body += r'\w*'
+    elif re.match(r'\w', words[-1][-1]):
+        body += r'(?!\w)'
+    if anchored:
+        return False, r'^\s*' + body
+    return bool(re.match(r'\w', words[0][0])), body
+
+
+def combine_patterns(named_patterns: List[Tuple[str, str]]) -> str:
+    r"""
+    One alternation with a named group per pattern.
+    
+    Word-start patterns share a single (?<!\w) check, so positions inside
+    words are rejected once instead of once per pattern.
+    """
+    word_start = []
+    other = []
+    for name, pattern in named_patterns:
+        starts_word, body = compile_pattern(pattern)
+        (word_start if starts_word else other).append(f"(?P<{name}>{body})")
+    
+    branches = []
+    if word_start:
+        branches.append(r'(?<!\w)(?:' + '|'.join(word_start) + ')')
+    branches.extend(other)
+    return '|'.join(branches)
+
+
+class IntentEngine:
+    """
+    Precompiled intent and mention matcher.
+    
+    All intent patterns are combined into one case-insensitive regex with a
+    named group per pattern, ordered by rule priority. The alternation sits
+    inside a lookahead so a single finditer pass reports a match at every
+    position, and at each position the highest-priority rule wins.
+    """
+    
+    def __init__(self, rules: List[Dict], mention_patterns: List[str]):
+        self.rules = sorted(rules, key=lambda rule: -rule.get('priority', 0))
+        self.top_priority = self.rules[0].get('priority', 0) if self.rules else 0
+        
+        intent_patterns = [
+            (f"i{index}_{number}", pattern)
+            for index, rule in enumerate(self.rules)
+            for number, pattern in enumerate(rule['patterns'])
+        ]
+        self.intent_regex = (
+            re.compile(f"(?=(?:{combine_patterns(intent_patterns)}))", re.IGNORECASE)
+            if intent_patterns else None
+        )
+        
+        mention_patterns = [(f"m{number}", pattern) for number, pattern in enumerate(mention_patterns)]
+        self.mention_regex = re.compile(combine_patterns(mention_patterns), re.IGNORECASE) if mention_patterns else None
+    
+    def mentioned(self, text: str) -> bool:
+        return bool(self.mention_regex and self.mention_regex.search(text))
+    
+    def classify(self, text: str) -> Optional[Dict]:
+        """Highest-priority rule matching the text, if any"""
+        if self.intent_regex is None:
+            return None
+        
+        best = None
+        for match in self.intent_regex.finditer(text):
+            rule = self.rules[int(match.lastgroup[1:].split('_')[0])]
+            if best is None or rule.get('priority', 0) > best.get('priority', 0):
+                best = rule
+                if rule.get('priority', 0) >= self.top_priority:
+                    break
+        return best
+
+
+def load_intent_rules(path: str) -> List[Dict]:
+    """
+    DEFAULT_INTENTS merged with an optional rule file.
+    
+    File rules replace built-in rules of the same name and add new ones;
+    "replace_defaults": true drops the built-in rules entirely.
+    """
+    if not path:
+        return list(DEFAULT_INTENTS)
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    rules = {} if data.get('replace_defaults') else {rule['name']: rule for rule in DEFAULT_INTENTS}
+    for rule in data.get('intents', []):
+        if not rule.get('name') or not rule.get('patterns') or not rule.get('responses'):
+            raise ValueError(f"Intent rules need a name, patterns and responses: {rule}")
+        rules[rule['name']] = rule
+    return list(rules.values())
+
+
+def config_list(value) -> List[str]:
+    """A list setting given as a JSON list or a comma-separated string"""
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return list(value or [])
+
+
+def mention_patterns_for(config: Dict) -> List[str]:
+    """A bot's handle (with or without @), configured aliases and the default patterns"""
+    return [config['bot_handle']] + config_list(config.get('mention_aliases')) + DEFAULT_MENTION_PATTERNS
+
+
+class ReplyBudget:
+    """
+    Accumulates LLM output and tracks complete sentences.
+    
+    Streaming generation feeds tokens in as they arrive and stops as soon as
+    the sentence or character budget is used up. A sentence ends at '.', '!'
+    or '?' followed by whitespace, so "3.14" or a half-streamed "..." is not
+    counted early.
+    """
+    
+    SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s)')
+    
+    def __init__(self, max_chars: int, max_sentences: int):
+        self.max_chars = max_chars
+        self.max_sentences = max_sentences
+        self.text = ''
+        self.sentence_ends: List[int] = []
+        self._scan_from = 0
+    
+    def feed(self, chunk: str) -> bool:
+        """Add generated text; True once the budget is used up"""
+        self.text += chunk
+        for match in self.SENTENCE_END.finditer(self.text, self._scan_from):
+            self.sentence_ends.append(match.end())
+            self._scan_from = match.end()
+        return self.exhausted
+    
+    @property
+    def exhausted(self) -> bool:
+        if self.max_sentences > 0 and len(self.sentence_ends) >= self.max_sentences:
+            return True
+        return self.max_chars > 0 and len(self.text) >= self.max_chars
+    
+    def first_sentence(self) -> Optional[str]:
+        """First complete sentence, once one exists"""
+        if not self.sentence_ends:
+            return None
+        return self.text[:self.sentence_ends[0]].strip() or None
+    
+    def result(self) -> str:
+        """Text cut to the budget, at a sentence (or else word) boundary"""
+        text = self.text
+        if self.max_sentences > 0 and len(self.sentence_ends) >= self.max_sentences:
+            text = text[:self.sentence_ends[self.max_sentences - 1]]
+        if self.max_chars > 0 and len(text) > self.max_chars:
+            ends = [end for end in self.sentence_ends if end <= self.max_chars]
+            if ends:
+                text = text[:ends[-1]]
+            else:
+                cut = text.rfind(' ', 0, self.max_chars)
+                text = text[:cut if cut > 0 else self.max_chars].rstrip() + '...'
+        return text.strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+class ContextStore:
+    """
+    Bounded-memory conversation history for many rooms.
+    
+    Each room keeps a fixed-size ring buffer (deque) of its latest messages.
+    Rooms are kept in LRU order of activity; when the room count or the
+    total stored text exceeds its cap, the idlest rooms are dropped whole.
+    Memory therefore stays flat however many rooms a bot passes through.
+    """
+    
+    # Approximate per-message bookkeeping overhead in bytes
+    ENTRY_OVERHEAD = 100
+    
+    def __init__(self, messages_per_room: int, max_rooms: int, max_bytes: int):
+        self.messages_per_room = max(messages_per_room, 1)
+        self.max_rooms = max(max_rooms, 1)
+        self.max_bytes = max_bytes
+        self.rooms: OrderedDict = OrderedDict()  # room_id -> deque of (seq, sender, text, size)
+        self.room_bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.seq = 0
+        self.stats = {'recorded': 0, 'rooms_evicted': 0}
+    
+    def record(self, room_id: str, sender: str, text: str) -> int:
+        """Remember a message; returns its sequence number"""
+        self.seq += 1
+        size = len(text) + len(sender) + self.ENTRY_OVERHEAD
+        
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            buffer = deque(maxlen=self.messages_per_room)
+            self.rooms[room_id] = buffer
+            self.room_bytes[room_id] = 0
+        else:
+            self.rooms.move_to_end(room_id)
+        
+        if len(buffer) == buffer.maxlen:
+            self._account(room_id, -buffer[0][3])
+        buffer.append((self.seq, sender, text, size))
+        self._account(room_id, size)
+        self.stats['recorded'] += 1
+        
+        self._evict(keep=room_id)
+        return self.seq
+    
+    def _account(self, room_id: str, delta: int):
+        self.room_bytes[room_id] += delta
+        self.total_bytes += delta
+    
+    def _evict(self, keep: str):
+        """Drop the least recently active rooms until under both caps"""
+        while len(self.rooms) > self.max_rooms or (self.max_bytes > 0 and self.total_bytes > self.max_bytes):
+            room_id = next(iter(self.rooms))
+            if room_id == keep:
+                # Only the active room is left; shrink it instead
+                buffer = self.rooms[room_id]
+                if len(buffer) <= 1:
+                    break
+                self._account(room_id, -buffer.popleft()[3])
+                continue
+            del self.rooms[room_id]
+            self.total_bytes -= self.room_bytes.pop(room_id)
+            self.stats['rooms_evicted'] += 1
+    
+    def recent(self, room_id: str, before_seq: Optional[int], token_budget: int) -> List[Tuple[str, str]]:
+        """
+        (sender, text) pairs preceding before_seq, oldest first, that fit the
+        token budget; the newest messages are kept when the budget runs out.
+        """
+        buffer = self.rooms.get(room_id)
+        if not buffer or token_budget <= 0:
+            return []
+        self.rooms.move_to_end(room_id)
+        
+        selected = []
+        used = 0
+        for seq, sender, text, _ in reversed(buffer):
+            if before_seq is not None and seq >= before_seq:
+                continue
+            cost = estimate_tokens(text) + estimate_tokens(sender)
+            if used + cost > token_budget:
+                break
+            selected.append((sender, text))
+            used += cost
+        selected.reverse()
+        return selected
+    
+    def summary(self) -> Dict:
+        return dict(self.stats, rooms=len(self.rooms), bytes=self.total_bytes)
+
+
+def create_context_store(config: Dict) -> ContextStore:
+    return ContextStore(
+        messages_per_room=config['context_messages'],
+        max_rooms=config['context_max_rooms'],
+        max_bytes=config['context_max_bytes'],
+    )
+
+
+def decode_cipher_blob(cipher_blob: str) -> str:
+    """Message text from a cipher_blob (PHP uses: base64_encode(rawurlencode($message)))"""
+    return unquote(base64.b64decode(cipher_blob).decode('utf-8'))
+
+
+def message_id_of(message: Dict) -> Optional[int]:
+    """Numeric temp_outbox ID (file-queued messages have none)"""
+    try:
+        return int(message.get('id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def message_age(message: Dict) -> float:
+    """
+    Seconds since a message was queued.
+    
+    The WebSocket server sends ISO timestamps (UTC) and the PHP API sends
+    'Y-m-d H:i:s' in server local time. Unknown ages count as infinitely
+    old, so any room deadline drops them (they still reach the context).
+    """
+    queued_at = str(message.get('queued_at') or '')
+    try:
+        if 'T' in queued_at:
+            queued = datetime.fromisoformat(queued_at.replace('Z', '+00:00')).timestamp()
+        else:
+            queued = time.mktime(time.strptime(queued_at[:19], '%Y-%m-%d %H:%M:%S'))
+    except (ValueError, OverflowError):
+        return float('inf')
+    return max(time.time() - queued, 0.0)
+
+
+class InferenceScheduler:
+    """
+    Global admission control for model calls.
+    
+    Each inference backend gets a fixed number of concurrent slots; callers
+    beyond that wait in one bounded FIFO. When the wait queue is full the
+    oldest waiter is shed, since it is the least likely to still matter.
+    Deadline checks and prompt coalescing happen in the callers (see
+    ChatBot.process_batch); their counts are reported here as well.
+    """
+    
+    def __init__(self, limits: Dict[str, int], max_waiting: int):
+        self.limits = {backend: max(limit, 1) for backend, limit in limits.items()}
+        self.max_waiting = max(max_waiting, 0)
+        self.active = {backend: 0 for backend in self.limits}
+        self.waiting: deque = deque()  # (backend, future)
+        self.stats = {'admitted': 0, 'shed': 0, 'expired': 0, 'coalesced': 0}
+    
+    async def acquire(self, backend: str) -> bool:
+        """Wait for a slot; False if the request was shed instead"""
+        if self.active[backend] < self.limits[backend] and not any(b == backend for b, _ in self.waiting):
+            self.active[backend] += 1
+            self.stats['admitted'] += 1
+            return True
+        
+        if len(self.waiting) >= self.max_waiting:
+            self._drop_cancelled()
+        if len(self.waiting) >= self.max_waiting:
+            if not self.waiting:
+                self.stats['shed'] += 1
+                return False
+            _, oldest = self.waiting.popleft()
+            if not oldest.done():
+                oldest.set_result(False)
+            self.stats['shed'] += 1
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (backend, future)
+        self.waiting.append(entry)
+        try:
+            admitted = await future
+        except asyncio.CancelledError:
+            if entry in self.waiting:
+                self.waiting.remove(entry)
+            elif future.done() and not future.cancelled() and future.result():
+                # Slot was handed over just as we were cancelled
+                self.release(backend)
+            raise
+        if admitted:
+            self.stats['admitted'] += 1
+        return admitted
+    
+    def release(self, backend: str):
+        """Hand the slot to the next waiter for the same backend, or free it"""
+        self._drop_cancelled()
+        for entry in self.waiting:
+            if entry[0] == backend:
+                self.waiting.remove(entry)
+                if not entry[1].done():
+                    entry[1].set_result(True)
+                return
+        self.active[backend] -= 1
+    
+    def _drop_cancelled(self):
+        """Forget waiters cancelled (e.g. past their deadline) before they could clean up"""
+        if any(future.done() for _, future in self.waiting):
+            self.waiting = deque(entry for entry in self.waiting if not entry[1].done())
+    
+    def summary(self) -> Dict:
+        return dict(self.stats, active=dict(self.active), waiting=len(self.waiting))
+
+
+def create_inference_scheduler(config: Dict) -> InferenceScheduler:
+    return InferenceScheduler(
+        limits={'ollama': config['ollama_concurrency'], 'openai': config['openai_concurrency']},
+        max_waiting=config['inference_queue_size'],
+    )
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of LLM replies with an optional SQLite tier.
+    
+    Keys are a hash of the normalized prompt and a context fingerprint
+    (persona, provider, model and, unless the intent is context-free, the
+    room history sent with the prompt). Any new message in a room changes
+    its history, so context-dependent prompts rarely hit; context-free
+    intents (greetings, thanks, ...) are answered once per TTL. The memory
+    tier is an OrderedDict in LRU order; the disk tier survives restarts
+    and is pruned on write.
+    Disk access runs in a worker thread so it never blocks the event loop.
+    """
+    
+    # Prune the disk tier every N stores
+    DISK_PRUNE_EVERY = 100
+    
+    def __init__(self, max_entries: int, ttl: float, path: str = '', disk_max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self.entries: OrderedDict = OrderedDict()  # key -> (expires_at, response)
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._stores_since_prune = 0
+        
+        if path and self.enabled:
+            self._open_db()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+    
+    def _open_db(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"Response cache persisted to {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Response cache disk tier disabled: {e}")
+            self._db = None
+    
+    @staticmethod
+    def normalize(prompt: str, bot_handle: str = '') -> str:
+        """Lowercase, drop mentions of the bot and punctuation (except '?'), collapse whitespace"""
+        text = prompt.lower()
+        if bot_handle:
+            text = re.sub(r'@?\b' + re.escape(bot_handle.lower()) + r'\b', ' ', text)
+        text = re.sub(r"[^\w\s?']", ' ', text)
+        return ' '.join(text.split())
+    
+    @staticmethod
+    def make_key(normalized_prompt: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\x00{normalized_prompt}".encode('utf-8')).hexdigest()
+    
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            del self.entries[key]
+            self.stats['expired'] += 1
+        
+        if self._db is not None:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(key, row[0], row[1])
+                return row[1]
+        
+        self.stats['misses'] += 1
+        return None
+    
+    async def put(self, key: str, response: str):
+        if not self.enabled:
+            return
+        
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, expires_at, response)
+        self.stats['stores'] += 1
+        
+        if self._db is not None:
+            self._stores_since_prune += 1
+            prune = self._stores_since_prune >= self.DISK_PRUNE_EVERY
+            if prune:
+                self._stores_since_prune = 0
+            await asyncio.to_thread(self._disk_put, key, response, expires_at, now, prune)
+    
+    def _remember(self, key: str, expires_at: float, response: str):
+        self.entries[key] = (expires_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def _disk_get(self, key: str, now: float):
+        with self._db_lock:
+            try:
+                return self._db.execute(
+                    "SELECT expires_at, response FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache read failed: {e}")
+                return None
+    
+    def _disk_put(self, key: str, response: str, expires_at: float, now: float, prune: bool):
+        with self._db_lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+                    (key, response, expires_at, now)
+                )
+                if prune:
+                    self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                    self._db.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,)
+                    )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache write failed: {e}")
+    
+    def summary(self) -> Dict:
+        lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] + self.stats['disk_hits']) / lookups if lookups else 0.0
+        return dict(self.stats, entries=len(self.entries), hit_rate=round(hit_rate, 3))
+    
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def create_response_cache(config: Dict) -> ResponseCache:
+    return ResponseCache(
+        max_entries=config['cache_max_entries'],
+        ttl=config['cache_ttl'],
+        path=config['cache_path'],
+        disk_max_entries=config['cache_disk_max_entries'],
+    )
+
+
 class ChatBot:
     """Simple AI Chatbot for Sentinel Chat Platform"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, http_client: Optional[httpx.AsyncClient] = None,
+                 response_cache: Optional[ResponseCache] = None, context_store: Optional[ContextStore] = None,
+                 scheduler: Optional[InferenceScheduler] = None):
         self.config = config
         self.bot_handle = config['bot_handle']
-        self.ws_url = f"ws://{config['ws_host']}:{config['ws_port']}"
         self.api_base = config['api_base_url']
         self.api_secret = config['api_secret']
         self.default_room = config['default_room']
-        self.ws = None
-        self.connected = False
-        self.current_room = config['default_room']
-        self.conversation_history = {}  # room_id -> list of recent messages
+        self.rooms = list(config.get('rooms') or [config['default_room']])
+        self.context_store = context_store if context_store is not None else create_context_store(config)
+        self.intents = IntentEngine(load_intent_rules(config.get('intents_file', '')), mention_patterns_for(config))
+        self.context_free_intents = set(config_list(config.get('cache_context_free_intents')))
+        
+        # Senders never answered; a host adds every persona it runs so bots
+        # don't reply to each other in a loop
+        self.ignored_handles = {self.bot_handle}
+        
+        # Concurrent pipeline: one queue and worker task per active room,
+        # model calls admitted by a scheduler shared across the host
+        self.http = http_client
+        self.owns_http = http_client is None
+        self.response_cache = response_cache if response_cache is not None else create_response_cache(config)
+        self.owns_cache = response_cache is None
+        self.openai_client = None
+        self.room_queues: Dict[str, asyncio.Queue] = {}
+        self.room_workers: Dict[str, asyncio.Task] = {}
+        self.scheduler = scheduler if scheduler is not None else create_inference_scheduler(config)
+        self.stats = {'received': 0, 'dropped': 0, 'coalesced': 0, 'expired': 0, 'shed': 0, 'responded': 0, 'failed': 0}
+        self.closing = False
+    
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared, connection-pooled client for API and Ollama calls"""
+        if self.http is None or self.http.is_closed:
+            self.http = create_http_client(self.config)
+            self.owns_http = True
+        return self.http
+    
+    async def close(self):
+        """Stop room workers and close pooled connections"""
+        self.closing = True
+        workers = list(self.room_workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.room_workers.clear()
+        self.room_queues.clear()
         
+        if self.http is not None and self.owns_http:
+            await self.http.aclose()
+        self.http = None
+        if self.openai_client is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+        if self.owns_cache:
+            self.response_cache.close()
+    
     async def ensure_bot_user_exists(self) -> bool:
         """Ensure the bot user exists in the database"""
         try:
@@ -121,36 +833,10 @@ class ChatBot:
             logger.error(f"Error checking bot user: {e}")
             return False
     
-    async def connect_websocket(self) -> bool:
-        """Connect to WebSocket server"""
-        try:
-            # Build WebSocket URL with authentication
-            ws_url = f"{self.ws_url}?user_handle={quote(self.bot_handle)}&api_secret={quote(self.api_secret)}&room_id={quote(self.current_room)}"
-            
-            logger.info(f"Connecting to WebSocket server: {self.ws_url}")
-            logger.info(f"Bot handle: {self.bot_handle}, Room: {self.current_room}")
-            
-            self.ws = await websockets.connect(ws_url)
-            self.connected = True
-            logger.info("WebSocket connected successfully!")
-            
-            # Send initial presence update
-            await self.ws.send(json.dumps({
-                'type': 'presence_update',
-                'status': 'online'
-            }))
-            
-            return True
-        except Exception as e:
-            logger.error(f"Failed to connect to WebSocket: {e}")
-            return False
-    
     async def send_message(self, room_id: str, message_text: str) -> bool:
         """Send a message via the PHP API"""
         try:
             # Encode message (base64 of rawurlencoded text - matches PHP's encoding)
-            import base64
-            from urllib.parse import quote
             # PHP uses: base64_encode(rawurlencode($message))
             urlencoded = quote(message_text, safe='')
             encoded_message = base64.b64encode(urlencoded.encode('utf-8')).decode('utf-8')
@@ -170,11 +856,11 @@ class ChatBot:
                 'X-API-SECRET': self.api_secret
             }
             
-            response = requests.post(
+            response = await self.get_http_client().post(
                 api_url,
                 json=message_data,
                 headers=headers,
-                timeout=10
+                timeout=API_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -188,141 +874,343 @@ class ChatBot:
             else:
                 logger.error(f"API request failed with status {response.status_code}: {response.text}")
                 return False
-                
+        
         except Exception as e:
             logger.error(f"Error sending message: {e}")
             return False
     
-    def generate_response(self, message_text: str, room_id: str) -> Optional[str]:
-        """Generate a response to a message using the configured AI provider"""
-        message_lower = message_text.lower().strip()
-        
-        # Add to conversation history
-        if room_id not in self.conversation_history:
-            self.conversation_history[room_id] = []
-        self.conversation_history[room_id].append({
-            'text': message_text,
-            'timestamp': time.time()
-        })
-        
-        # Keep only last 10 messages per room
-        if len(self.conversation_history[room_id]) > 10:
-            self.conversation_history[room_id] = self.conversation_history[room_id][-10:]
-        
-        # Check if message is directed at the bot
-        bot_mentioned = (
-            self.bot_handle.lower() in message_lower or
-            '@' + self.bot_handle.lower() in message_lower or
-            message_lower.startswith('bot') or
-            message_lower.startswith('hey bot') or
-            message_lower.startswith('hi bot')
+    def should_respond(self, message_text: str) -> bool:
+        """Answer mentions; otherwise only respond occasionally (10% chance) to keep conversation natural"""
+        return self.intents.mentioned(message_text) or random.random() <= 0.1
+    
+    def inference_backend(self) -> Optional[str]:
+        """Scheduler backend for the configured AI provider (None for rule-based replies)"""
+        if self.config['ai_provider'] == 'openai' and self.config['openai_api_key']:
+            return 'openai'
+        if self.config['ai_provider'] == 'ollama':
+            return 'ollama'
+        return None
+    
+    async def generate_response(self, message_text: str, room_id: str,
+                                on_first_sentence: Optional[Callable[[str], None]] = None,
+                                context_seq: Optional[int] = None,
+                                deadline_at: Optional[float] = None) -> Optional[str]:
+        """
+        Generate a response to a message using the configured AI provider.
+        
+        When streaming, on_first_sentence is called with the first complete
+        sentence as soon as it is generated; the full reply is still returned.
+        Room history recorded before context_seq is passed to the model.
+        Returns None without calling the model if the scheduler sheds the
+        request or deadline_at (monotonic) passes while it waits for a slot.
+        """
+        # Generate response based on AI provider
+        backend = self.inference_backend()
+        if backend == 'openai':
+            generate = self._generate_openai_response
+            model = self.config['openai_model']
+        elif backend == 'ollama':
+            generate = self._generate_ollama_response
+            model = self.config['ollama_model']
+        else:
+            return self._generate_simple_response(message_text, room_id)
+        
+        # Recent room history that fits the token budget
+        context = self.context_store.recent(room_id, context_seq, self.config['context_token_budget'])
+        
+        # LLM replies are cached; repeated prompts skip the model call
+        cache_key = ResponseCache.make_key(
+            ResponseCache.normalize(message_text, self.bot_handle),
+            self.context_fingerprint(model, [] if self.is_context_free(message_text) else context),
         )
+        cached = await self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # If not mentioned, only respond occasionally (10% chance) to keep conversation natural
-        if not bot_mentioned:
-            import random
-            if random.random() > 0.1:  # 90% chance to ignore
+        # Model calls wait for a scheduler slot and are dropped if they go stale meanwhile
+        if not await self.scheduler.acquire(backend):
+            self.stats['shed'] += 1
+            logger.warning(f"Inference queue full, shed request for {room_id}")
+            return None
+        try:
+            if deadline_at is not None and time.monotonic() > deadline_at:
+                self.stats['expired'] += 1
+                self.scheduler.stats['expired'] += 1
+                logger.warning(f"Request for {room_id} expired while waiting for the model")
                 return None
+            response_text = await generate(message_text, context, self.new_budget(), on_first_sentence)
+        finally:
+            self.scheduler.release(backend)
         
-        # Generate response based on AI provider
-        if self.config['ai_provider'] == 'openai' and self.config['openai_api_key']:
-            return self._generate_openai_response(message_text, room_id)
-        elif self.config['ai_provider'] == 'ollama':
-            return self._generate_ollama_response(message_text, room_id)
-        else:
+        if not response_text:
+            # Fallback to simple response (not cached, so the model is retried next time)
             return self._generate_simple_response(message_text, room_id)
+        
+        await self.response_cache.put(cache_key, response_text)
+        return response_text
+    
+    def new_budget(self) -> ReplyBudget:
+        return ReplyBudget(self.config['max_response_chars'], self.config['max_response_sentences'])
+    
+    def is_context_free(self, message_text: str) -> bool:
+        """Whether a cached reply to this prompt may be reused regardless of room history"""
+        if not self.context_free_intents:
+            return False
+        intent = self.intents.classify(message_text)
+        return intent is not None and intent['name'] in self.context_free_intents
+    
+    def context_fingerprint(self, model: str, context: List[Tuple[str, str]]) -> str:
+        """Everything besides the prompt that shapes an LLM reply"""
+        history = hashlib.sha256(
+            "\n".join(f"{sender}\x00{text}" for sender, text in context).encode('utf-8')
+        ).hexdigest()[:16] if context else ''
+        return f"{self.config['ai_provider']}|{model}|{self.bot_handle}|{history}"
     
     def _generate_simple_response(self, message_text: str, room_id: str) -> str:
         """Simple rule-based response generation"""
-        message_lower = message_text.lower().strip()
-        
-        # Greetings
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'greetings']):
-            import random
-            return random.choice(BOT_RESPONSES['greetings'])
-        
-        # Questions
-        if '?' in message_text:
-            import random
-            base = random.choice(BOT_RESPONSES['questions'])
-            # Try to answer simple questions
-            if 'how are you' in message_lower:
-                return "I'm doing great, thanks for asking! How are you?"
-            elif 'what' in message_lower and 'your name' in message_lower:
-                return f"I'm {self.bot_handle}! Nice to meet you!"
-            elif 'who are you' in message_lower:
-                return f"I'm {self.bot_handle}, a friendly AI chatbot here to chat with you!"
-            else:
-                return base
-        
-        # Goodbye
-        if any(word in message_lower for word in ['bye', 'goodbye', 'see you', 'farewell']):
-            import random
-            return random.choice(BOT_RESPONSES['goodbye'])
-        
-        # Thanks
-        if any(word in message_lower for word in ['thank', 'thanks', 'thx']):
-            import random
-            return random.choice(BOT_RESPONSES['thanks'])
-        
-        # Default response
-        import random
-        return random.choice(BOT_RESPONSES['default'])
+        intent = self.intents.classify(message_text)
+        if intent is None:
+            return random.choice(BOT_RESPONSES['default'])
+        return random.choice(intent['responses']).replace('{bot_handle}', self.bot_handle)
     
-    def _generate_openai_response(self, message_text: str, room_id: str) -> Optional[str]:
+    async def _generate_openai_response(self, message_text: str, context: List[Tuple[str, str]], budget: ReplyBudget,
+                                        on_first_sentence: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """Generate response using OpenAI API"""
         try:
-            import openai
-            openai.api_key = self.config['openai_api_key']
+            if self.openai_client is None:
+                import openai
+                self.openai_client = openai.AsyncOpenAI(api_key=self.config['openai_api_key'])
             
-            # Get recent conversation context
-            context = ""
-            if room_id in self.conversation_history:
-                recent = self.conversation_history[room_id][-5:]  # Last 5 messages
-                context = "\n".join([f"User: {msg['text']}" for msg in recent])
+            # Room history: own replies as assistant turns, everyone else as named user turns
+            messages = [
+                {"role": "system", "content": f"You are {self.bot_handle}, a friendly and helpful chatbot in a chat room. Keep responses concise and conversational."}
+            ]
+            for sender, text in context:
+                if sender == self.bot_handle:
+                    messages.append({"role": "assistant", "content": text})
+                else:
+                    messages.append({"role": "user", "content": f"{sender}: {text}"})
+            messages.append({"role": "user", "content": message_text})
             
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are {self.bot_handle}, a friendly and helpful chatbot in a chat room. Keep responses concise and conversational."},
-                    {"role": "user", "content": message_text}
-                ],
+            request = dict(
+                model=self.config['openai_model'],
+                messages=messages,
                 max_tokens=150,
                 temperature=0.7
             )
             
-            return response.choices[0].message.content.strip()
+            if not self.config['stream_responses']:
+                response = await self.openai_client.chat.completions.create(**request)
+                budget.feed(response.choices[0].message.content or '')
+                return budget.result()
+            
+            stream = await self.openai_client.chat.completions.create(stream=True, **request)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if self.consume_token(budget, chunk.choices[0].delta.content, on_first_sentence):
+                            break
+            except Exception as e:
+                logger.error(f"OpenAI stream interrupted: {e}")
+            finally:
+                # Closing the stream early cancels the rest of the generation
+                await stream.close()
+            return budget.result() or None
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            # Fallback to simple response
-            return self._generate_simple_response(message_text, room_id)
+            return None
     
-    def _generate_ollama_response(self, message_text: str, room_id: str) -> Optional[str]:
+    async def _generate_ollama_response(self, message_text: str, context: List[Tuple[str, str]], budget: ReplyBudget,
+                                        on_first_sentence: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """Generate response using Ollama (local LLM)"""
         try:
             ollama_url = f"{self.config['ollama_url']}/api/generate"
-            response = requests.post(
-                ollama_url,
-                json={
-                    'model': self.config['ollama_model'],
-                    'prompt': f"You are {self.bot_handle}, a friendly chatbot. Respond to: {message_text}",
-                    'stream': False
-                },
-                timeout=30
+            prompt = f"You are {self.bot_handle}, a friendly chatbot."
+            if context:
+                transcript = "\n".join(f"{sender}: {text}" for sender, text in context)
+                prompt += f" Recent conversation:\n{transcript}\n"
+            request = {
+                'model': self.config['ollama_model'],
+                'prompt': f"{prompt} Respond to: {message_text}",
+                'stream': self.config['stream_responses']
+            }
+            
+            if not self.config['stream_responses']:
+                response = await self.get_http_client().post(ollama_url, json=request, timeout=OLLAMA_TIMEOUT)
+                if response.status_code == 200:
+                    budget.feed(response.json().get('response', ''))
+                    return budget.result()
+                else:
+                    logger.error(f"Ollama API error: {response.status_code}")
+                    return None
+            
+            # Streamed as one JSON object per line; leaving the block closes the
+            # connection, which makes Ollama stop generating
+            async with self.get_http_client().stream('POST', ollama_url, json=request, timeout=OLLAMA_TIMEOUT) as response:
+                if response.status_code != 200:
+                    logger.error(f"Ollama API error: {response.status_code}")
+                    return None
+                try:
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if self.consume_token(budget, chunk.get('response', ''), on_first_sentence):
+                            break
+                        if chunk.get('done'):
+                            break
+                except Exception as e:
+                    logger.error(f"Ollama stream interrupted: {e}")
+            return budget.result() or None
+        except Exception as e:
+            logger.error(f"Ollama API error: {e}")
+            return None
+    
+    @staticmethod
+    def consume_token(budget: ReplyBudget, token: str, on_first_sentence: Optional[Callable[[str], None]]) -> bool:
+        """Feed one streamed token; report the first sentence once; True when the budget is used up"""
+        had_sentence = bool(budget.sentence_ends)
+        exhausted = budget.feed(token)
+        if on_first_sentence and not had_sentence and budget.sentence_ends and not exhausted:
+            on_first_sentence(budget.first_sentence())
+        return exhausted
+    
+    def enqueue_message(self, room_id: str, sender_handle: str, message_text: str,
+                        context_seq: Optional[int] = None, received_at: Optional[float] = None) -> None:
+        """
+        Queue a message for its room without blocking intake.
+        
+        A full room queue drops its oldest pending message, since the newest
+        one is the most relevant to answer.
+        """
+        queue = self.room_queues.get(room_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=max(self.config['room_queue_size'], 1))
+            self.room_queues[room_id] = queue
+        
+        if queue.full():
+            queue.get_nowait()
+            self.stats['dropped'] += 1
+            logger.warning(f"Room {room_id} queue full, dropped oldest pending message")
+        if received_at is None:
+            received_at = time.monotonic()
+        queue.put_nowait((received_at, sender_handle, message_text, context_seq))
+        
+        if room_id not in self.room_workers:
+            self.room_workers[room_id] = asyncio.create_task(self.room_worker(room_id))
+    
+    async def room_worker(self, room_id: str):
+        """
+        Process one room's messages in order; exits after a quiet period.
+        
+        Everything that queued up while the previous reply was generated is
+        taken as one batch and answered with a single model call.
+        """
+        queue = self.room_queues[room_id]
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), timeout=ROOM_WORKER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                batch = [first]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                await self.process_batch(room_id, batch)
+        finally:
+            # No await between the last get() and here, so nothing can be
+            # queued for this room without a worker
+            self.room_workers.pop(room_id, None)
+            if queue.empty():
+                self.room_queues.pop(room_id, None)
+            elif not self.closing:
+                self.room_workers[room_id] = asyncio.create_task(self.room_worker(room_id))
+    
+    def room_deadline(self, room_id: str) -> float:
+        return float(self.config.get('room_deadlines', {}).get(room_id, self.config['inference_deadline']))
+    
+    async def process_batch(self, room_id: str, batch: List[Tuple[float, str, str, Optional[int]]]):
+        """Drop stale messages, coalesce the rest into one prompt, then generate and send"""
+        deadline = self.room_deadline(room_id)
+        now = time.monotonic()
+        fresh = [item for item in batch if deadline <= 0 or now - item[0] <= deadline]
+        if len(fresh) < len(batch):
+            expired = len(batch) - len(fresh)
+            self.stats['expired'] += expired
+            self.scheduler.stats['expired'] += expired
+            logger.warning(f"Dropped {expired} stale message(s) in {room_id}")
+        if not fresh:
+            return
+        
+        received_at, sender_handle, message_text, context_seq = fresh[0]
+        if len(fresh) > 1:
+            # One reply for the whole burst; history before the burst is the context
+            self.stats['coalesced'] += len(fresh) - 1
+            self.scheduler.stats['coalesced'] += len(fresh) - 1
+            message_text = "\n".join(f"{sender}: {text}" for _, sender, text, _ in fresh)
+            logger.info(f"Coalesced {len(fresh)} messages in {room_id} into one prompt")
+        
+        # The newest message decides when the reply stops being worth sending
+        deadline_at = fresh[-1][0] + deadline if deadline > 0 else None
+        await self.process_message(room_id, message_text, received_at, context_seq, deadline_at)
+    
+    async def process_message(self, room_id: str, message_text: str, received_at: float,
+                              context_seq: Optional[int] = None, deadline_at: Optional[float] = None):
+        """Generate and send a response for one queued message"""
+        early_send = None  # (send task, sentence)
+        
+        def send_first_sentence(sentence: str):
+            nonlocal early_send
+            early_send = (asyncio.create_task(self.send_reply(room_id, sentence, received_at)), sentence)
+        
+        try:
+            response_text = await self.generate_response(
+                message_text, room_id,
+                send_first_sentence if self.config['early_first_sentence'] else None,
+                context_seq, deadline_at
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
+            # The first sentence went out early; follow up with the rest
+            if early_send is not None:
+                task, sentence = early_send
+                if await task:
+                    self.stats['responded'] += 1
+                    if response_text and response_text.startswith(sentence):
+                        response_text = response_text[len(sentence):].strip()
+            
+            if not response_text:
+                return
+            
+            if await self.send_reply(room_id, response_text, received_at):
+                self.stats['responded'] += 1
             else:
-                logger.error(f"Ollama API error: {response.status_code}")
-                return self._generate_simple_response(message_text, room_id)
+                self.stats['failed'] += 1
+        except asyncio.CancelledError:
+            if early_send is not None:
+                early_send[0].cancel()
+            raise
         except Exception as e:
-            logger.error(f"Ollama API error: {e}")
-            return self._generate_simple_response(message_text, room_id)
+            self.stats['failed'] += 1
+            logger.error(f"Error responding in {room_id}: {e}")
+    
+    async def send_reply(self, room_id: str, text: str, received_at: float) -> bool:
+        """Send a reply once response_delay has passed since the message arrived"""
+        # Wait a bit before responding (more natural); generation time counts towards the delay
+        remaining = self.config['response_delay'] - (time.monotonic() - received_at)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return await self.send_message(room_id, text)
     
-    async def handle_message(self, message_data: Dict):
-        """Handle incoming WebSocket message"""
+    async def handle_message(self, message_data: Dict, context_seq: Optional[int] = None,
+                             received_at: Optional[float] = None):
+        """
+        Handle incoming WebSocket message.
+        
+        context_seq is the message's position in the shared context store when
+        the caller already recorded it; otherwise it is recorded here.
+        received_at (monotonic) backdates messages fetched during catch-up so
+        room deadlines apply to their real age.
+        """
         try:
             message_type = message_data.get('type')
             
@@ -330,72 +1218,166 @@ class ChatBot:
                 message = message_data.get('message', {})
                 room_id = message.get('room_id')
                 sender_handle = message.get('sender_handle')
-                cipher_blob = message.get('cipher_blob')
-                
-                # Don't respond to own messages
-                if sender_handle == self.bot_handle:
-                    return
                 
-                # Decode message (PHP uses: base64_encode(rawurlencode($message)))
+                # Decode message
                 try:
-                    import base64
-                    from urllib.parse import unquote
-                    decoded_b64 = base64.b64decode(cipher_blob).decode('utf-8')
-                    message_text = unquote(decoded_b64)
+                    message_text = decode_cipher_blob(message.get('cipher_blob'))
                 except Exception as e:
                     logger.error(f"Error decoding message: {e}")
                     return
                 
+                # Every message (own replies included) becomes room context
+                if context_seq is None:
+                    context_seq = self.context_store.record(room_id, sender_handle, message_text)
+                
+                # Don't respond to own (or fellow personas') messages
+                if sender_handle in self.ignored_handles:
+                    return
+                
                 logger.info(f"Received message in {room_id} from {sender_handle}: {message_text[:50]}...")
+                self.stats['received'] += 1
                 
-                # Generate response
-                response_text = self.generate_response(message_text, room_id)
+                # Only messages the bot will answer are queued
+                if not self.should_respond(message_text):
+                    return
                 
-                if response_text:
-                    # Wait a bit before responding (more natural)
-                    await asyncio.sleep(self.config['response_delay'])
-                    
-                    # Send response
-                    await self.send_message(room_id, response_text)
+                # Hand off to the room's queue; generation and sending run in the room worker
+                self.enqueue_message(room_id, sender_handle, message_text, context_seq, received_at)
+        
+        except Exception as e:
+            logger.error(f"Error handling message: {e}")
+
+
+def create_http_client(config: Dict) -> httpx.AsyncClient:
+    """Connection-pooled client for PHP API and Ollama calls"""
+    limit = max(config['http_max_connections'], 1)
+    return httpx.AsyncClient(
+        timeout=API_TIMEOUT,
+        limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+    )
+
+
+class RoomConnection:
+    """
+    One WebSocket connection subscribed to one room.
+    
+    The server keeps a single room per connection and broadcasts to every
+    connection in that room, so one connection (authenticated as the first
+    persona in the room) receives messages for all personas there.
+    
+    The connection tracks the highest message ID seen in the room; after a
+    reconnect, on_connect is called so the host can fetch what was missed.
+    """
+    
+    def __init__(self, ws_url: str, user_handle: str, api_secret: str, room_id: str, bots: List[ChatBot],
+                 context_store: ContextStore, on_connect: Optional[Callable[['RoomConnection'], None]] = None,
+                 last_seen_id: Optional[int] = None):
+        self.ws_url = ws_url
+        self.user_handle = user_handle
+        self.api_secret = api_secret
+        self.room_id = room_id
+        self.bots = bots
+        self.context_store = context_store
+        self.on_connect = on_connect
+        self.ws = None
+        self.connected = False
+        
+        # Catch-up bookkeeping: highest ID seen, the ID to catch up from after
+        # the latest reconnect, and recent IDs to drop duplicates
+        self.last_seen_id = last_seen_id
+        self.catch_up_from: Optional[int] = None
+        self.seen_ids: deque = deque(maxlen=SEEN_IDS_SIZE)
+        self.seen_set = set()
+    
+    async def connect(self) -> bool:
+        """Connect to WebSocket server"""
+        try:
+            # Build WebSocket URL with authentication
+            ws_url = f"{self.ws_url}?user_handle={quote(self.user_handle)}&api_secret={quote(self.api_secret)}&room_id={quote(self.room_id)}"
             
-            elif message_type == 'room_joined':
-                room_id = message_data.get('room_id')
-                self.current_room = room_id
-                logger.info(f"Joined room: {room_id}")
+            logger.info(f"Connecting to WebSocket server: {self.ws_url}")
+            logger.info(f"Bot handle: {self.user_handle}, Room: {self.room_id}, Personas: {len(self.bots)}")
             
-            elif message_type == 'pong':
-                # Respond to ping
-                pass
+            self.ws = await websockets.connect(ws_url)
+            self.connected = True
+            logger.info(f"WebSocket connected successfully for room {self.room_id}!")
             
-            elif message_type == 'error':
-                error_msg = message_data.get('message', 'Unknown error')
-                logger.error(f"WebSocket error: {error_msg}")
+            # Send initial presence update
+            await self.ws.send(json.dumps({
+                'type': 'presence_update',
+                'status': 'online'
+            }))
             
+            return True
         except Exception as e:
-            logger.error(f"Error handling message: {e}")
+            logger.error(f"Failed to connect to WebSocket for room {self.room_id}: {e}")
+            return False
+    
+    async def dispatch(self, message_data: Dict):
+        """Hand a server message to every persona in the room"""
+        message_type = message_data.get('type')
+        
+        if message_type == 'new_message':
+            await self.deliver(message_data)
+        
+        elif message_type == 'room_joined':
+            logger.info(f"Joined room: {message_data.get('room_id')}")
+        
+        elif message_type == 'error':
+            error_msg = message_data.get('message', 'Unknown error')
+            logger.error(f"WebSocket error in room {self.room_id}: {error_msg}")
+    
+    def mark_seen(self, message_id: Optional[int]) -> bool:
+        """Remember a message ID; False if it was already delivered"""
+        if message_id is None:
+            return True
+        if message_id in self.seen_set:
+            return False
+        if len(self.seen_ids) == self.seen_ids.maxlen:
+            self.seen_set.discard(self.seen_ids[0])
+        self.seen_ids.append(message_id)
+        self.seen_set.add(message_id)
+        if self.last_seen_id is None or message_id > self.last_seen_id:
+            self.last_seen_id = message_id
+        return True
+    
+    async def deliver(self, message_data: Dict, received_at: Optional[float] = None):
+        """Record a new message once in the shared context store, then fan out to the personas"""
+        message = message_data.get('message', {})
+        if not self.mark_seen(message_id_of(message)):
+            return
+        
+        try:
+            text = decode_cipher_blob(message.get('cipher_blob'))
+        except Exception as e:
+            logger.error(f"Error decoding message: {e}")
+            return
+        context_seq = self.context_store.record(message.get('room_id'), message.get('sender_handle'), text)
+        for bot in self.bots:
+            await bot.handle_message(message_data, context_seq, received_at)
     
-    async def listen_for_messages(self):
+    async def listen(self):
         """Listen for messages from WebSocket"""
         try:
             async for message in self.ws:
                 try:
                     data = json.loads(message)
-                    await self.handle_message(data)
+                    await self.dispatch(data)
                 except json.JSONDecodeError:
                     logger.warning(f"Received non-JSON message: {message[:100]}")
                 except Exception as e:
                     logger.error(f"Error processing message: {e}")
         except websockets.exceptions.ConnectionClosed:
-            logger.warning("WebSocket connection closed")
-            self.connected = False
+            logger.warning(f"WebSocket connection closed for room {self.room_id}")
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
+        finally:
             self.connected = False
     
     async def keepalive(self):
         """Send periodic ping to keep connection alive"""
         while self.connected:
-            await asyncio.sleep(30)  # Ping every 30 seconds
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
             if self.connected and self.ws:
                 try:
                     await self.ws.send(json.dumps({'type': 'ping'}))
@@ -403,50 +1385,315 @@ class ChatBot:
                     logger.error(f"Error sending ping: {e}")
                     self.connected = False
     
-    async def run(self):
-        """Main bot loop"""
-        logger.info(f"Starting {self.bot_handle} bot...")
-        logger.info(f"AI Provider: {self.config['ai_provider']}")
-        logger.info(f"Default Room: {self.default_room}")
-        
-        # Ensure bot user exists
-        await self.ensure_bot_user_exists()
+    async def run(self) -> bool:
+        """Connect and listen until the connection closes; False if the connect failed"""
+        if not await self.connect():
+            return False
         
-        # Connect to WebSocket
-        if not await self.connect_websocket():
-            logger.error("Failed to connect. Exiting.")
-            return
+        # Everything after the last message seen before the drop was missed
+        self.catch_up_from = self.last_seen_id
+        if self.on_connect is not None and self.catch_up_from is not None:
+            self.on_connect(self)
         
-        # Start keepalive task
         keepalive_task = asyncio.create_task(self.keepalive())
-        
-        # Listen for messages
         try:
-            await self.listen_for_messages()
+            await self.listen()
         finally:
             keepalive_task.cancel()
-            if self.ws:
+            await self.close()
+        return True
+    
+    async def close(self):
+        self.connected = False
+        if self.ws:
+            try:
                 await self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+
+class ReconnectBackoff:
+    """
+    Exponential backoff with full jitter for one room's reconnects.
+    
+    Each failed attempt doubles the upper bound of a random delay, up to
+    max_delay; a connection that stayed up for stable_seconds starts the
+    sequence over.
+    """
+    
+    def __init__(self, base_delay: float, max_delay: float, stable_seconds: float):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stable_seconds = stable_seconds
+        self.attempt = 0
+    
+    def next_delay(self, uptime: Optional[float]) -> float:
+        """Seconds to wait before reconnecting; uptime is None if the connect failed"""
+        if uptime is not None and uptime >= self.stable_seconds:
+            self.attempt = 0
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+
+class BotHost:
+    """
+    Runs many bot personas across many rooms in one asyncio process.
+    
+    Personas share one pooled HTTP client, one WebSocket per room, the
+    response cache, the room context store and the inference scheduler;
+    each persona keeps its own config and room queues.
+    """
+    
+    def __init__(self, host_config: Dict, persona_configs: List[Dict]):
+        self.config = host_config
+        self.ws_url = f"ws://{host_config['ws_host']}:{host_config['ws_port']}"
+        self.http = create_http_client(host_config)
+        self.response_cache = create_response_cache(host_config)
+        self.context_store = create_context_store(host_config)
+        self.scheduler = create_inference_scheduler(host_config)
+        self.catch_up_pending = set()
+        self.catch_up_task: Optional[asyncio.Task] = None
+        last_seen = self.load_state()
+        self.bots = [
+            ChatBot(config, http_client=self.http, response_cache=self.response_cache,
+                    context_store=self.context_store, scheduler=self.scheduler)
+            for config in persona_configs
+        ]
+        self.connections: Dict[str, RoomConnection] = {}
+        
+        handles = {bot.bot_handle for bot in self.bots}
+        for bot in self.bots:
+            bot.ignored_handles |= handles
+        
+        # room_id -> personas in that room, in config order
+        rooms: Dict[str, List[ChatBot]] = {}
+        for bot in self.bots:
+            for room_id in bot.rooms:
+                rooms.setdefault(room_id, []).append(bot)
+        for room_id, bots in rooms.items():
+            self.connections[room_id] = RoomConnection(
+                self.ws_url, bots[0].bot_handle, host_config['api_secret'], room_id, bots, self.context_store,
+                on_connect=self.request_catch_up, last_seen_id=last_seen.get(room_id)
+            )
+    
+    async def run_room(self, connection: RoomConnection):
+        """Keep one room connected, reconnecting with jittered exponential backoff"""
+        backoff = ReconnectBackoff(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, RECONNECT_STABLE_SECONDS)
+        await asyncio.sleep(random.uniform(0, RECONNECT_STARTUP_JITTER))
+        while True:
+            started = time.monotonic()
+            try:
+                connected = await connection.run()
+            except Exception as e:
+                logger.error(f"Room {connection.room_id} error: {e}")
+                connected = False
+            
+            delay = backoff.next_delay(time.monotonic() - started if connected else None)
+            logger.info(f"Reconnecting to room {connection.room_id} in {delay:.1f} seconds (attempt {backoff.attempt})...")
+            await asyncio.sleep(delay)
+    
+    def request_catch_up(self, connection: RoomConnection):
+        """Queue a room for the next bulk catch-up fetch"""
+        self.catch_up_pending.add(connection.room_id)
+        if self.catch_up_task is None or self.catch_up_task.done():
+            self.catch_up_task = asyncio.create_task(self.catch_up())
+    
+    async def catch_up(self):
+        """
+        Catch up every room that reconnected, oldest missed message first.
+        
+        Rooms that reconnect while a fetch is running are picked up by the
+        next pass, so no reconnect goes without a catch-up.
+        """
+        while self.catch_up_pending:
+            await asyncio.sleep(CATCH_UP_BATCH_DELAY)
+            rooms = self.catch_up_pending
+            self.catch_up_pending = set()
+            try:
+                await self.catch_up_rooms(rooms)
+            except Exception as e:
+                logger.error(f"Catch-up for {', '.join(sorted(rooms))} failed, missed messages were not processed: {e}")
+    
+    async def catch_up_rooms(self, rooms: set):
+        """
+        Fetch messages missed in the given rooms in one paged bulk fetch and
+        deliver them.
+        
+        Missed messages go through the normal pipeline backdated to their
+        queue time, so room deadlines drop the ones too old to answer; all of
+        them still land in the context store.
+        """
+        since_id = min(self.connections[room_id].catch_up_from for room_id in rooms)
+        params = {'since_id': since_id, 'limit': CATCH_UP_LIMIT}
+        if len(rooms) == 1:
+            params['room_id'] = next(iter(rooms))
+        
+        messages = []
+        complete = False
+        for _ in range(CATCH_UP_MAX_PAGES):
+            result = await self.fetch_messages(params)
+            page = result.get('messages', [])
+            messages.extend(page)
+            if 'has_more' not in result:
+                # API without since_id: one newest-first page, limited before the room filter
+                logger.warning(f"messages.php does not support since_id; catch-up only sees the newest "
+                               f"{CATCH_UP_LIMIT} messages across all rooms")
+                complete = True
+                break
+            page_ids = [message_id for message_id in map(message_id_of, page) if message_id is not None]
+            if not result['has_more'] or not page_ids:
+                complete = True
+                break
+            params['since_id'] = max(page_ids)
+        
+        now = time.monotonic()
+        for room_id in rooms:
+            connection = self.connections[room_id]
+            missed = sorted(
+                (message for message in messages
+                 if message.get('room_id') == room_id
+                 and (message_id_of(message) or 0) > connection.catch_up_from),
+                key=message_id_of
+            )
+            if not complete:
+                logger.warning(f"Catch-up for {room_id} stopped after {CATCH_UP_MAX_PAGES * CATCH_UP_LIMIT} "
+                               f"messages; newer missed messages were skipped")
+            
+            for message in missed:
+                await connection.deliver(
+                    {'type': 'new_message', 'message': message},
+                    received_at=now - message_age(message)
+                )
+            logger.info(f"Caught up {len(missed)} missed message(s) in {room_id}")
+    
+    async def fetch_messages(self, params: Dict) -> Dict:
+        """GET api/messages.php; raises on HTTP or API errors"""
+        response = await self.http.get(
+            f"{self.config['api_base_url']}/messages.php",
+            params=params,
+            headers={'X-API-SECRET': self.config['api_secret']},
+            timeout=API_TIMEOUT
+        )
+        result = response.json()
+        if response.status_code != 200 or not result.get('success'):
+            raise RuntimeError(f"HTTP {response.status_code}: {result.get('error')}")
+        return result
+    
+    def load_state(self) -> Dict[str, int]:
+        """Last seen message ID per room from the previous run"""
+        path = self.config.get('state_file')
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {room_id: int(message_id) for room_id, message_id in json.load(f).get('last_seen', {}).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"Ignoring unreadable state file {path}: {e}")
+            return {}
+    
+    def save_state(self):
+        path = self.config.get('state_file')
+        if not path:
+            return
+        state = {
+            'last_seen': {
+                room_id: connection.last_seen_id
+                for room_id, connection in self.connections.items()
+                if connection.last_seen_id is not None
+            }
+        }
+        try:
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to save state file {path}: {e}")
+    
+    async def save_state_periodically(self):
+        while True:
+            await asyncio.sleep(STATE_SAVE_INTERVAL)
+            self.save_state()
+    
+    async def run(self):
+        """Main host loop"""
+        for bot in self.bots:
+            logger.info(f"Starting {bot.bot_handle} bot (AI Provider: {bot.config['ai_provider']}, Rooms: {', '.join(bot.rooms)})")
+            await bot.ensure_bot_user_exists()
+        
+        await asyncio.gather(
+            self.log_stats(),
+            self.save_state_periodically(),
+            *(self.run_room(connection) for connection in self.connections.values()),
+        )
+    
+    async def log_stats(self):
+        """Periodically log per-persona pipeline counters, cache effectiveness and context memory"""
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            for bot in self.bots:
+                logger.info(f"Stats {bot.bot_handle}: {bot.stats}")
+            logger.info(f"Response cache: {self.response_cache.summary()}")
+            logger.info(f"Context store: {self.context_store.summary()}")
+            logger.info(f"Inference scheduler: {self.scheduler.summary()}")
+    
+    async def close(self):
+        if self.catch_up_task is not None:
+            self.catch_up_task.cancel()
+        for connection in self.connections.values():
+            await connection.close()
+        self.save_state()
+        for bot in self.bots:
+            await bot.close()
+        await self.http.aclose()
+        self.response_cache.close()
+
+
+def load_personas(config: Dict) -> List[Dict]:
+    """
+    Per-persona configs: CONFIG, then the file's "defaults", then each persona.
+    
+    Without a personas file the host runs a single persona from CONFIG.
+    Connection settings (HOST_CONFIG_KEYS) always come from CONFIG and the
+    file defaults, since all personas share the same connections.
+    """
+    if not config['personas_file']:
+        return [dict(config)]
+    
+    with open(config['personas_file'], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    defaults = data.get('defaults', {})
+    personas = []
+    for persona in data.get('personas', []):
+        if not persona.get('bot_handle'):
+            raise ValueError("Every persona needs a bot_handle")
+        merged = {**config, **defaults, **persona}
+        for key in HOST_CONFIG_KEYS:
+            merged[key] = defaults.get(key, config[key])
+        personas.append(merged)
+    
+    if not personas:
+        raise ValueError(f"No personas defined in {config['personas_file']}")
+    return personas
+
 
 async def main():
     """Main entry point"""
     # Ensure logs directory exists
     os.makedirs('logs', exist_ok=True)
     
-    bot = ChatBot(CONFIG)
+    personas = load_personas(CONFIG)
+    host_config = dict(personas[0])
+    host = BotHost(host_config, personas)
     
-    # Run with auto-reconnect
-    while True:
-        try:
-            await bot.run()
-        except KeyboardInterrupt:
-            logger.info("Bot stopped by user")
-            break
-        except Exception as e:
-            logger.error(f"Bot error: {e}")
-            logger.info("Reconnecting in 5 seconds...")
-            await asyncio.sleep(5)
-            bot.connected = False
+    # Rooms reconnect on their own
+    try:
+        await host.run()
+    finally:
+        await host.close()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,15 @@
+-- Patch 028: Add Outbox Pending-Age Index
+-- Covering index for per-room oldest-pending probes used by the Python
+-- runtime's queue-age SLO tracking (GET /drain/lag).
+-- The leading (delivered_at, deleted_at) columns restrict the scan to pending
+-- rows only; (room_id, queued_at) lets MIN(queued_at) ... GROUP BY room_id be
+-- answered from the index without touching table rows.
+
+SET @index_exists = (SELECT COUNT(*) FROM information_schema.statistics 
+                     WHERE table_schema = DATABASE() 
+                     AND table_name = 'temp_outbox' 
+                     AND index_name = 'idx_outbox_pending_age');
+SET @sql = IF(@index_exists = 0, 'CREATE INDEX idx_outbox_pending_age ON temp_outbox(delivered_at, deleted_at, room_id, queued_at)', 'SELECT 1');
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
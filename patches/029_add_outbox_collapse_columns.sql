@@ -0,0 +1,36 @@
+-- Patch 029: Add Outbox Collapse Columns
+-- Records why the Python runtime collapsed a temp_outbox row instead of
+-- delivering it (e.g. duplicate content from client retries or queue replays)
+-- and which row it was collapsed into. Collapsed rows are also soft-deleted.
+
+-- Add collapse_reason column to temp_outbox
+SET @col_exists = (
+    SELECT COUNT(*) 
+    FROM information_schema.COLUMNS 
+    WHERE TABLE_SCHEMA = DATABASE() 
+    AND TABLE_NAME = 'temp_outbox' 
+    AND COLUMN_NAME = 'collapse_reason'
+);
+SET @sql = IF(@col_exists = 0,
+    'ALTER TABLE temp_outbox ADD COLUMN collapse_reason VARCHAR(32) NULL DEFAULT NULL COMMENT \'Why the row was collapsed instead of delivered\'',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Add collapsed_into column to temp_outbox
+SET @col_exists = (
+    SELECT COUNT(*) 
+    FROM information_schema.COLUMNS 
+    WHERE TABLE_SCHEMA = DATABASE() 
+    AND TABLE_NAME = 'temp_outbox' 
+    AND COLUMN_NAME = 'collapsed_into'
+);
+SET @sql = IF(@col_exists = 0,
+    'ALTER TABLE temp_outbox ADD COLUMN collapsed_into BIGINT UNSIGNED NULL DEFAULT NULL COMMENT \'Original message this row duplicated\'',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,12 @@
+-- Rollback Patch: 028_add_outbox_pending_age_index
+-- Description: Remove the temp_outbox pending-age index
+-- Use: Run this to undo patch 028_add_outbox_pending_age_index
+
+SET @index_exists = (SELECT COUNT(*) FROM information_schema.statistics 
+                     WHERE table_schema = DATABASE() 
+                     AND table_name = 'temp_outbox' 
+                     AND index_name = 'idx_outbox_pending_age');
+SET @sql = IF(@index_exists > 0, 'ALTER TABLE temp_outbox DROP INDEX idx_outbox_pending_age', 'SELECT 1');
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,7 @@
+-- Rollback Patch: 029_add_outbox_collapse_columns
+-- Description: Remove temp_outbox collapse columns
+-- Use: Run this to undo patch 029_add_outbox_collapse_columns
+
+ALTER TABLE temp_outbox
+DROP COLUMN IF EXISTS collapse_reason,
+DROP COLUMN IF EXISTS collapsed_into;
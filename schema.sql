@@ -97,5 +97,6 @@ CREATE TABLE IF NOT EXISTS patch_history (
 -- Create indexes for performance
 -- Additional composite indexes for common query patterns
 CREATE INDEX IF NOT EXISTS idx_outbox_pending ON temp_outbox(room_id, delivered_at, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_age ON temp_outbox(delivered_at, deleted_at, room_id, queued_at);
 CREATE INDEX IF NOT EXISTS idx_im_unread ON im_messages(to_user, folder, read_at, deleted_at);
 
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Sentinel Chat Platform - WebSocket Fan-out Load Test
+
+Opens thousands of simulated clients against the WebSocket server (the
+Node.js cluster on port 8420, or the supervisor's native mode on 4291)
+with the same query-string authentication as ChatBot.connect_websocket,
+spreads them over rooms, injects messages and measures how long each
+broadcast takes to reach every subscriber.
+
+Reports:
+- connect rate, handshake latency and failed connects
+- fan-out latency percentiles (injection to receipt, per recipient)
+- missed deliveries and connections dropped during the run
+- server CPU and RSS sampled from the supervisor's /stats
+
+Messages are injected either through the PHP API (--inject api, the path
+real messages take: messages.php -> temp_outbox -> server poll) or
+straight into the native server (--inject broadcast, POST /broadcast on
+the supervisor; native mode only).
+
+Usage:
+    python scripts/websocket_loadtest.py --clients 2000 --rooms 20 --duration 60
+    python scripts/websocket_loadtest.py --url ws://localhost:4291 --inject broadcast --distribution zipf
+
+Requires: websockets (see requirements-bot.txt)
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import urllib.request
+from urllib.parse import quote, unquote
+
+import websockets
+
+MARKER_PATTERN = re.compile(r'loadtest (?P<run>[0-9a-f]+) (?P<id>\d+)')
+
+
+class LoadClient:
+    """One simulated chat client"""
+    
+    def __init__(self, handle: str, room_id: str):
+        self.handle = handle
+        self.room_id = room_id
+        self.ws = None
+        self.open = False
+        self.received = 0
+        self.seen = set()  # Injected message ids already received
+        self.duplicates = 0
+
+
+class LoadTest:
+    """
+    Drives the simulated clients, the message injector and the /stats sampler.
+    
+    All clients share one event loop; a client only parses new_message
+    frames, so the harness itself stays cheap relative to the server.
+    """
+    
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.run_id = os.urandom(4).hex()
+        self.rng = random.Random(args.seed)
+        self.clients = []
+        self.client_tasks = []
+        self.stopping = False
+        
+        # Connect phase
+        self.connect_started = None
+        self.connect_finished = None
+        self.connect_latencies = []
+        self.connect_failures = 0
+        self.connect_errors = {}
+        self.dropped = 0
+        
+        # Fan-out measurements: message id -> (injected_at, expected recipients)
+        self.injected = {}
+        self.delivered = {}
+        self.fanout_latencies = []
+        self.duplicates = 0
+        self.inject_failures = 0
+        
+        # Server samples: (monotonic time, /stats payload)
+        self.server_samples = []
+        self.stats_errors = 0
+    
+    # ------------------------------------------------------------------
+    # Clients
+    # ------------------------------------------------------------------
+    
+    def client_url(self, client: LoadClient) -> str:
+        """Same query-string authentication as ChatBot.connect_websocket"""
+        return (
+            f"{self.args.url}?user_handle={quote(client.handle)}"
+            f"&api_secret={quote(self.args.api_secret)}&room_id={quote(client.room_id)}"
+        )
+    
+    async def connect_all(self) -> None:
+        """Open all clients at the configured connect rate"""
+        rooms = assign_rooms(self.args.clients, self.args.rooms, self.args.distribution, self.args.zipf_s, self.rng)
+        self.clients = [
+            LoadClient(f"{self.args.handle_prefix}{self.run_id}_{index}", room_id)
+            for index, room_id in enumerate(rooms)
+        ]
+        
+        semaphore = asyncio.Semaphore(self.args.connect_concurrency)
+        interval = 1.0 / self.args.connect_rate if self.args.connect_rate > 0 else 0.0
+        self.connect_started = time.monotonic()
+        next_at = self.connect_started
+        tasks = []
+        
+        for client in self.clients:
+            now = time.monotonic()
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+            next_at = max(next_at, now) + interval
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(self.run_client(client, semaphore)))
+        
+        # Wait until every handshake has finished (success or failure)
+        while any(not client.open and not task.done() for client, task in zip(self.clients, tasks)):
+            await asyncio.sleep(0.05)
+        self.connect_finished = time.monotonic()
+        self.client_tasks = tasks
+    
+    async def run_client(self, client: LoadClient, semaphore: asyncio.Semaphore) -> None:
+        """Connect one client, then read until the run stops"""
+        started = time.monotonic()
+        try:
+            client.ws = await websockets.connect(
+                self.client_url(client),
+                open_timeout=self.args.connect_timeout,
+                ping_interval=None,
+                close_timeout=1,
+                compression=None,
+                max_size=2 ** 20,
+            )
+        except Exception as e:
+            self.connect_failures += 1
+            name = type(e).__name__
+            self.connect_errors[name] = self.connect_errors.get(name, 0) + 1
+            return
+        finally:
+            semaphore.release()
+        
+        self.connect_latencies.append((time.monotonic() - started) * 1000)
+        client.open = True
+        
+        try:
+            async for raw in client.ws:
+                self.handle_frame(client, raw)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            client.open = False
+            if not self.stopping:
+                self.dropped += 1
+    
+    def handle_frame(self, client: LoadClient, raw) -> None:
+        """Record fan-out latency for injected messages"""
+        received_at = time.monotonic()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return
+        if data.get('type') != 'new_message':
+            return
+        
+        marker = MARKER_PATTERN.search(decode_cipher_blob(data.get('message', {}).get('cipher_blob', '')))
+        if not marker or marker.group('run') != self.run_id:
+            return
+        
+        message_id = int(marker.group('id'))
+        injected = self.injected.get(message_id)
+        if injected is None:
+            return
+        
+        # Node can broadcast a row again before its delivered_at update lands;
+        # only the first copy counts towards delivery and latency
+        if message_id in client.seen:
+            client.duplicates += 1
+            self.duplicates += 1
+            return
+        client.seen.add(message_id)
+        client.received += 1
+        self.delivered[message_id] = self.delivered.get(message_id, 0) + 1
+        self.fanout_latencies.append((received_at - injected[0]) * 1000)
+    
+    async def close_all(self) -> None:
+        self.stopping = True
+        await asyncio.gather(
+            *(client.ws.close() for client in self.clients if client.ws is not None and client.open),
+            return_exceptions=True,
+        )
+        await asyncio.gather(*self.client_tasks, return_exceptions=True)
+    
+    # ------------------------------------------------------------------
+    # Message injection
+    # ------------------------------------------------------------------
+    
+    async def inject_messages(self, duration: float) -> None:
+        """Inject messages into rooms that have open clients at a fixed rate"""
+        if self.args.message_rate <= 0:
+            await asyncio.sleep(duration)
+            return
+        
+        interval = 1.0 / self.args.message_rate
+        deadline = time.monotonic() + duration
+        next_at = time.monotonic()
+        message_id = 0
+        pending = set()
+        
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if next_at > now:
+                await asyncio.sleep(next_at - now)
+            next_at = max(next_at, now) + interval
+            
+            # Pick a room weighted by its number of clients
+            open_clients = [client for client in self.clients if client.open]
+            if not open_clients:
+                continue
+            room_id = self.rng.choice(open_clients).room_id
+            expected = sum(1 for client in open_clients if client.room_id == room_id)
+            
+            message_id += 1
+            text = f"loadtest {self.run_id} {message_id} "
+            text += "x" * max(self.args.message_size - len(text), 0)
+            self.injected[message_id] = (time.monotonic(), expected)
+            
+            task = asyncio.create_task(self.send_injected(room_id, message_id, text))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def send_injected(self, room_id: str, message_id: int, text: str) -> None:
+        """POST one message through the chosen injection path"""
+        cipher_blob = encode_cipher_blob(text)
+        if self.args.inject == 'api':
+            url = f"{self.args.api_base_url}/messages.php"
+            body = {
+                'room_id': room_id,
+                'sender_handle': self.args.sender,
+                'cipher_blob': cipher_blob,
+                'filter_version': 1,
+            }
+        else:
+            url = re.sub(r'/stats$', '/broadcast', self.args.stats_url)
+            body = {
+                'room_id': room_id,
+                'message': {
+                    'id': str(message_id),
+                    'room_id': room_id,
+                    'sender_handle': self.args.sender,
+                    'cipher_blob': cipher_blob,
+                    'filter_version': 1,
+                },
+            }
+        
+        try:
+            await asyncio.to_thread(post_json, url, body, self.args.api_secret)
+        except Exception as e:
+            self.inject_failures += 1
+            # Nobody will receive it; do not count it as missed
+            self.injected.pop(message_id, None)
+            if self.inject_failures <= 5:
+                print(f"Injection failed: {e}", flush=True)
+    
+    # ------------------------------------------------------------------
+    # Server stats
+    # ------------------------------------------------------------------
+    
+    async def sample_server(self) -> None:
+        """Poll the supervisor's /stats until stopped"""
+        while not self.stopping:
+            try:
+                stats = await asyncio.to_thread(get_json, self.args.stats_url)
+                self.server_samples.append((time.monotonic(), stats.get('stats', {})))
+            except Exception:
+                self.stats_errors += 1
+            await asyncio.sleep(self.args.stats_interval)
+    
+    # ------------------------------------------------------------------
+    # Run and report
+    # ------------------------------------------------------------------
+    
+    async def run(self) -> dict:
+        sampler = asyncio.create_task(self.sample_server())
+        
+        print(f"Run {self.run_id}: connecting {self.args.clients} clients to {self.args.url} "
+              f"({self.args.rooms} rooms, {self.args.distribution})", flush=True)
+        await self.connect_all()
+        open_count = sum(1 for client in self.clients if client.open)
+        print(f"Connected {open_count}/{self.args.clients} in "
+              f"{self.connect_finished - self.connect_started:.1f}s", flush=True)
+        
+        print(f"Injecting {self.args.message_rate} msg/s for {self.args.duration}s via {self.args.inject}", flush=True)
+        await self.inject_messages(self.args.duration)
+        
+        # Let in-flight broadcasts arrive before counting misses
+        await asyncio.sleep(self.args.settle)
+        
+        await self.close_all()
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+        return self.report()
+    
+    def report(self) -> dict:
+        connected = len(self.connect_latencies)
+        connect_seconds = (self.connect_finished or 0) - (self.connect_started or 0)
+        expected = sum(expected for _, expected in self.injected.values())
+        received = sum(self.delivered.get(message_id, 0) for message_id in self.injected)
+        
+        return {
+            'run_id': self.run_id,
+            'url': self.args.url,
+            'clients': self.args.clients,
+            'rooms': self.args.rooms,
+            'distribution': self.args.distribution,
+            'connect': {
+                'connected': connected,
+                'failed': self.connect_failures,
+                'errors': self.connect_errors,
+                'seconds': round(connect_seconds, 2),
+                'rate_per_second': round(connected / connect_seconds, 1) if connect_seconds > 0 else None,
+                'latency_ms': latency_summary(self.connect_latencies),
+            },
+            'fanout': {
+                'injected': len(self.injected),
+                'inject_failures': self.inject_failures,
+                'expected_deliveries': expected,
+                'received_deliveries': received,
+                'missed_deliveries': max(expected - received, 0),
+                'duplicate_deliveries': self.duplicates,
+                'latency_ms': latency_summary(self.fanout_latencies),
+            },
+            'dropped_connections': self.dropped,
+            'server': server_summary(self.server_samples, self.stats_errors),
+        }
+
+
+def assign_rooms(clients: int, rooms: int, distribution: str, zipf_s: float, rng: random.Random) -> list:
+    """
+    Room for every client.
+    
+    uniform - rooms get (almost) equal shares
+    zipf    - room k gets a share proportional to 1 / k^s (a few hot rooms)
+    single  - everyone in one room (worst-case fan-out)
+    """
+    names = [f"loadtest-{index}" for index in range(rooms)]
+    if distribution == 'single':
+        return [names[0]] * clients
+    if distribution == 'uniform':
+        return [names[index % rooms] for index in range(clients)]
+    
+    weights = [1.0 / math.pow(rank, zipf_s) for rank in range(1, rooms + 1)]
+    return rng.choices(names, weights=weights, k=clients)
+
+
+def encode_cipher_blob(text: str) -> str:
+    """base64(rawurlencode(text)), the encoding used by ChatBot.send_message"""
+    return base64.b64encode(quote(text, safe='').encode('utf-8')).decode('utf-8')
+
+
+def decode_cipher_blob(cipher_blob: str) -> str:
+    try:
+        return unquote(base64.b64decode(cipher_blob).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return ''
+
+
+def post_json(url: str, body: dict, api_secret: str) -> dict:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'X-API-SECRET': api_secret},
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        result = json.loads(response.read().decode('utf-8'))
+    if not result.get('success'):
+        raise RuntimeError(result.get('error', 'request failed'))
+    return result
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def percentile(sorted_values: list, p: float):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return round(sorted_values[rank - 1], 2)
+
+
+def latency_summary(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'p50': percentile(ordered, 50),
+        'p90': percentile(ordered, 90),
+        'p99': percentile(ordered, 99),
+        'p999': percentile(ordered, 99.9),
+        'max': round(ordered[-1], 2) if ordered else None,
+    }
+
+
+def server_summary(samples: list, errors: int) -> dict:
+    """CPU percentage and RSS of the supervisor plus Node.js workers"""
+    cpu_percent = []
+    rss = []
+    connections = []
+    
+    for (t0, s0), (t1, s1) in zip(samples, samples[1:]):
+        cpu0 = s0.get('resources', {}).get('total_cpu_seconds')
+        cpu1 = s1.get('resources', {}).get('total_cpu_seconds')
+        if cpu0 is not None and cpu1 is not None and t1 > t0 and cpu1 >= cpu0:
+            cpu_percent.append((cpu1 - cpu0) / (t1 - t0) * 100)
+    for _, stats in samples:
+        if stats.get('resources', {}).get('total_rss_bytes'):
+            rss.append(stats['resources']['total_rss_bytes'])
+        connections.append(stats.get('python_server', {}).get('connected_clients', 0))
+    
+    return {
+        'samples': len(samples),
+        'sample_errors': errors,
+        'cpu_percent_avg': round(sum(cpu_percent) / len(cpu_percent), 1) if cpu_percent else None,
+        'cpu_percent_max': round(max(cpu_percent), 1) if cpu_percent else None,
+        'rss_mb_max': round(max(rss) / 1024 / 1024, 1) if rss else None,
+        'connected_clients_max': max(connections) if connections else None,
+        'node_restarts': samples[-1][1].get('python_server', {}).get('node_restarts') if samples else None,
+    }
+
+
+def print_report(report: dict) -> None:
+    connect = report['connect']
+    fanout = report['fanout']
+    server = report['server']
+    
+    print("")
+    print("=" * 60)
+    print(f"Load test {report['run_id']} against {report['url']}")
+    print("=" * 60)
+    print(f"Connect:  {connect['connected']}/{report['clients']} ok, {connect['failed']} failed "
+          f"in {connect['seconds']}s ({connect['rate_per_second']} conn/s)")
+    if connect['errors']:
+        print(f"          errors: {connect['errors']}")
+    print(f"          handshake ms p50={connect['latency_ms']['p50']} p99={connect['latency_ms']['p99']} "
+          f"max={connect['latency_ms']['max']}")
+    print(f"Fan-out:  {fanout['injected']} injected ({fanout['inject_failures']} failed), "
+          f"{fanout['received_deliveries']}/{fanout['expected_deliveries']} delivered, "
+          f"{fanout['missed_deliveries']} missed, {fanout['duplicate_deliveries']} duplicate(s)")
+    latency = fanout['latency_ms']
+    print(f"          latency ms p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} "
+          f"p99.9={latency['p999']} max={latency['max']}")
+    print(f"Dropped:  {report['dropped_connections']} connection(s) closed by the server during the run")
+    print(f"Server:   CPU avg={server['cpu_percent_avg']}% max={server['cpu_percent_max']}%, "
+          f"RSS max={server['rss_mb_max']} MB, clients max={server['connected_clients_max']}, "
+          f"restarts={server['node_restarts']} ({server['samples']} samples)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ws_host = os.getenv('WS_HOST', 'localhost')
+    ws_port = os.getenv('WS_PORT', '8420')
+    
+    parser = argparse.ArgumentParser(
+        prog="python scripts/websocket_loadtest.py",
+        description="Load test WebSocket fan-out with simulated chat clients.",
+    )
+    parser.add_argument("--url", default=f"ws://{ws_host}:{ws_port}", help="WebSocket server URL")
+    parser.add_argument("--api-secret", default=os.getenv('API_SECRET', 'change-me-now'), help="API secret used for client auth and injection")
+    parser.add_argument("--clients", type=int, default=1000, help="Number of simulated clients")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="New connections per second (0 = unthrottled)")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="Handshakes in flight at once")
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="Seconds per handshake")
+    parser.add_argument("--rooms", type=int, default=10, help="Number of rooms")
+    parser.add_argument("--distribution", choices=("uniform", "zipf", "single"), default="uniform", help="How clients are spread over rooms")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Skew of the zipf distribution")
+    parser.add_argument("--handle-prefix", default="lt_", help="Prefix for simulated user handles")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to inject messages")
+    parser.add_argument("--message-rate", type=float, default=5.0, help="Injected messages per second (all rooms)")
+    parser.add_argument("--message-size", type=int, default=200, help="Approximate message text length")
+    parser.add_argument("--inject", choices=("api", "broadcast"), default="api", help="api: PHP messages.php; broadcast: supervisor POST /broadcast (native mode)")
+    parser.add_argument("--sender", default=os.getenv('BOT_HANDLE', 'ChatBot'), help="sender_handle of injected messages")
+    parser.add_argument("--api-base-url", default=os.getenv('API_BASE_URL', 'http://localhost/iChat/api'), help="PHP API base URL")
+    parser.add_argument("--stats-url", default="http://localhost:4291/stats", help="Supervisor stats endpoint")
+    parser.add_argument("--stats-interval", type=float, default=2.0, help="Seconds between /stats samples")
+    parser.add_argument("--settle", type=float, default=3.0, help="Seconds to wait for in-flight messages before counting misses")
+    parser.add_argument("--seed", type=int, help="Random seed for room assignment and injection")
+    parser.add_argument("--json-out", help="Also write the report as JSON to this file")
+    return parser
+
+
+def raise_fd_limit(needed: int) -> None:
+    """Raise the open-file soft limit so thousands of sockets fit (Unix only)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        pass
+    if target < needed:
+        print(f"Warning: open file limit is {target}, fewer than {needed} needed", file=sys.stderr)
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    
+    if args.clients <= 0 or args.rooms <= 0:
+        print("--clients and --rooms must be positive", file=sys.stderr)
+        return 2
+    if args.connect_concurrency <= 0:
+        print("--connect-concurrency must be positive", file=sys.stderr)
+        return 2
+    
+    raise_fd_limit(args.clients + args.connect_concurrency + 64)
+    
+    try:
+        report = asyncio.run(LoadTest(args).run())
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        return 130
+    
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json_out}")
+    
+    return 1 if report['connect']['connected'] == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
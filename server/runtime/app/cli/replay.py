@@ -0,0 +1,403 @@
+"""
+Sentinel Chat Platform - Outbox Replay CLI
+
+Re-delivers historical temp_outbox rows (an ID range, a time window
+and/or a single room) to the primary server without touching
+delivered_at, so replayed rows never compete with live draining.
+
+With --include-pending, never-delivered rows are claimed before they
+are sent by stamping delivered_at the way the drain does, so the live
+drain does not send them a second time. Rows the drain delivers first
+are skipped, and failed sends are un-stamped so the drain retries them.
+
+Rows are streamed with a keyset cursor on the primary key, so memory
+stays bounded regardless of range size. Progress is checkpointed to a
+JSON file after every page; re-running with --resume continues from
+the last checkpointed ID.
+
+Usage:
+    python -m app.cli.replay --from-id 1000 --to-id 5000 --checkpoint replay.json
+    python -m app.cli.replay --room lobby --since 2024-01-01T00:00:00 --rate 10
+    python -m app.cli.replay --checkpoint replay.json --resume
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.outbox import TempOutbox
+from app.services.drain_service import DrainService, close_http_client
+
+# Cap on failed IDs kept in the checkpoint file; the count is always exact
+MAX_RECORDED_FAILURES = 10000
+
+
+class ReplayCheckpoint:
+    """
+    Resumable replay state persisted as JSON.
+
+    The selection filters are stored alongside the cursor so a resume
+    cannot silently continue a different range.
+    """
+
+    def __init__(self, path: Optional[str], filters: dict):
+        self.path = path
+        self.filters = filters
+        self.last_id = 0
+        self.delivered = 0
+        self.failed = 0
+        self.skipped = 0
+        self.failed_ids = []
+
+    def load(self) -> None:
+        """Load cursor and counters from the checkpoint file"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data.get("filters") != self.filters:
+            raise ValueError(
+                "Checkpoint filters do not match the requested selection: "
+                f"{data.get('filters')}"
+            )
+
+        self.last_id = int(data.get("last_id", 0))
+        self.delivered = int(data.get("delivered", 0))
+        self.failed = int(data.get("failed", 0))
+        self.skipped = int(data.get("skipped", 0))
+        self.failed_ids = list(data.get("failed_ids", []))
+
+    def save(self) -> None:
+        """Atomically write the checkpoint (no-op without a path)"""
+        if not self.path:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "filters": self.filters,
+                    "last_id": self.last_id,
+                    "delivered": self.delivered,
+                    "failed": self.failed,
+                    "skipped": self.skipped,
+                    "failed_ids": self.failed_ids,
+                    "updated_at": datetime.utcnow().isoformat(),
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+    def record_failure(self, message_id: int) -> None:
+        self.failed += 1
+        if len(self.failed_ids) < MAX_RECORDED_FAILURES:
+            self.failed_ids.append(message_id)
+
+
+class OutboxReplayer:
+    """
+    Streams selected outbox rows and re-delivers them through DrainService.
+
+    Delivery is paced to a fixed rate so a replay cannot starve the
+    live drain of primary-server capacity.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        filters: dict,
+        checkpoint: ReplayCheckpoint,
+        page_size: int,
+        rate_per_second: float,
+        progress_interval: float,
+    ):
+        self.db = db
+        self.filters = filters
+        self.checkpoint = checkpoint
+        self.page_size = page_size
+        self.min_interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.progress_interval = progress_interval
+        self.drain_service = DrainService(db)
+
+    def _base_query(self):
+        """Build the selection query from the CLI filters"""
+        query = self.db.query(TempOutbox).filter(TempOutbox.deleted_at.is_(None))
+
+        if not self.filters["include_pending"]:
+            query = query.filter(TempOutbox.delivered_at.isnot(None))
+        if self.filters["from_id"] is not None:
+            query = query.filter(TempOutbox.id >= self.filters["from_id"])
+        if self.filters["to_id"] is not None:
+            query = query.filter(TempOutbox.id <= self.filters["to_id"])
+        if self.filters["since"] is not None:
+            query = query.filter(
+                TempOutbox.queued_at >= datetime.fromisoformat(self.filters["since"])
+            )
+        if self.filters["until"] is not None:
+            query = query.filter(
+                TempOutbox.queued_at < datetime.fromisoformat(self.filters["until"])
+            )
+        if self.filters["room_id"] is not None:
+            query = query.filter(TempOutbox.room_id == self.filters["room_id"])
+
+        return query
+
+    def count_remaining(self) -> int:
+        """Count rows still to be replayed after the checkpoint cursor"""
+        return (
+            self._base_query()
+            .filter(TempOutbox.id > self.checkpoint.last_id)
+            .count()
+        )
+
+    def _claim_pending(self, message: TempOutbox) -> bool:
+        """
+        Stamp delivered_at on a never-delivered row before sending it.
+
+        The update only matches while delivered_at is still NULL, so a
+        row is sent by either the replay or the live drain, not both.
+
+        Returns:
+            False if the drain delivered the row after the page was read
+        """
+        claimed = (
+            self.db.query(TempOutbox)
+            .filter(TempOutbox.id == message.id, TempOutbox.delivered_at.is_(None))
+            .update({"delivered_at": datetime.utcnow()}, synchronize_session=False)
+        )
+        self.db.commit()
+        return claimed == 1
+
+    def _release_pending(self, message_id: int) -> None:
+        """Clear the claim on a row whose delivery failed so the drain retries it"""
+        (
+            self.db.query(TempOutbox)
+            .filter(TempOutbox.id == message_id)
+            .update({"delivered_at": None}, synchronize_session=False)
+        )
+        self.db.commit()
+
+    def _deliver(self, message: TempOutbox) -> Optional[bool]:
+        """
+        Send one row, claiming it first if it was never delivered.
+
+        Returns:
+            Delivery result, or None if the row was skipped
+        """
+        if message.delivered_at is not None:
+            return self.drain_service.deliver_to_primary(message)
+
+        if not self._claim_pending(message):
+            return None
+        delivered = False
+        try:
+            delivered = self.drain_service.deliver_to_primary(message)
+        finally:
+            if not delivered:
+                self._release_pending(message.id)
+        return delivered
+
+    def _next_page(self) -> list:
+        """Fetch the next keyset page after the checkpoint cursor"""
+        return (
+            self._base_query()
+            .filter(TempOutbox.id > self.checkpoint.last_id)
+            .order_by(TempOutbox.id.asc())
+            .limit(self.page_size)
+            .all()
+        )
+
+    def run(self, dry_run: bool = False) -> dict:
+        """
+        Replay all selected rows.
+
+        Args:
+            dry_run: Only count the selection, deliver nothing
+
+        Returns:
+            Dictionary with replay results
+        """
+        total = self.count_remaining()
+        print(f"Replay selection: {total} message(s) after id {self.checkpoint.last_id}")
+
+        if dry_run or total == 0:
+            return {"selected": total, "delivered": 0, "failed": 0, "skipped": 0}
+
+        processed = 0
+        started_at = time.monotonic()
+        last_report = started_at
+        next_send_at = started_at
+
+        while True:
+            page = self._next_page()
+            if not page:
+                break
+            # Detach the page: keeps memory bounded, and the commits of
+            # pending-row claims can no longer expire and reload its rows
+            self.db.expunge_all()
+
+            for message in page:
+                # Pace deliveries to the configured rate
+                now = time.monotonic()
+                if next_send_at > now:
+                    time.sleep(next_send_at - now)
+                next_send_at = max(next_send_at, now) + self.min_interval
+
+                delivered = self._deliver(message)
+                if delivered is None:
+                    self.checkpoint.skipped += 1
+                elif delivered:
+                    self.checkpoint.delivered += 1
+                else:
+                    self.checkpoint.record_failure(message.id)
+
+                self.checkpoint.last_id = message.id
+                processed += 1
+
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    self._report(processed, total, now - started_at)
+                    last_report = now
+
+            self.checkpoint.save()
+
+        self._report(processed, total, time.monotonic() - started_at)
+        return {
+            "selected": total,
+            "delivered": self.checkpoint.delivered,
+            "failed": self.checkpoint.failed,
+            "skipped": self.checkpoint.skipped,
+        }
+
+    def _report(self, processed: int, total: int, elapsed: float) -> None:
+        """Print a progress line with throughput and ETA"""
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(total - processed, 0)
+        eta = _format_duration(remaining / rate) if rate > 0 else "unknown"
+        percent = (processed / total * 100) if total else 100.0
+        print(
+            f"[{percent:5.1f}%] {processed}/{total} replayed "
+            f"(delivered={self.checkpoint.delivered}, failed={self.checkpoint.failed}, "
+            f"last_id={self.checkpoint.last_id}) {rate:.1f} msg/s, ETA {eta}",
+            flush=True,
+        )
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli.replay",
+        description="Re-deliver historical temp_outbox rows to the primary server.",
+    )
+    parser.add_argument("--from-id", type=int, help="First message ID (inclusive)")
+    parser.add_argument("--to-id", type=int, help="Last message ID (inclusive)")
+    parser.add_argument("--since", help="Queued at or after (ISO 8601, UTC)")
+    parser.add_argument("--until", help="Queued before (ISO 8601, UTC)")
+    parser.add_argument("--room", dest="room_id", help="Only replay this room")
+    parser.add_argument(
+        "--include-pending",
+        action="store_true",
+        help="Also replay rows that were never delivered (marks them delivered)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=settings.REPLAY_RATE_PER_SECOND,
+        help="Maximum deliveries per second (0 = unthrottled)",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=settings.REPLAY_PAGE_SIZE,
+        help="Rows fetched per keyset page",
+    )
+    parser.add_argument("--checkpoint", help="Checkpoint file path")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the cursor stored in --checkpoint",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Count the selection without delivering",
+    )
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.resume and not args.checkpoint:
+        print("--resume requires --checkpoint", file=sys.stderr)
+        return 2
+    if args.page_size <= 0:
+        print("--page-size must be positive", file=sys.stderr)
+        return 2
+
+    filters = {
+        "from_id": args.from_id,
+        "to_id": args.to_id,
+        "since": args.since,
+        "until": args.until,
+        "room_id": args.room_id,
+        "include_pending": args.include_pending,
+    }
+
+    try:
+        for key in ("since", "until"):
+            if filters[key] is not None:
+                datetime.fromisoformat(filters[key])
+    except ValueError as e:
+        print(f"Invalid timestamp: {e}", file=sys.stderr)
+        return 2
+
+    checkpoint = ReplayCheckpoint(args.checkpoint, filters)
+    if args.resume:
+        try:
+            checkpoint.load()
+        except (OSError, ValueError) as e:
+            print(f"Cannot resume: {e}", file=sys.stderr)
+            return 2
+        print(f"Resuming after id {checkpoint.last_id}")
+
+    db = SessionLocal()
+    try:
+        replayer = OutboxReplayer(
+            db,
+            filters,
+            checkpoint,
+            page_size=args.page_size,
+            rate_per_second=args.rate,
+            progress_interval=settings.REPLAY_PROGRESS_INTERVAL_SECONDS,
+        )
+        result = replayer.run(dry_run=args.dry_run)
+    except KeyboardInterrupt:
+        checkpoint.save()
+        print(f"\nInterrupted; checkpoint saved at id {checkpoint.last_id}")
+        return 130
+    finally:
+        db.close()
+        close_http_client()
+
+    print(
+        f"Replay finished: selected={result['selected']} "
+        f"delivered={result['delivered']} failed={result['failed']} "
+        f"skipped={result['skipped']}"
+    )
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -31,7 +31,39 @@ class Settings(BaseSettings):
     # Drain settings
     DRAIN_BATCH_SIZE: int = 100
     DRAIN_INTERVAL_SECONDS: int = 5
+    DRAIN_COMMIT_EVERY: int = 25
     
+    # Duplicate collapsing before delivery
+    DEDUPE_ENABLED: bool = True
+    DEDUPE_WINDOW_SECONDS: float = 30.0
+    DEDUPE_MAX_KEYS_PER_ROOM: int = 512
+    DEDUPE_MAX_ROOMS: int = 10000
+    
+    # Delivery to primary server
+    DELIVERY_TIMEOUT_SECONDS: float = 10.0
+    DELIVERY_MAX_CONNECTIONS: int = 10
+    
+    # Delivery latency tracing
+    TRACE_ENABLED: bool = True
+    TRACE_SAMPLE_RATE: float = 0.1
+    TRACE_BUFFER_SIZE: int = 2048
+    TRACE_EXPORT_PATH: str = ""  # Append finished spans as JSON lines when set
+    
+    # Graceful shutdown: time allowed for in-flight batches to finish
+    SHUTDOWN_GRACE_SECONDS: float = 20.0
+
+    # Replay settings (re-delivery of historical outbox ranges)
+    REPLAY_PAGE_SIZE: int = 500
+    REPLAY_RATE_PER_SECOND: float = 20.0
+    REPLAY_PROGRESS_INTERVAL_SECONDS: float = 5.0
+
+    # Queue-age SLO tracking
+    LAG_PROBE_ENABLED: bool = True
+    LAG_PROBE_INTERVAL_SECONDS: float = 15.0
+    LAG_SLO_WARN_SECONDS: float = 30.0
+    LAG_SLO_CRITICAL_SECONDS: float = 120.0
+    LAG_REPORT_LIMIT: int = 20
+
     # Security
     ALLOWED_HOSTS: List[str] = ["*"]
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
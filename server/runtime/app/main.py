@@ -7,13 +7,17 @@ and syncs messages to the primary NestJS server when available.
 Security: All database queries use SQLAlchemy ORM with parameterized queries.
 """
 
+import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import uvicorn
 from app.config import settings
 from app.database import engine, SessionLocal
-from app.routes import drain, health
+from app.routes import debug, drain, health
+from app.services.drain_service import close_http_client, drain_coordinator
+from app.services.lag_monitor import lag_monitor
+from app.services.tracing import delivery_tracer
 
 # Create database tables
 from app.models import Base
@@ -43,25 +47,66 @@ app.add_middleware(
 # Include routers
 app.include_router(health.router, prefix="/health", tags=["health"])
 app.include_router(drain.router, prefix="/drain", tags=["drain"])
+app.include_router(debug.router, prefix="/debug", tags=["debug"])
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     print("Sentinel Chat Runtime Service starting...")
+    if settings.LAG_PROBE_ENABLED:
+        lag_monitor.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Cleanup on shutdown"""
+    """
+    Drain gracefully on shutdown.
+    
+    Stops new batches, gives in-flight batches the grace period to finish
+    (they commit delivered IDs as they go), then closes the HTTP and DB pools.
+    """
     print("Sentinel Chat Runtime Service shutting down...")
+    drain_coordinator.request_stop(settings.SHUTDOWN_GRACE_SECONDS)
+    await lag_monitor.stop()
+    
+    # Batches stop themselves at the deadline; allow time for their final commit
+    finished = await asyncio.to_thread(
+        drain_coordinator.wait_idle,
+        settings.SHUTDOWN_GRACE_SECONDS + settings.DELIVERY_TIMEOUT_SECONDS,
+    )
+    if not finished:
+        print("Drain batches still running at shutdown; uncommitted messages will be redelivered")
+    
+    close_http_client()
+    delivery_tracer.close()
+    engine.dispose()
+    print("Sentinel Chat Runtime Service stopped")
+
+
+class GracefulServer(uvicorn.Server):
+    """Uvicorn server that starts the drain grace period as soon as SIGTERM arrives"""
+    
+    def handle_exit(self, sig, frame):
+        drain_coordinator.request_stop(settings.SHUTDOWN_GRACE_SECONDS)
+        super().handle_exit(sig, frame)
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG,
-    )
+    if settings.DEBUG:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=True,
+        )
+    else:
+        GracefulServer(
+            uvicorn.Config(
+                "app.main:app",
+                host=settings.HOST,
+                port=settings.PORT,
+                timeout_graceful_shutdown=int(settings.SHUTDOWN_GRACE_SECONDS),
+            )
+        ).run()
 
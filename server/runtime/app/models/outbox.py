@@ -27,9 +27,13 @@ class TempOutbox(Base):
     queued_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
     delivered_at = Column(DateTime, nullable=True, index=True)
     deleted_at = Column(DateTime, nullable=True, index=True)
+    collapse_reason = Column(String(32), nullable=True)
+    collapsed_into = Column(BigInteger, nullable=True)
     
     # Composite indexes for common queries
     __table_args__ = (
         Index('idx_outbox_pending', 'room_id', 'delivered_at', 'deleted_at'),
+        # Covering index for per-room MIN(queued_at) lag probes
+        Index('idx_outbox_pending_age', 'delivered_at', 'deleted_at', 'room_id', 'queued_at'),
     )
 
@@ -0,0 +1,40 @@
+"""
+Sentinel Chat Platform - Debug Routes
+
+Exposes delivery latency traces collected by the drain service.
+"""
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.services.tracing import STAGES, delivery_tracer
+
+router = APIRouter()
+
+
+@router.get("/traces")
+async def delivery_traces(
+    limit: int = Query(50, ge=0, le=5000),
+    format: str = Query("json", pattern="^(json|jsonl)$"),
+):
+    """
+    Get sampled delivery spans and per-stage latency percentiles.
+    
+    Stages: queue_wait (queued -> claimed), dispatch (claimed -> sent),
+    delivery (sent -> acked) and total (queued -> acked).
+    Use format=jsonl to export the whole ring buffer as JSON lines.
+    """
+    if format == "jsonl":
+        return StreamingResponse(
+            delivery_tracer.export_jsonl(),
+            media_type="application/x-ndjson",
+        )
+    
+    return {
+        "enabled": delivery_tracer.enabled,
+        "sample_rate": delivery_tracer.sample_rate,
+        "buffer_size": delivery_tracer.buffer_size,
+        "recorded_total": delivery_tracer.recorded_total,
+        "stages": list(STAGES),
+        "percentiles_ms": delivery_tracer.stage_percentiles(),
+        "spans": [span.to_dict() for span in delivery_tracer.recent(limit)],
+    }
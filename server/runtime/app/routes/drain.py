@@ -4,11 +4,14 @@ Sentinel Chat Platform - Message Draining Routes
 Handles draining messages from temporary outbox to primary server.
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models.outbox import TempOutbox
-from app.services.drain_service import DrainService
+from app.services.drain_service import DrainService, drain_coordinator
+from app.services.dedupe import outbox_deduplicator
+from app.services.lag_monitor import lag_monitor
 from app.config import settings
 
 router = APIRouter()
@@ -31,14 +34,22 @@ async def drain_messages(db: Session = Depends(get_db)):
     Retrieves pending messages from temp_outbox and attempts to
     deliver them to the primary NestJS server.
     """
+    if drain_coordinator.stopping:
+        raise HTTPException(status_code=503, detail="Service is shutting down")
+    
     try:
         drain_service = DrainService(db)
-        result = drain_service.drain_batch(settings.DRAIN_BATCH_SIZE)
+        # Run off the event loop so shutdown signals are handled mid-batch
+        result = await run_in_threadpool(
+            drain_service.drain_batch, settings.DRAIN_BATCH_SIZE
+        )
         return {
             "success": True,
             "processed": result["processed"],
             "delivered": result["delivered"],
             "failed": result["failed"],
+            "collapsed": result["collapsed"],
+            "abandoned": result["abandoned"],
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -61,7 +72,40 @@ async def drain_status(db: Session = Depends(get_db)):
             "pending_messages": pending_count,
             "batch_size": settings.DRAIN_BATCH_SIZE,
             "interval_seconds": settings.DRAIN_INTERVAL_SECONDS,
+            "dedupe": {
+                "enabled": settings.DEDUPE_ENABLED,
+                **outbox_deduplicator.stats(),
+            },
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/lag")
+async def drain_lag(limit: int = Query(settings.LAG_REPORT_LIMIT, ge=1, le=1000)):
+    """
+    Get per-room queue age, worst rooms first.
+    
+    Ages are measured from the oldest undelivered message in each room
+    and classified against the configured SLO thresholds.
+    """
+    try:
+        # Probe on demand when the background loop is off or behind
+        if lag_monitor.needs_probe():
+            await run_in_threadpool(lag_monitor.probe)
+        
+        return {
+            "rooms": lag_monitor.worst_rooms(limit),
+            "pending_rooms": len(lag_monitor.oldest_pending),
+            "breaching_rooms": lag_monitor.breaching_count(),
+            "thresholds": {
+                "warn_seconds": lag_monitor.warn_seconds,
+                "critical_seconds": lag_monitor.critical_seconds,
+            },
+            "probed_at": lag_monitor.probed_at.isoformat(),
+            "probe_duration_ms": lag_monitor.probe_duration_ms,
+            "probe_interval_seconds": lag_monitor.interval_seconds,
+            "probe_errors": lag_monitor.probe_errors,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
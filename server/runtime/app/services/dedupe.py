@@ -0,0 +1,113 @@
+"""
+Sentinel Chat Platform - Outbox Deduplication
+
+Detects duplicate temp_outbox rows (client retries, file-queue replays,
+bot reconnects) so the drain can collapse them instead of delivering
+the same message to the primary server twice.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from app.config import settings
+from app.models.outbox import TempOutbox
+
+COLLAPSE_REASON_DUPLICATE = "duplicate_content"
+
+
+class OutboxDeduplicator:
+    """
+    Bounded, time-windowed seen-set of message content hashes per room.
+    
+    A row is a duplicate when a different row with the same content hash
+    was queued in the same room no more than window_seconds earlier.
+    Windows are measured on queued_at, so results do not depend on when
+    the drain happens to run. Each room keeps at most max_keys_per_room
+    hashes and at most max_rooms rooms are tracked (least recently used
+    rooms are evicted first).
+    """
+    
+    def __init__(self, window_seconds: float, max_keys_per_room: int, max_rooms: int):
+        self.window_seconds = window_seconds
+        self.max_keys_per_room = max_keys_per_room
+        self.max_rooms = max_rooms
+        self.collapsed_total = 0
+        # room_id -> OrderedDict(content_hash -> (message_id, queued_at))
+        self._rooms: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def content_hash(message: TempOutbox) -> str:
+        """Hash the normalized delivery payload of a message"""
+        normalized = "\x1f".join((
+            message.room_id,
+            message.sender_handle.strip(),
+            str(message.filter_version),
+            "".join(message.cipher_blob.split()),
+        ))
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def check(self, message: TempOutbox) -> Optional[int]:
+        """
+        Record a message and report whether it duplicates an earlier one.
+        
+        Args:
+            message: TempOutbox row about to be delivered
+        
+        Returns:
+            ID of the original message if this row is a duplicate, else None
+        """
+        digest = self.content_hash(message)
+        queued_at = message.queued_at or datetime.utcnow()
+        
+        with self._lock:
+            seen = self._rooms.get(message.room_id)
+            if seen is None:
+                seen = OrderedDict()
+                self._rooms[message.room_id] = seen
+                if len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+            else:
+                self._rooms.move_to_end(message.room_id)
+            
+            self._expire(seen, queued_at)
+            
+            original = seen.get(digest)
+            if original is not None and original[0] != message.id:
+                age = (queued_at - original[1]).total_seconds()
+                if 0 <= age <= self.window_seconds:
+                    self.collapsed_total += 1
+                    return original[0]
+            
+            seen[digest] = (message.id, queued_at)
+            seen.move_to_end(digest)
+            if len(seen) > self.max_keys_per_room:
+                seen.popitem(last=False)
+            return None
+    
+    def _expire(self, seen: OrderedDict, now: datetime) -> None:
+        """Drop hashes that fell out of the window (oldest first)"""
+        while seen:
+            _, (_, queued_at) = next(iter(seen.items()))
+            if (now - queued_at).total_seconds() <= self.window_seconds:
+                break
+            seen.popitem(last=False)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rooms_tracked": len(self._rooms),
+                "hashes_tracked": sum(len(seen) for seen in self._rooms.values()),
+                "collapsed_total": self.collapsed_total,
+                "window_seconds": self.window_seconds,
+            }
+
+
+# Process-wide seen-set shared by every drain batch
+outbox_deduplicator = OutboxDeduplicator(
+    window_seconds=settings.DEDUPE_WINDOW_SECONDS,
+    max_keys_per_room=settings.DEDUPE_MAX_KEYS_PER_ROOM,
+    max_rooms=settings.DEDUPE_MAX_ROOMS,
+)
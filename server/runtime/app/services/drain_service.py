@@ -5,19 +5,113 @@ Business logic for draining messages from temporary outbox
 and delivering them to the primary NestJS server.
 """
 
+import threading
+import time
 import httpx
 from sqlalchemy.orm import Session
 from app.models.outbox import TempOutbox
 from app.config import settings
+from app.services.dedupe import COLLAPSE_REASON_DUPLICATE, outbox_deduplicator
+from app.services.tracing import DeliverySpan, delivery_tracer
 from datetime import datetime
+from typing import Optional
+
+
+class DrainCoordinator:
+    """
+    Process-wide drain lifecycle state used for graceful shutdown.
+    
+    Once a stop is requested no new batches may start; batches already
+    running keep delivering until the grace deadline passes, then stop
+    and commit whatever was delivered. Undelivered rows are left pending
+    untouched, so there is nothing to release for the next instance.
+    """
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active_batches = 0
+        self._stop_deadline: Optional[float] = None
+    
+    @property
+    def stopping(self) -> bool:
+        return self._stop_deadline is not None
+    
+    def request_stop(self, grace_seconds: float) -> None:
+        """Stop accepting new batches and start the grace period"""
+        with self._condition:
+            if self._stop_deadline is None:
+                self._stop_deadline = time.monotonic() + grace_seconds
+    
+    def should_abandon(self) -> bool:
+        """True once a stop was requested and the grace period is over"""
+        return (
+            self._stop_deadline is not None
+            and time.monotonic() >= self._stop_deadline
+        )
+    
+    def begin_batch(self) -> bool:
+        """Register a running batch; refused while stopping"""
+        with self._condition:
+            if self.stopping:
+                return False
+            self._active_batches += 1
+            return True
+    
+    def end_batch(self) -> None:
+        with self._condition:
+            self._active_batches -= 1
+            self._condition.notify_all()
+    
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Block until no batch is running.
+        
+        Returns:
+            True if all batches finished within the timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._active_batches == 0, timeout=timeout
+            )
+
+
+# Process-wide coordinator shared by routes and the shutdown hook
+drain_coordinator = DrainCoordinator()
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared, connection-pooled client for primary delivery"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(
+                timeout=settings.DELIVERY_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.DELIVERY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DELIVERY_MAX_CONNECTIONS,
+                ),
+            )
+        return _http_client
+
+
+def close_http_client() -> None:
+    """Close the shared delivery client and its pooled connections"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
 
 
 class DrainService:
     """
     Service for draining messages from temporary outbox.
     
-    Retrieves pending messages, attempts to deliver them to the
-    primary server, and marks them as delivered on success.
+    Retrieves pending messages, collapses duplicates, attempts to deliver
+    the rest to the primary server, and marks them as delivered on success.
     """
     
     def __init__(self, db: Session):
@@ -29,12 +123,30 @@ class DrainService:
         """
         Drain a batch of pending messages.
         
+        Delivered IDs are committed every DRAIN_COMMIT_EVERY messages, so
+        an interrupted batch only redelivers its uncommitted tail.
+        
         Args:
             batch_size: Maximum number of messages to process
-            
+        
         Returns:
             Dictionary with processing results
         """
+        if not drain_coordinator.begin_batch():
+            return {
+                "processed": 0,
+                "delivered": 0,
+                "failed": 0,
+                "collapsed": 0,
+                "abandoned": 0,
+            }
+        
+        try:
+            return self._drain_batch(batch_size)
+        finally:
+            drain_coordinator.end_batch()
+    
+    def _drain_batch(self, batch_size: int) -> dict:
         # Get pending messages
         pending_messages = (
             self.db.query(TempOutbox)
@@ -46,74 +158,142 @@ class DrainService:
             .limit(batch_size)
             .all()
         )
+        claimed_at = time.time()
         
         if not pending_messages:
             return {
                 "processed": 0,
                 "delivered": 0,
                 "failed": 0,
+                "collapsed": 0,
+                "abandoned": 0,
             }
         
-        delivered_ids = []
+        uncommitted_ids = []
+        delivered_count = 0
         failed_ids = []
+        collapsed = []
+        processed = 0
         
-        # Attempt to deliver each message
-        for message in pending_messages:
-            try:
-                if self._deliver_to_primary(message):
-                    delivered_ids.append(message.id)
+        try:
+            # Attempt to deliver each message
+            for message in pending_messages:
+                if drain_coordinator.should_abandon():
+                    break
+                
+                processed += 1
+                if settings.DEDUPE_ENABLED:
+                    original_id = outbox_deduplicator.check(message)
+                    if original_id is not None:
+                        collapsed.append((message.id, original_id))
+                        continue
+                
+                span = delivery_tracer.start_span(message, claimed_at)
+                delivered = False
+                try:
+                    delivered = self.deliver_to_primary(message, span)
+                except Exception as e:
+                    # Log error but continue processing
+                    print(f"Error delivering message {message.id}: {e}")
+                delivery_tracer.finish(span, delivered)
+                
+                if delivered:
+                    uncommitted_ids.append(message.id)
+                    delivered_count += 1
                 else:
                     failed_ids.append(message.id)
-            except Exception as e:
-                # Log error but continue processing
-                print(f"Error delivering message {message.id}: {e}")
-                failed_ids.append(message.id)
+                
+                if len(uncommitted_ids) >= settings.DRAIN_COMMIT_EVERY:
+                    self._mark_delivered(uncommitted_ids)
+                    uncommitted_ids = []
+        finally:
+            # Mark delivered and collapsed messages
+            self._mark_delivered(uncommitted_ids)
+            self._mark_collapsed(collapsed)
+            delivery_tracer.flush()
         
-        # Mark delivered messages
-        if delivered_ids:
-            (
-                self.db.query(TempOutbox)
-                .filter(TempOutbox.id.in_(delivered_ids))
-                .update(
-                    {"delivered_at": datetime.utcnow()},
-                    synchronize_session=False,
-                )
-            )
-            self.db.commit()
+        abandoned = len(pending_messages) - processed
+        if abandoned:
+            print(f"Drain stopped for shutdown; {abandoned} message(s) left pending")
         
         return {
-            "processed": len(pending_messages),
-            "delivered": len(delivered_ids),
+            "processed": processed,
+            "delivered": delivered_count,
             "failed": len(failed_ids),
+            "collapsed": len(collapsed),
+            "abandoned": abandoned,
         }
     
-    def _deliver_to_primary(self, message: TempOutbox) -> bool:
+    def _mark_delivered(self, message_ids: list) -> None:
+        """Set delivered_at for the given IDs and commit"""
+        if not message_ids:
+            return
+        
+        (
+            self.db.query(TempOutbox)
+            .filter(TempOutbox.id.in_(message_ids))
+            .update(
+                {"delivered_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+        )
+        self.db.commit()
+    
+    def _mark_collapsed(self, collapsed: list) -> None:
+        """
+        Soft-delete duplicate rows so they are never sent.
+        
+        Args:
+            collapsed: List of (duplicate_id, original_id) tuples
+        """
+        if not collapsed:
+            return
+        
+        now = datetime.utcnow()
+        self.db.bulk_update_mappings(
+            TempOutbox,
+            [
+                {
+                    "id": duplicate_id,
+                    "deleted_at": now,
+                    "collapse_reason": COLLAPSE_REASON_DUPLICATE,
+                    "collapsed_into": original_id,
+                }
+                for duplicate_id, original_id in collapsed
+            ],
+        )
+        self.db.commit()
+    
+    def deliver_to_primary(self, message: TempOutbox, span: Optional[DeliverySpan] = None) -> bool:
         """
         Deliver a single message to the primary server.
         
         Args:
             message: TempOutbox instance to deliver
-            
+            span: Optional trace span to stamp with send/ack times
+        
         Returns:
             True if delivery succeeded, False otherwise
         """
         try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.post(
-                    f"{self.primary_server_url}/api/messaging/rooms/{message.room_id}/messages",
-                    json={
-                        "sender_handle": message.sender_handle,
-                        "cipher_blob": message.cipher_blob,
-                        "filter_version": message.filter_version,
-                    },
-                    headers={
-                        "X-API-SECRET": self.api_secret,
-                        "Content-Type": "application/json",
-                    },
-                )
-                
-                return response.status_code == 200
+            if span is not None:
+                span.sent_at = time.time()
+            response = get_http_client().post(
+                f"{self.primary_server_url}/api/messaging/rooms/{message.room_id}/messages",
+                json={
+                    "sender_handle": message.sender_handle,
+                    "cipher_blob": message.cipher_blob,
+                    "filter_version": message.filter_version,
+                },
+                headers={
+                    "X-API-SECRET": self.api_secret,
+                    "Content-Type": "application/json",
+                },
+            )
+            if span is not None:
+                span.acked_at = time.time()
+            
+            return response.status_code == 200
         except Exception as e:
             print(f"Failed to deliver message {message.id}: {e}")
             return False
-
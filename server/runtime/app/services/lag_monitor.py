@@ -0,0 +1,185 @@
+"""
+Sentinel Chat Platform - Queue-Age Lag Monitor
+
+Tracks how long the oldest undelivered message in each room has been
+waiting in temp_outbox and raises SLO alarms when it grows too old.
+
+Ages come from a periodic MIN(queued_at) ... GROUP BY room_id probe over
+pending rows. The query is answered from idx_outbox_pending_age, so its
+cost scales with the number of pending rooms rather than table size.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.outbox import TempOutbox
+
+STATUS_OK = "ok"
+STATUS_WARN = "warn"
+STATUS_CRITICAL = "critical"
+
+
+class LagMonitor:
+    """
+    Periodic per-room pending-age prober with edge-triggered alarms.
+    
+    The latest probe result is kept in memory; ages are derived from the
+    stored oldest queued_at at read time, so they keep growing between
+    probes exactly as a stuck room would.
+    """
+    
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval_seconds: float,
+        warn_seconds: float,
+        critical_seconds: float,
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.warn_seconds = warn_seconds
+        self.critical_seconds = critical_seconds
+        self.oldest_pending: Dict[str, datetime] = {}
+        self.probed_at: Optional[datetime] = None
+        self.probe_duration_ms: Optional[float] = None
+        self.probe_errors = 0
+        self._alarm_levels: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def classify(self, age_seconds: float) -> str:
+        """Map a pending age to its SLO status"""
+        if age_seconds >= self.critical_seconds:
+            return STATUS_CRITICAL
+        if age_seconds >= self.warn_seconds:
+            return STATUS_WARN
+        return STATUS_OK
+    
+    def probe(self) -> None:
+        """Refresh the oldest pending queued_at for every room"""
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(TempOutbox.room_id, func.min(TempOutbox.queued_at))
+                .filter(
+                    TempOutbox.delivered_at.is_(None),
+                    TempOutbox.deleted_at.is_(None),
+                )
+                .group_by(TempOutbox.room_id)
+                .all()
+            )
+        finally:
+            db.close()
+        
+        self.oldest_pending = {room_id: oldest for room_id, oldest in rows}
+        self.probed_at = datetime.utcnow()
+        self.probe_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._evaluate_alarms()
+    
+    def _evaluate_alarms(self) -> None:
+        """Log SLO transitions (raised, escalated, cleared) per room"""
+        now = datetime.utcnow()
+        levels = {}
+        for room_id, oldest in self.oldest_pending.items():
+            status = self.classify((now - oldest).total_seconds())
+            if status != STATUS_OK:
+                levels[room_id] = status
+        
+        for room_id, status in levels.items():
+            if self._alarm_levels.get(room_id) != status:
+                age = (now - self.oldest_pending[room_id]).total_seconds()
+                print(
+                    f"[LAG] {status.upper()}: room {room_id} oldest pending "
+                    f"message is {age:.0f}s old"
+                )
+        for room_id in self._alarm_levels.keys() - levels.keys():
+            print(f"[LAG] CLEARED: room {room_id} is back within SLO")
+        
+        self._alarm_levels = levels
+    
+    @property
+    def running(self) -> bool:
+        """Whether the background probe loop is active"""
+        return self._task is not None and not self._task.done()
+    
+    def needs_probe(self) -> bool:
+        """
+        Whether a reader should probe before trusting the stored result.
+        
+        True when nothing has been probed yet, the last probe is older than
+        the probe interval, or no background loop is keeping it current.
+        """
+        if self.probed_at is None or not self.running:
+            return True
+        age = (datetime.utcnow() - self.probed_at).total_seconds()
+        return age > self.interval_seconds
+    
+    def worst_rooms(self, limit: int) -> List[dict]:
+        """
+        Rooms with pending messages, oldest first.
+        
+        Args:
+            limit: Maximum number of rooms to return
+        
+        Returns:
+            List of room lag dictionaries sorted by age descending
+        """
+        now = datetime.utcnow()
+        ranked = sorted(self.oldest_pending.items(), key=lambda item: item[1])[:limit]
+        rooms = []
+        for room_id, oldest in ranked:
+            age = max((now - oldest).total_seconds(), 0.0)
+            rooms.append({
+                "room_id": room_id,
+                "oldest_queued_at": oldest.isoformat(),
+                "age_seconds": round(age, 1),
+                "status": self.classify(age),
+            })
+        return rooms
+    
+    def breaching_count(self) -> int:
+        """Number of rooms currently outside the warn threshold"""
+        now = datetime.utcnow()
+        return sum(
+            1 for oldest in self.oldest_pending.values()
+            if (now - oldest).total_seconds() >= self.warn_seconds
+        )
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.probe)
+            except Exception as e:
+                self.probe_errors += 1
+                print(f"[LAG] Probe failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+    
+    def start(self) -> None:
+        """Start the background probe loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Cancel the background probe loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Process-wide monitor shared by the startup hook and /drain/lag
+lag_monitor = LagMonitor(
+    SessionLocal,
+    interval_seconds=settings.LAG_PROBE_INTERVAL_SECONDS,
+    warn_seconds=settings.LAG_SLO_WARN_SECONDS,
+    critical_seconds=settings.LAG_SLO_CRITICAL_SECONDS,
+)
@@ -0,0 +1,205 @@
+"""
+Sentinel Chat Platform - Delivery Tracing
+
+Lightweight, sampled latency spans for outbox deliveries, from the
+moment a row was queued to the primary server's acknowledgement.
+
+Span timestamps:
+    queued  - temp_outbox.queued_at (set by the database on insert)
+    claimed - row selected by drain_batch
+    sent    - HTTP request to the primary server started
+    acked   - HTTP response received
+"""
+
+import json
+import math
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from app.config import settings
+from app.models.outbox import TempOutbox
+
+# Stage name -> (start attribute, end attribute)
+STAGES = {
+    "queue_wait": ("queued_at", "claimed_at"),
+    "dispatch": ("claimed_at", "sent_at"),
+    "delivery": ("sent_at", "acked_at"),
+    "total": ("queued_at", "acked_at"),
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Exported spans are buffered and appended in batches of this size
+EXPORT_FLUSH_SIZE = 100
+
+
+class DeliverySpan:
+    """Timing record for a single message delivery (epoch seconds)"""
+    
+    __slots__ = (
+        "message_id", "room_id", "queued_at", "claimed_at",
+        "sent_at", "acked_at", "success",
+    )
+    
+    def __init__(self, message: TempOutbox, claimed_at: float):
+        self.message_id = message.id
+        self.room_id = message.room_id
+        # queued_at is a naive UTC timestamp from the database
+        self.queued_at = (
+            message.queued_at.replace(tzinfo=timezone.utc).timestamp()
+            if message.queued_at else None
+        )
+        self.claimed_at = claimed_at
+        self.sent_at: Optional[float] = None
+        self.acked_at: Optional[float] = None
+        self.success = False
+    
+    def stage_ms(self, stage: str) -> Optional[float]:
+        """Duration of a stage in milliseconds, if both ends are known"""
+        start_attr, end_attr = STAGES[stage]
+        start = getattr(self, start_attr)
+        end = getattr(self, end_attr)
+        if start is None or end is None:
+            return None
+        return round((end - start) * 1000, 2)
+    
+    def to_dict(self) -> dict:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            if ts is None:
+                return None
+            return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+        
+        return {
+            "message_id": self.message_id,
+            "room_id": self.room_id,
+            "success": self.success,
+            "queued_at": iso(self.queued_at),
+            "claimed_at": iso(self.claimed_at),
+            "sent_at": iso(self.sent_at),
+            "acked_at": iso(self.acked_at),
+            "stages_ms": {stage: self.stage_ms(stage) for stage in STAGES},
+        }
+
+
+class DeliveryTracer:
+    """
+    Sampled ring buffer of delivery spans.
+    
+    Only a TRACE_SAMPLE_RATE fraction of messages get a span, and only the
+    most recent buffer_size spans are kept, so tracing cost stays flat under
+    load. Finished spans can also be appended to a JSON lines file; they
+    are buffered and written in batches through one open handle, outside
+    the buffer lock, so the request path never waits on file I/O.
+    """
+    
+    def __init__(self, enabled: bool, sample_rate: float, buffer_size: int, export_path: str = ""):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.export_path = export_path
+        self.recorded_total = 0
+        self._spans: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._export_pending: List[str] = []
+        self._export_file = None
+        self._export_lock = threading.Lock()
+    
+    def start_span(self, message: TempOutbox, claimed_at: float) -> Optional[DeliverySpan]:
+        """Create a span for a claimed message if it is sampled"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return DeliverySpan(message, claimed_at)
+    
+    def finish(self, span: Optional[DeliverySpan], success: bool) -> None:
+        """Store a finished span (no-op for unsampled messages)"""
+        if span is None:
+            return
+        
+        span.success = success
+        line = json.dumps(span.to_dict()) + "\n" if self.export_path else None
+        batch = None
+        with self._lock:
+            self._spans.append(span)
+            self.recorded_total += 1
+            if line is not None:
+                self._export_pending.append(line)
+                if len(self._export_pending) >= EXPORT_FLUSH_SIZE:
+                    batch, self._export_pending = self._export_pending, []
+        
+        if batch:
+            self._write_export(batch)
+    
+    def flush(self) -> None:
+        """Append buffered spans to the export file"""
+        with self._lock:
+            batch, self._export_pending = self._export_pending, []
+        if batch:
+            self._write_export(batch)
+    
+    def close(self) -> None:
+        """Flush buffered spans and close the export file"""
+        self.flush()
+        with self._export_lock:
+            if self._export_file is not None:
+                self._export_file.close()
+                self._export_file = None
+    
+    def _write_export(self, lines: List[str]) -> None:
+        with self._export_lock:
+            try:
+                if self._export_file is None:
+                    self._export_file = open(self.export_path, "a", encoding="utf-8")
+                self._export_file.writelines(lines)
+                self._export_file.flush()
+            except OSError as e:
+                print(f"Failed to export {len(lines)} trace span(s): {e}")
+    
+    def recent(self, limit: int) -> List[DeliverySpan]:
+        """Most recent spans, newest first"""
+        with self._lock:
+            spans = list(self._spans)
+        return spans[::-1][:limit]
+    
+    def stage_percentiles(self) -> Dict[str, dict]:
+        """Per-stage latency percentiles over successful buffered spans"""
+        with self._lock:
+            spans = [span for span in self._spans if span.success]
+        
+        summary = {}
+        for stage in STAGES:
+            values = sorted(
+                value for value in (span.stage_ms(stage) for span in spans)
+                if value is not None
+            )
+            stats = {"count": len(values)}
+            for p in PERCENTILES:
+                stats[f"p{p}"] = _percentile(values, p)
+            stats["max"] = values[-1] if values else None
+            summary[stage] = stats
+        return summary
+    
+    def export_jsonl(self) -> Iterator[str]:
+        """Yield every buffered span as a JSON line, oldest first"""
+        with self._lock:
+            spans = list(self._spans)
+        for span in spans:
+            yield json.dumps(span.to_dict()) + "\n"
+
+
+def _percentile(sorted_values: List[float], p: int) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+# Process-wide tracer shared by the drain service and /debug/traces
+delivery_tracer = DeliveryTracer(
+    enabled=settings.TRACE_ENABLED,
+    sample_rate=settings.TRACE_SAMPLE_RATE,
+    buffer_size=settings.TRACE_BUFFER_SIZE,
+    export_path=settings.TRACE_EXPORT_PATH,
+)
@@ -169,6 +169,52 @@ class MessageRepository
         return $messages;
     }
 
+    /**
+     * Get messages queued after a given message ID
+     * 
+     * Returns database messages with an ID above $sinceId in ascending ID
+     * order, so callers can page through everything they missed by passing
+     * the last ID of each page back in. File-storage messages have no
+     * numeric ID and are never included.
+     * 
+     * @param int $sinceId Only return messages with a higher ID
+     * @param int $limit Maximum number of messages to retrieve
+     * @param string|null $roomId Optional room filter
+     * @param bool $includeHidden Whether to include hidden messages (for moderators/admins)
+     * @return array Array of messages, oldest first
+     */
+    public function getMessagesSince(int $sinceId, int $limit = 100, ?string $roomId = null, bool $includeHidden = false): array
+    {
+        if (!DatabaseHealth::isAvailable()) {
+            return [];
+        }
+        
+        $limit = max(1, min(1000, (int)$limit)); // Sanitize limit
+        $sql = 'SELECT id, room_id, sender_handle, cipher_blob, filter_version, queued_at,
+                       is_hidden, edited_at, edited_by, original_cipher_blob, hidden_by
+                FROM temp_outbox
+                WHERE id > :since_id
+                  AND deleted_at IS NULL';
+        $params = [':since_id' => $sinceId];
+        
+        if ($roomId !== null) {
+            $sql .= ' AND room_id = :room_id';
+            $params[':room_id'] = $roomId;
+        }
+        if (!$includeHidden) {
+            $sql .= ' AND is_hidden = FALSE';
+        }
+        
+        $sql .= ' ORDER BY id ASC LIMIT ' . (string)$limit;
+        
+        try {
+            return Database::query($sql, $params);
+        } catch (\Exception $e) {
+            error_log('Database query failed: ' . $e->getMessage());
+            return [];
+        }
+    }
+
     /**
      * Mark messages as delivered
      * 
@@ -0,0 +1,73 @@
+"""
+Sentinel Chat Platform - Python Unit Test Fixtures
+
+Loads the Python components for the unit tests in this directory:
+chatbot-bot.py and websocket-server-python.py (script names with dashes,
+so they are loaded from their file paths) and the runtime service package
+under server/runtime.
+
+Run from the repository root:
+    python -m pytest tests/python
+
+Tests skip themselves when a component's dependencies
+(requirements-bot.txt, server/runtime/requirements.txt) are not installed.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'server', 'runtime'))
+
+
+def load_script(module_name, filename, cwd=None):
+    """Import a top-level script by path, once per test session"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    previous_cwd = os.getcwd()
+    if cwd is not None:
+        os.chdir(cwd)
+    try:
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(module_name, None)
+        raise
+    finally:
+        os.chdir(previous_cwd)
+    return module
+
+
+@pytest.fixture(scope='session')
+def chatbot(tmp_path_factory):
+    """chatbot-bot.py as a module (its log file goes to a temporary directory)"""
+    pytest.importorskip('httpx')
+    pytest.importorskip('websockets')
+    return load_script('chatbot_bot', 'chatbot-bot.py', cwd=tmp_path_factory.mktemp('chatbot'))
+
+
+@pytest.fixture(scope='session')
+def supervisor():
+    """websocket-server-python.py as a module"""
+    return load_script('websocket_server_python', 'websocket-server-python.py')
+
+
+@pytest.fixture
+def supervisor_log(supervisor, monkeypatch):
+    """Capture supervisor log lines instead of writing logs/websocket-python.log"""
+    lines = []
+    monkeypatch.setattr(supervisor, 'log_to_file', lines.append)
+    return lines
+
+
+@pytest.fixture
+def bot_config(chatbot):
+    """Default ChatBot configuration without persisted state or a disk cache"""
+    return dict(chatbot.CONFIG, state_file='', cache_path='', intents_file='', personas_file='',
+                response_delay=0, ai_provider='simple')
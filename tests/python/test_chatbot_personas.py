@@ -0,0 +1,75 @@
+"""
+Tests for load_personas (chatbot-bot.py): how CONFIG, the personas file
+"defaults" and each persona are merged for a multi-bot host.
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def personas_file(tmp_path, bot_config):
+    """Write a personas file and return the config that points at it"""
+    def write(data):
+        path = tmp_path / 'personas.json'
+        path.write_text(json.dumps(data), encoding='utf-8')
+        return dict(bot_config, personas_file=str(path))
+    return write
+
+
+def test_without_file_runs_a_single_persona_from_config(chatbot, bot_config):
+    personas = chatbot.load_personas(bot_config)
+    
+    assert personas == [bot_config]
+    assert personas[0] is not bot_config
+
+
+def test_persona_overrides_defaults_which_override_config(chatbot, personas_file):
+    config = personas_file({
+        'defaults': {'ai_provider': 'ollama', 'response_delay': 1.5},
+        'personas': [
+            {'bot_handle': 'Helper', 'rooms': ['lobby', 'help'], 'response_delay': 0.5},
+            {'bot_handle': 'Trivia'},
+        ],
+    })
+    helper, trivia = chatbot.load_personas(config)
+    
+    assert helper['bot_handle'] == 'Helper'
+    assert helper['rooms'] == ['lobby', 'help']
+    assert helper['response_delay'] == 0.5
+    assert helper['ai_provider'] == 'ollama'
+    assert trivia['response_delay'] == 1.5
+    assert trivia['default_room'] == config['default_room']
+    assert 'rooms' not in trivia
+
+
+def test_host_settings_ignore_persona_overrides(chatbot, personas_file):
+    config = personas_file({
+        'defaults': {'cache_ttl': 60},
+        'personas': [
+            {'bot_handle': 'Helper', 'api_base_url': 'http://elsewhere', 'cache_ttl': 5, 'ws_port': 1},
+        ],
+    })
+    [helper] = chatbot.load_personas(config)
+    
+    # Shared connections and caches come from CONFIG and the file defaults only
+    assert helper['api_base_url'] == config['api_base_url']
+    assert helper['ws_port'] == config['ws_port']
+    assert helper['cache_ttl'] == 60
+    for key in chatbot.HOST_CONFIG_KEYS:
+        assert key in helper
+
+
+def test_persona_without_handle_is_rejected(chatbot, personas_file):
+    config = personas_file({'personas': [{'bot_handle': 'Helper'}, {'rooms': ['lobby']}]})
+    
+    with pytest.raises(ValueError, match='bot_handle'):
+        chatbot.load_personas(config)
+
+
+def test_file_without_personas_is_rejected(chatbot, personas_file):
+    config = personas_file({'defaults': {'ai_provider': 'ollama'}})
+    
+    with pytest.raises(ValueError, match='No personas'):
+        chatbot.load_personas(config)
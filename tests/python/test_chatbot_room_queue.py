@@ -0,0 +1,133 @@
+"""
+Tests for the ChatBot's per-room pipeline (chatbot-bot.py): messages are
+answered in order within a room, rooms are answered concurrently and a
+full room queue drops its oldest message.
+"""
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def quick_workers(chatbot, monkeypatch):
+    """Let idle room workers exit right away"""
+    monkeypatch.setattr(chatbot, 'ROOM_WORKER_IDLE_TIMEOUT', 0.05)
+
+
+def record_batches(bot, delay=0.0, gates=None):
+    """Replace process_batch with one that records (room, texts) batches"""
+    batches = []
+    
+    async def process_batch(room_id, batch):
+        if gates and room_id in gates:
+            await gates[room_id].wait()
+        await asyncio.sleep(delay)
+        batches.append((room_id, [text for _, _, text, _ in batch]))
+    
+    bot.process_batch = process_batch
+    return batches
+
+
+async def wait_idle(bot, timeout=2):
+    """Wait until every room worker has exited"""
+    async def idle():
+        while bot.room_workers:
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(idle(), timeout)
+
+
+def test_messages_in_a_room_are_processed_in_order(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(bot_config)
+        batches = record_batches(bot, delay=0.02)
+        for n in range(10):
+            bot.enqueue_message('lobby', 'alice', f'm{n}')
+            await asyncio.sleep(0.005)
+        await wait_idle(bot)
+        await bot.close()
+        return batches
+    
+    batches = asyncio.run(run())
+    assert [text for _, texts in batches for text in texts] == [f'm{n}' for n in range(10)]
+    # Messages that arrived while a reply was generated formed one batch
+    assert 1 < len(batches) < 10
+
+
+def test_one_worker_per_room(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(bot_config)
+        record_batches(bot)
+        bot.enqueue_message('lobby', 'alice', 'one')
+        worker = bot.room_workers['lobby']
+        bot.enqueue_message('lobby', 'bob', 'two')
+        same_worker = bot.room_workers['lobby'] is worker
+        await wait_idle(bot)
+        queues_left = dict(bot.room_queues)
+        await bot.close()
+        return same_worker, queues_left
+    
+    same_worker, queues_left = asyncio.run(run())
+    assert same_worker
+    assert queues_left == {}
+
+
+def test_slow_room_does_not_block_other_rooms(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(bot_config)
+        slow = asyncio.Event()
+        batches = record_batches(bot, gates={'slow': slow})
+        bot.enqueue_message('slow', 'alice', 'waiting')
+        bot.enqueue_message('fast', 'bob', 'quick')
+        await asyncio.sleep(0.05)
+        before_release = list(batches)
+        slow.set()
+        await wait_idle(bot)
+        await bot.close()
+        return before_release, batches
+    
+    before_release, batches = asyncio.run(run())
+    assert before_release == [('fast', ['quick'])]
+    assert batches == [('fast', ['quick']), ('slow', ['waiting'])]
+
+
+def test_full_room_queue_drops_oldest_message(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(dict(bot_config, room_queue_size=2))
+        batches = record_batches(bot)
+        # Queued before the worker gets to run
+        for text in ('first', 'second', 'third'):
+            bot.enqueue_message('lobby', 'alice', text)
+        await wait_idle(bot)
+        await bot.close()
+        return bot.stats['dropped'], batches
+    
+    dropped, batches = asyncio.run(run())
+    assert dropped == 1
+    assert batches == [('lobby', ['second', 'third'])]
+
+
+def test_worker_restarts_after_going_idle(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(bot_config)
+        batches = record_batches(bot)
+        bot.enqueue_message('lobby', 'alice', 'before')
+        await wait_idle(bot)
+        bot.enqueue_message('lobby', 'alice', 'after')
+        await wait_idle(bot)
+        await bot.close()
+        return batches
+    
+    assert asyncio.run(run()) == [('lobby', ['before']), ('lobby', ['after'])]
+
+
+def test_close_cancels_busy_workers(chatbot, bot_config, quick_workers):
+    async def run():
+        bot = chatbot.ChatBot(bot_config)
+        record_batches(bot, gates={'lobby': asyncio.Event()})
+        bot.enqueue_message('lobby', 'alice', 'never answered')
+        await asyncio.sleep(0.01)
+        await bot.close()
+        return bot.room_workers, bot.room_queues
+    
+    assert asyncio.run(run()) == ({}, {})
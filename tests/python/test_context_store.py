@@ -0,0 +1,101 @@
+"""
+Tests for ContextStore (chatbot-bot.py): the per-room ring buffer, LRU
+room eviction under the room and byte caps, and history selection by
+sequence number and token budget.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def store(chatbot):
+    return chatbot.ContextStore(messages_per_room=3, max_rooms=10, max_bytes=0)
+
+
+def test_record_returns_increasing_sequence_numbers(store):
+    assert [store.record('lobby', 'alice', text) for text in 'abc'] == [1, 2, 3]
+    assert store.record('dev', 'bob', 'd') == 4
+
+
+def test_room_keeps_only_its_latest_messages(chatbot, store):
+    for n in range(5):
+        store.record('lobby', 'alice', f'm{n}')
+    
+    assert store.recent('lobby', None, token_budget=1000) == [('alice', 'm2'), ('alice', 'm3'), ('alice', 'm4')]
+    # Byte accounting follows what the ring buffer dropped
+    expected = 3 * (len('m0') + len('alice') + chatbot.ContextStore.ENTRY_OVERHEAD)
+    assert store.total_bytes == store.room_bytes['lobby'] == expected
+
+
+def test_recent_excludes_the_message_being_answered_and_later_ones(store):
+    store.record('lobby', 'alice', 'before')
+    seq = store.record('lobby', 'bob', 'question')
+    store.record('lobby', 'carol', 'after')
+    
+    assert store.recent('lobby', seq, token_budget=1000) == [('alice', 'before')]
+
+
+def test_token_budget_keeps_the_newest_messages(chatbot, store):
+    for text in ('aaaa', 'bbbb', 'cccc'):
+        store.record('lobby', 'u', text)
+    cost = chatbot.estimate_tokens('aaaa') + chatbot.estimate_tokens('u')
+    
+    assert store.recent('lobby', None, token_budget=2 * cost) == [('u', 'bbbb'), ('u', 'cccc')]
+    assert store.recent('lobby', None, token_budget=2 * cost - 1) == [('u', 'cccc')]
+    assert store.recent('lobby', None, token_budget=0) == []
+
+
+def test_unknown_room_has_no_history(store):
+    assert store.recent('nowhere', None, token_budget=1000) == []
+
+
+def test_idlest_room_is_evicted_at_the_room_cap(chatbot):
+    store = chatbot.ContextStore(messages_per_room=3, max_rooms=2, max_bytes=0)
+    store.record('a', 'u', 'one')
+    store.record('b', 'u', 'two')
+    store.recent('a', None, token_budget=100)  # Reading counts as activity
+    store.record('c', 'u', 'three')
+    
+    assert list(store.rooms) == ['a', 'c']
+    assert store.summary()['rooms_evicted'] == 1
+    assert store.total_bytes == sum(store.room_bytes.values())
+
+
+def test_byte_cap_evicts_idle_rooms_first(chatbot):
+    size = len('x' * 10) + len('u') + chatbot.ContextStore.ENTRY_OVERHEAD
+    store = chatbot.ContextStore(messages_per_room=10, max_rooms=10, max_bytes=3 * size)
+    for room_id in ('a', 'b', 'c'):
+        store.record(room_id, 'u', 'x' * 10)
+    store.record('c', 'u', 'x' * 10)
+    
+    assert list(store.rooms) == ['b', 'c']
+    assert store.total_bytes == 3 * size
+
+
+def test_byte_cap_shrinks_the_only_active_room(chatbot):
+    size = len('x' * 10) + len('u') + chatbot.ContextStore.ENTRY_OVERHEAD
+    store = chatbot.ContextStore(messages_per_room=10, max_rooms=10, max_bytes=2 * size)
+    for _ in range(5):
+        store.record('lobby', 'u', 'x' * 10)
+    
+    assert len(store.rooms['lobby']) == 2
+    assert store.total_bytes == 2 * size
+
+
+def test_oversized_message_is_still_kept(chatbot):
+    store = chatbot.ContextStore(messages_per_room=10, max_rooms=10, max_bytes=50)
+    store.record('lobby', 'u', 'x' * 200)
+    
+    assert store.recent('lobby', None, token_budget=1000) == [('u', 'x' * 200)]
+
+
+def test_history_is_part_of_the_fingerprint_unless_context_free(chatbot, bot_config):
+    bot = chatbot.ChatBot(dict(bot_config, cache_context_free_intents='greetings'))
+    history = [('alice', 'earlier message')]
+    
+    assert bot.context_fingerprint('m', history) != bot.context_fingerprint('m', [])
+    assert bot.is_context_free('hello there')
+    assert not bot.is_context_free('what do you think of it?')
+    
+    bot = chatbot.ChatBot(dict(bot_config, cache_context_free_intents=''))
+    assert not bot.is_context_free('hello there')
@@ -0,0 +1,362 @@
+"""
+Tests for the native fan-out server (WS_MODE=native in
+websocket-server-python.py): RFC 6455 framing, close handling, send-queue
+backpressure and the websocket-server.js protocol messages that js/app.js
+and chatbot-bot.py rely on.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+SECRET = 'test-secret'
+
+
+def frame(supervisor, payload, opcode=0x1, fin=True, mask=True):
+    """Encode a client frame; fin=False leaves the FIN bit clear"""
+    data = supervisor.encode_frame(payload, opcode=opcode, mask=mask)
+    return data if fin else bytes([data[0] & 0x7F]) + data[1:]
+
+
+def read(supervisor, data, **options):
+    """Run read_frame over a stream holding the given bytes"""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await supervisor.read_frame(reader, **options)
+    return asyncio.run(run())
+
+
+class Client:
+    """Raw websocket client speaking to the fan-out server"""
+    
+    def __init__(self, supervisor, reader, writer):
+        self.supervisor = supervisor
+        self.reader = reader
+        self.writer = writer
+    
+    @classmethod
+    async def connect(cls, supervisor, port, user_handle='alice', room_id='lobby', secret=SECRET):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(
+            f"GET /?user_handle={user_handle}&room_id={room_id}&api_secret={secret} HTTP/1.1\r\n"
+            "Host: 127.0.0.1\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n".encode()
+        )
+        response = await reader.readuntil(b'\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 101 ')
+        assert b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in response
+        return cls(supervisor, reader, writer)
+    
+    def send(self, payload, **options):
+        self.writer.write(frame(self.supervisor, payload, **options))
+    
+    def send_json(self, message):
+        self.send(json.dumps(message).encode())
+    
+    async def frame(self):
+        _, opcode, payload = await self.supervisor.read_frame(self.reader)
+        return opcode, payload
+    
+    async def receive(self, message_type):
+        """Next JSON message of the given type (earlier messages and pongs are skipped)"""
+        while True:
+            opcode, payload = await self.frame()
+            if opcode == 0xA:
+                continue
+            assert opcode == 0x1, f"expected text, got opcode {opcode}"
+            message = json.loads(payload)
+            if message['type'] == message_type:
+                return message
+    
+    async def close_code(self):
+        """Status code of the server's close frame (text frames before it are skipped)"""
+        while True:
+            opcode, payload = await self.frame()
+            if opcode == 0x8:
+                return int.from_bytes(payload[:2], 'big') if payload else None
+
+
+def serve(supervisor, scenario, queue_size=16):
+    """Run scenario(port, fanout) against a FanoutServer behind the port 4291 handler"""
+    async def run():
+        fanout = supervisor.FanoutServer(SECRET, queue_size)
+        supervisor.fanout_server = fanout
+        server = await asyncio.start_server(supervisor.handle_http_client, '127.0.0.1', 0)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            await asyncio.wait_for(scenario(port, fanout), timeout=5)
+        finally:
+            await fanout.close()
+            server.close()
+            await server.wait_closed()
+    asyncio.run(run())
+
+
+@pytest.fixture
+def native(supervisor, supervisor_log, monkeypatch):
+    monkeypatch.setattr(supervisor, 'fanout_server', None)
+    monkeypatch.setattr(supervisor, 'NATIVE_CLOSE_TIMEOUT', 0.5)
+    return supervisor
+
+
+@pytest.mark.parametrize('length', [0, 125, 126, 65535, 65536])
+@pytest.mark.parametrize('mask', [False, True])
+def test_frame_lengths_round_trip(supervisor, length, mask):
+    payload = bytes(range(256)) * (length // 256) + bytes(length % 256)
+    data = supervisor.encode_frame(payload, opcode=0x2, mask=mask)
+    
+    header = 2 + (0 if length < 126 else 2 if length < 65536 else 8)
+    assert data[1] & 0x7F == (length if length < 126 else 126 if length < 65536 else 127)
+    assert len(data) == header + (4 if mask else 0) + length
+    assert read(supervisor, data, max_size=1 << 20) == (True, 0x2, payload)
+
+
+def test_unmasked_frame_is_rejected_when_a_mask_is_required(supervisor):
+    with pytest.raises(supervisor.WebSocketProtocolError) as error:
+        read(supervisor, frame(supervisor, b'{}', mask=False), require_mask=True)
+    assert error.value.code == 1002
+
+
+def test_frame_over_the_limit_is_rejected_before_its_payload(supervisor):
+    # Only the header is available: the limit must apply before reading the body
+    header = bytes([0x81, 0x80 | 127]) + (1 << 40).to_bytes(8, 'big')
+    with pytest.raises(supervisor.WebSocketProtocolError) as error:
+        read(supervisor, header, max_size=1024)
+    assert error.value.code == 1009
+
+
+def test_reserved_bits_are_rejected(supervisor):
+    data = bytearray(frame(supervisor, b'x'))
+    data[0] |= 0x40
+    with pytest.raises(supervisor.WebSocketProtocolError):
+        read(supervisor, bytes(data))
+
+
+def test_fin_bit_is_reported(supervisor):
+    assert read(supervisor, frame(supervisor, b'part', fin=False)) == (False, 0x1, b'part')
+
+
+@pytest.mark.parametrize('payload, code', [
+    (b'', None),
+    ((1000).to_bytes(2, 'big'), 1000),
+    ((1001).to_bytes(2, 'big') + b'bye', 1001),
+    ((4000).to_bytes(2, 'big'), 4000),
+])
+def test_valid_close_codes(supervisor, payload, code):
+    assert supervisor.close_code(payload) == code
+
+
+@pytest.mark.parametrize('payload', [
+    b'\x03',
+    (999).to_bytes(2, 'big'),
+    (1005).to_bytes(2, 'big'),
+    (1006).to_bytes(2, 'big'),
+    (1015).to_bytes(2, 'big'),
+    (2000).to_bytes(2, 'big'),
+    (5000).to_bytes(2, 'big'),
+    (1000).to_bytes(2, 'big') + b'\xff',
+])
+def test_invalid_close_frames(supervisor, payload):
+    with pytest.raises(supervisor.WebSocketProtocolError):
+        supervisor.close_code(payload)
+
+
+def test_connect_announces_presence_and_confirms(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        presence = await alice.receive('presence_update')
+        connected = await alice.receive('connected')
+        
+        assert presence['room_id'] == 'lobby'
+        assert presence['user_handle'] == 'alice'
+        assert presence['status'] == 'online'
+        assert connected['user_handle'] == 'alice'
+        assert connected['room_id'] == 'lobby'
+    serve(native, scenario)
+
+
+def test_bad_secret_is_closed_with_policy_violation(native):
+    async def scenario(port, fanout):
+        client = await Client.connect(native, port, secret='wrong')
+        assert await client.close_code() == 1008
+        assert fanout.rejected == 1
+    serve(native, scenario)
+
+
+def test_ping_message_gets_pong(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        alice.send_json({'type': 'ping'})
+        assert await alice.receive('pong') == {'type': 'pong'}
+    serve(native, scenario)
+
+
+def test_ping_frame_gets_pong_frame(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        alice.send(b'hello', opcode=0x9)
+        while (reply := await alice.frame())[0] == 0x1:
+            pass
+        assert reply == (0xA, b'hello')
+    serve(native, scenario)
+
+
+def test_fragmented_message_is_reassembled(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        alice.send(b'{"type":', fin=False)
+        alice.send(b'ping', opcode=0x9)  # Control frames may arrive between fragments
+        alice.send(b'"pi', opcode=0x0, fin=False)
+        alice.send(b'ng"}', opcode=0x0)
+        assert await alice.receive('pong') == {'type': 'pong'}
+        assert fanout.counters['messages_received'] == 1
+    serve(native, scenario)
+
+
+@pytest.mark.parametrize('frames, code', [
+    ([dict(payload=b'{"type":"ping"}', mask=False)], 1002),
+    ([dict(payload=b'"ng"}', opcode=0x0)], 1002),
+    ([dict(payload=b'{"type":', fin=False), dict(payload=b'{"type":"ping"}')], 1002),
+    ([dict(payload=b'ping', opcode=0x9, fin=False)], 1002),
+    ([dict(payload=b'x' * 126, opcode=0x9)], 1002),
+    ([dict(payload=b'', opcode=0x3)], 1002),
+    ([dict(payload=b'\xff\xfe')], 1007),
+    ([dict(payload=b'x' * 65537)], 1009),
+    ([dict(payload=b'x' * 40000, fin=False), dict(payload=b'x' * 40000, opcode=0x0)], 1009),
+    ([dict(payload=(1000).to_bytes(2, 'big'), opcode=0x8)], 1000),
+    ([dict(payload=(1005).to_bytes(2, 'big'), opcode=0x8)], 1002),
+    ([dict(payload=b'', opcode=0x8)], None),
+], ids=['unmasked', 'stray-continuation', 'interleaved-message', 'fragmented-control',
+        'long-control', 'unknown-opcode', 'invalid-utf8', 'frame-too-big', 'message-too-big',
+        'close-echo', 'reserved-close-code', 'empty-close'])
+def test_close_codes(native, frames, code):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        for options in frames:
+            alice.send(**options)
+        assert await alice.close_code() == code
+        # The server closes the connection after its close frame
+        assert await alice.reader.read() == b''
+        assert fanout.server_stats()['total_connections'] == 0
+    serve(native, scenario)
+
+
+def test_join_room_moves_presence(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        bob = await Client.connect(native, port, user_handle='bob', room_id='dev')
+        await bob.receive('connected')
+        
+        alice.send_json({'type': 'join_room', 'room_id': 'dev'})
+        joined = await alice.receive('room_joined')
+        arrival = await bob.receive('presence_update')
+        
+        assert joined['room_id'] == 'dev'
+        assert (arrival['user_handle'], arrival['room_id'], arrival['status']) == ('alice', 'dev', 'online')
+        assert fanout.server_stats()['rooms'] == {'dev': 2}
+    serve(native, scenario)
+
+
+def test_presence_update_reaches_the_room(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        bob = await Client.connect(native, port, user_handle='bob')
+        await bob.receive('connected')
+        
+        alice.send_json({'type': 'presence_update', 'status': 'away'})
+        while (update := await bob.receive('presence_update'))['user_handle'] != 'alice':
+            pass
+        assert update['status'] == 'away'
+        assert update['room_id'] == 'lobby'
+    serve(native, scenario)
+
+
+def test_new_message_reaches_only_its_room(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        bob = await Client.connect(native, port, user_handle='bob', room_id='dev')
+        await alice.receive('connected')
+        await bob.receive('connected')
+        
+        message = {'id': '7', 'room_id': 'lobby', 'sender_handle': 'carol', 'cipher_blob': 'aGk='}
+        assert fanout.broadcast('lobby', {'type': 'new_message', 'message': message}) == 1
+        bob.send_json({'type': 'ping'})
+        
+        assert (await alice.receive('new_message'))['message'] == message
+        # bob's next frame is the pong, not the lobby message
+        assert json.loads((await bob.frame())[1])['type'] == 'pong'
+    serve(native, scenario)
+
+
+def test_post_broadcast_sends_new_message(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        await alice.receive('connected')
+        
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        body = json.dumps({'room_id': 'lobby', 'message': {'id': '9', 'cipher_blob': 'aGk='}}).encode()
+        writer.write(
+            "POST /broadcast HTTP/1.1\r\n"
+            f"X-API-Secret: {SECRET}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        response = await reader.read()
+        writer.close()
+        
+        assert response.endswith(b'{"success": true, "delivered": 1}')
+        assert (await alice.receive('new_message'))['message'] == {'id': '9', 'cipher_blob': 'aGk=', 'room_id': 'lobby'}
+    serve(native, scenario)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.aborted = False
+        self.transport = SimpleNamespace(abort=self.abort)
+    
+    def abort(self):
+        self.aborted = True
+
+
+def test_full_send_queue_disconnects_only_the_slow_client(supervisor, supervisor_log):
+    async def run():
+        fanout = supervisor.FanoutServer(SECRET, queue_size=2)
+        slow = supervisor.FanoutClient('slow', 'lobby', FakeWriter(), fanout.queue_size)
+        fast = supervisor.FanoutClient('fast', 'lobby', FakeWriter(), 100)
+        for client in (slow, fast):
+            fanout.subscribe(client, 'lobby')
+        
+        sent = [fanout.broadcast('lobby', {'type': 'new_message', 'n': n}) for n in range(4)]
+        return fanout, slow, fast, sent
+    fanout, slow, fast, sent = asyncio.run(run())
+    
+    assert sent == [2, 2, 1, 1]
+    assert slow.closed and slow.writer.aborted
+    assert not fast.closed and fast.queue.qsize() == 4
+    assert fanout.slow_disconnects == 1
+    assert fanout.counters['messages_delivered'] == 6
+    assert supervisor_log == ['[Native WS] Disconnecting slow client slow (send queue full)']
+
+
+def test_slow_client_connection_is_dropped(native):
+    async def scenario(port, fanout):
+        alice = await Client.connect(native, port)
+        await alice.receive('connected')
+        client, = fanout.connected_clients['alice']
+        # Stand in for a reader that stopped reading: nothing leaves the queue
+        client.queue = asyncio.Queue(maxsize=1)
+        client.queue.put_nowait(b'')
+        
+        fanout.broadcast('lobby', {'type': 'new_message'})
+        assert await alice.reader.read() == b''
+        while fanout.connected_clients:
+            await asyncio.sleep(0.01)
+        assert fanout.slow_disconnects == 1
+    # connected and the first presence_update are queued before the send loop starts
+    serve(native, scenario, queue_size=2)
@@ -0,0 +1,191 @@
+"""
+Tests for InferenceScheduler admission control and the ChatBot batching
+around it (chatbot-bot.py): slot handoff, shedding the oldest waiter,
+cancelled waiters, and expiring and coalescing queued messages.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+
+def make_scheduler(chatbot, limit=1, max_waiting=2):
+    return chatbot.InferenceScheduler(limits={'ollama': limit, 'openai': limit}, max_waiting=max_waiting)
+
+
+async def settle():
+    """Let waiting tasks run until they block again"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_get_slots_in_order(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=2, max_waiting=10)
+        assert await scheduler.acquire('ollama')
+        assert await scheduler.acquire('ollama')
+        waiters = [asyncio.create_task(scheduler.acquire('ollama')) for _ in range(2)]
+        await settle()
+        pending = [task.done() for task in waiters]
+        
+        scheduler.release('ollama')
+        await settle()
+        after_one = [task.done() for task in waiters]
+        scheduler.release('ollama')
+        await settle()
+        return scheduler, pending, after_one, [task.result() for task in waiters]
+    
+    scheduler, pending, after_one, results = asyncio.run(run())
+    assert pending == [False, False]
+    assert after_one == [True, False]
+    assert results == [True, True]
+    # Slots were handed over, never freed in between
+    assert scheduler.active['ollama'] == 2
+    assert scheduler.stats['admitted'] == 4
+
+
+def test_backends_have_separate_slots(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1)
+        assert await scheduler.acquire('ollama')
+        return await asyncio.wait_for(scheduler.acquire('openai'), 1)
+    
+    assert asyncio.run(run()) is True
+
+
+def test_full_queue_sheds_the_oldest_waiter(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1, max_waiting=2)
+        await scheduler.acquire('ollama')
+        oldest, middle = (asyncio.create_task(scheduler.acquire('ollama')) for _ in range(2))
+        await settle()
+        newest = asyncio.create_task(scheduler.acquire('ollama'))
+        await settle()
+        shed = oldest.result()
+        
+        scheduler.release('ollama')
+        await settle()
+        return scheduler, shed, middle.result(), newest.done()
+    
+    scheduler, shed, middle, newest_done = asyncio.run(run())
+    assert shed is False
+    assert middle is True
+    assert not newest_done
+    assert scheduler.stats['shed'] == 1
+
+
+def test_no_wait_queue_sheds_immediately(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1, max_waiting=0)
+        await scheduler.acquire('ollama')
+        return scheduler, await scheduler.acquire('ollama')
+    
+    scheduler, admitted = asyncio.run(run())
+    assert admitted is False
+    assert scheduler.stats['shed'] == 1
+
+
+def test_cancelled_waiter_is_skipped(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1, max_waiting=10)
+        await scheduler.acquire('ollama')
+        cancelled = asyncio.create_task(scheduler.acquire('ollama'))
+        next_waiter = asyncio.create_task(scheduler.acquire('ollama'))
+        await settle()
+        
+        # Released before the cancelled task could remove itself
+        cancelled.cancel()
+        scheduler.release('ollama')
+        await settle()
+        return scheduler, cancelled.cancelled(), next_waiter.result()
+    
+    scheduler, was_cancelled, admitted = asyncio.run(run())
+    assert was_cancelled
+    assert admitted is True
+    assert scheduler.active['ollama'] == 1
+    assert not scheduler.waiting
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_released(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1, max_waiting=10)
+        await scheduler.acquire('ollama')
+        waiter = asyncio.create_task(scheduler.acquire('ollama'))
+        await settle()
+        
+        # The slot is handed over, then the waiter is cancelled before it resumes
+        scheduler.release('ollama')
+        waiter.cancel()
+        await settle()
+        return scheduler, waiter.cancelled()
+    
+    scheduler, was_cancelled = asyncio.run(run())
+    assert was_cancelled
+    assert scheduler.active['ollama'] == 0
+
+
+def test_full_queue_of_cancelled_waiters_does_not_shed(chatbot):
+    async def run():
+        scheduler = make_scheduler(chatbot, limit=1, max_waiting=1)
+        await scheduler.acquire('ollama')
+        stale = asyncio.create_task(scheduler.acquire('ollama'))
+        await settle()
+        stale.cancel()
+        fresh = asyncio.create_task(scheduler.acquire('ollama'))
+        await settle()
+        scheduler.release('ollama')
+        await settle()
+        return scheduler, fresh.result()
+    
+    scheduler, admitted = asyncio.run(run())
+    assert admitted is True
+    assert scheduler.stats['shed'] == 0
+
+
+@pytest.fixture
+def answered(chatbot, bot_config):
+    """A ChatBot whose process_message records its calls"""
+    bot = chatbot.ChatBot(dict(bot_config, inference_deadline=30))
+    calls = []
+    
+    async def process_message(room_id, message_text, received_at, context_seq=None, deadline_at=None):
+        calls.append((room_id, message_text, context_seq))
+    
+    bot.process_message = process_message
+    bot.calls = calls
+    return bot
+
+
+def test_burst_is_coalesced_into_one_prompt(answered):
+    now = time.monotonic()
+    batch = [(now, 'alice', 'hi', 1), (now, 'bob', 'anyone here?', 2), (now, 'alice', 'hello?', 3)]
+    asyncio.run(answered.process_batch('lobby', batch))
+    
+    assert answered.calls == [('lobby', 'alice: hi\nbob: anyone here?\nalice: hello?', 1)]
+    assert answered.stats['coalesced'] == 2
+    assert answered.scheduler.stats['coalesced'] == 2
+
+
+def test_single_message_is_sent_as_is(answered):
+    asyncio.run(answered.process_batch('lobby', [(time.monotonic(), 'alice', 'hi', 7)]))
+    
+    assert answered.calls == [('lobby', 'hi', 7)]
+    assert answered.stats['coalesced'] == 0
+
+
+def test_stale_messages_are_dropped_before_coalescing(answered):
+    now = time.monotonic()
+    batch = [(now - 60, 'alice', 'old', 1), (now, 'bob', 'new', 2)]
+    asyncio.run(answered.process_batch('lobby', batch))
+    
+    assert answered.calls == [('lobby', 'new', 2)]
+    assert answered.stats['expired'] == 1
+    assert answered.scheduler.stats['expired'] == 1
+
+
+def test_room_deadline_override(answered):
+    answered.config['room_deadlines'] = {'slow-room': 120}
+    asyncio.run(answered.process_batch('slow-room', [(time.monotonic() - 60, 'alice', 'still fresh', 1)]))
+    
+    assert answered.calls == [('slow-room', 'still fresh', 1)]
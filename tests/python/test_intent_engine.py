@@ -0,0 +1,141 @@
+"""
+Tests for IntentEngine (chatbot-bot.py) against the substring checks the
+simple responder used before it: the default rules must answer ordinary
+messages the same way, and differ only where whole-word matching and
+rule priorities were meant to change the answer.
+"""
+
+import json
+
+import pytest
+
+
+def old_classify(text):
+    """The simple responder's original if/elif cascade, as intent names"""
+    lower = text.lower().strip()
+    if any(word in lower for word in ['hello', 'hi', 'hey', 'greetings']):
+        return 'greetings'
+    if '?' in text:
+        if 'how are you' in lower:
+            return 'how_are_you'
+        if 'what' in lower and 'your name' in lower:
+            return 'name'
+        if 'who are you' in lower:
+            return 'who_are_you'
+        return 'questions'
+    if any(word in lower for word in ['bye', 'goodbye', 'see you', 'farewell']):
+        return 'goodbye'
+    if any(word in lower for word in ['thank', 'thanks', 'thx']):
+        return 'thanks'
+    return None
+
+
+@pytest.fixture
+def engine(chatbot):
+    return chatbot.IntentEngine(chatbot.DEFAULT_INTENTS, chatbot.DEFAULT_MENTION_PATTERNS)
+
+
+def intent_of(engine, text):
+    rule = engine.classify(text)
+    return rule['name'] if rule else None
+
+
+@pytest.mark.parametrize('text', [
+    'hello there',
+    'Hey!',
+    'Greetings, friends',
+    'HI',
+    'how are you?',
+    'What is your name?',
+    "what's your name?",
+    'who are you?',
+    'Where do you live?',
+    'see you tomorrow?',
+    'ok bye',
+    'Goodbye everyone',
+    'farewell',
+    'thanks a lot',
+    'Thank you',
+    'thx',
+    'the weather is nice',
+    '',
+])
+def test_matches_the_old_substring_order(engine, text):
+    assert intent_of(engine, text) == old_classify(text)
+
+
+@pytest.mark.parametrize('text, old, new', [
+    # Words match whole words only
+    ('this is fine', 'greetings', None),
+    ('they left', 'greetings', None),
+    ('which one?', 'greetings', 'questions'),
+    # Specific questions outrank a greeting in the same message
+    ('Hello, how are you?', 'greetings', 'how_are_you'),
+    ('hi, who are you?', 'greetings', 'who_are_you'),
+    # Specific questions no longer need a question mark
+    ('how are you', None, 'how_are_you'),
+    # 'thank*' still matches any ending
+    ('I am thankful', 'thanks', 'thanks'),
+])
+def test_intended_differences_from_the_old_order(engine, text, old, new):
+    assert old_classify(text) == old
+    assert intent_of(engine, text) == new
+
+
+def test_whitespace_between_words_is_flexible(engine):
+    assert intent_of(engine, 'how   are\tyou') == 'how_are_you'
+
+
+def test_no_rules_matches_nothing(chatbot):
+    engine = chatbot.IntentEngine([], [])
+    
+    assert engine.classify('hello') is None
+    assert not engine.mentioned('hello')
+
+
+@pytest.mark.parametrize('text, mentioned', [
+    ('hey ChatBot, you there', True),
+    ('@chatbot help', True),
+    ('Bot, what time is it', True),
+    ('hi bot', True),
+    ('ask the bot', False),
+    ('chatbots are fun', False),
+    ('botany is fun', False),
+    ('buddy are you there', True),
+])
+def test_mentions(chatbot, bot_config, text, mentioned):
+    config = dict(bot_config, bot_handle='ChatBot', mention_aliases='buddy')
+    engine = chatbot.IntentEngine([], chatbot.mention_patterns_for(config))
+    
+    assert engine.mentioned(text) is mentioned
+
+
+def test_rule_file_replaces_and_extends_defaults(chatbot, tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps({'intents': [
+        {'name': 'greetings', 'priority': 50, 'patterns': ['howdy'], 'responses': ['Howdy!']},
+        {'name': 'weather', 'priority': 70, 'patterns': ['weather'], 'responses': ['Sunny.']},
+    ]}), encoding='utf-8')
+    engine = chatbot.IntentEngine(chatbot.load_intent_rules(str(path)), [])
+    
+    assert intent_of(engine, 'howdy') == 'greetings'
+    assert intent_of(engine, 'hello') is None
+    assert intent_of(engine, 'hi, how is the weather?') == 'weather'
+    assert intent_of(engine, 'thanks') == 'thanks'
+
+
+def test_rule_file_can_drop_defaults(chatbot, tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps({'replace_defaults': True, 'intents': [
+        {'name': 'weather', 'patterns': ['weather'], 'responses': ['Sunny.']},
+    ]}), encoding='utf-8')
+    
+    assert [rule['name'] for rule in chatbot.load_intent_rules(str(path))] == ['weather']
+
+
+def test_incomplete_rule_is_rejected(chatbot, tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps({'intents': [{'name': 'weather', 'patterns': ['weather']}]}), encoding='utf-8')
+    
+    with pytest.raises(ValueError, match='responses'):
+        chatbot.load_intent_rules(str(path))
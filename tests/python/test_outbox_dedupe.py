@@ -0,0 +1,108 @@
+"""
+Tests for OutboxDeduplicator (server/runtime/app/services/dedupe.py):
+content hashing, the queued_at window and the per-room/room-count bounds.
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('pydantic_settings')
+pytest.importorskip('pymysql')
+
+from app.services.dedupe import OutboxDeduplicator
+
+BASE_TIME = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def row(message_id, room_id='lobby', text='aGVsbG8=', seconds=0, sender='alice', filter_version=1):
+    """Stand-in for a TempOutbox row (the deduplicator only reads these fields)"""
+    return SimpleNamespace(
+        id=message_id,
+        room_id=room_id,
+        sender_handle=sender,
+        cipher_blob=text,
+        filter_version=filter_version,
+        queued_at=BASE_TIME + timedelta(seconds=seconds),
+    )
+
+
+@pytest.fixture
+def dedupe():
+    return OutboxDeduplicator(window_seconds=60, max_keys_per_room=100, max_rooms=10)
+
+
+def test_duplicate_within_window_collapses_into_original(dedupe):
+    assert dedupe.check(row(1)) is None
+    assert dedupe.check(row(2, seconds=30)) == 1
+    assert dedupe.collapsed_total == 1
+
+
+def test_window_boundary_is_inclusive(dedupe):
+    dedupe.check(row(1))
+    assert dedupe.check(row(2, seconds=60)) == 1
+
+
+def test_duplicate_outside_window_is_delivered(dedupe):
+    dedupe.check(row(1))
+    assert dedupe.check(row(2, seconds=61)) is None
+    # The later row starts a new window
+    assert dedupe.check(row(3, seconds=90)) == 2
+
+
+def test_same_row_seen_again_is_not_a_duplicate(dedupe):
+    # A redelivered batch re-checks rows it already recorded
+    dedupe.check(row(1))
+    assert dedupe.check(row(1, seconds=5)) is None
+    assert dedupe.collapsed_total == 0
+
+
+def test_hash_ignores_whitespace_in_cipher_blob_and_sender(dedupe):
+    dedupe.check(row(1, text='aGVs\nbG8='))
+    assert dedupe.check(row(2, text='aGVsbG8=', sender=' alice ', seconds=1)) == 1
+
+
+@pytest.mark.parametrize('change', [
+    {'room_id': 'other'},
+    {'sender': 'bob'},
+    {'text': 'Ynll'},
+    {'filter_version': 2},
+])
+def test_different_payload_is_not_a_duplicate(dedupe, change):
+    dedupe.check(row(1))
+    assert dedupe.check(row(2, seconds=1, **change)) is None
+
+
+def test_room_keeps_at_most_max_keys():
+    dedupe = OutboxDeduplicator(window_seconds=60, max_keys_per_room=2, max_rooms=10)
+    dedupe.check(row(1, text='a'))
+    dedupe.check(row(2, text='b', seconds=1))
+    dedupe.check(row(3, text='c', seconds=2))
+    
+    # 'a' was pushed out by the per-room cap, 'c' is still known
+    assert dedupe.check(row(4, text='a', seconds=3)) is None
+    assert dedupe.check(row(5, text='c', seconds=4)) == 3
+    assert dedupe.stats()['hashes_tracked'] == 2
+
+
+def test_least_recently_used_room_is_evicted():
+    dedupe = OutboxDeduplicator(window_seconds=60, max_keys_per_room=100, max_rooms=2)
+    dedupe.check(row(1, room_id='a'))
+    dedupe.check(row(2, room_id='b'))
+    dedupe.check(row(3, room_id='a', text='other', seconds=1))  # 'a' is now most recent
+    dedupe.check(row(4, room_id='c'))                             # evicts 'b'
+    
+    assert dedupe.stats()['rooms_tracked'] == 2
+    assert dedupe.check(row(5, room_id='a', seconds=2)) == 1
+    assert dedupe.check(row(6, room_id='b', seconds=2)) is None
+
+
+def test_expired_hashes_are_dropped_from_the_room(dedupe):
+    dedupe.check(row(1, text='a'))
+    dedupe.check(row(2, text='b', seconds=10))
+    dedupe.check(row(3, text='c', seconds=65))
+    
+    # 'a' fell out of the window when 'c' was checked; 'b' is still inside it
+    assert dedupe.stats()['hashes_tracked'] == 2
@@ -0,0 +1,184 @@
+"""
+Tests for the outbox replay CLI (server/runtime/app/cli/replay.py):
+checkpoint resume, filter mismatch on resume and --include-pending
+stamping delivered_at so the live drain does not resend replayed rows.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('pydantic_settings')
+pytest.importorskip('pymysql')
+pytest.importorskip('httpx')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cli import replay
+from app.models.outbox import TempOutbox
+
+DELIVERED_AT = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    """Session factory over a SQLite temp_outbox, installed as the CLI's SessionLocal"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+    TempOutbox.__table__.create(engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(replay, 'SessionLocal', session_factory)
+    yield session_factory
+    engine.dispose()
+
+
+def add_rows(session_factory, ids, delivered_at=DELIVERED_AT, room_id='lobby'):
+    with session_factory() as db:
+        for message_id in ids:
+            db.add(TempOutbox(
+                id=message_id,
+                room_id=room_id,
+                sender_handle='alice',
+                cipher_blob='aGk=',
+                filter_version=1,
+                queued_at=datetime(2026, 1, 1),
+                delivered_at=delivered_at,
+            ))
+        db.commit()
+
+
+def delivered_at(session_factory):
+    with session_factory() as db:
+        return {row.id: row.delivered_at for row in db.query(TempOutbox)}
+
+
+class FakePrimary:
+    """Records deliveries; IDs in fail_ids fail, interrupt_at raises KeyboardInterrupt"""
+    
+    def __init__(self):
+        self.sent = []
+        self.fail_ids = set()
+        self.interrupt_at = None
+        self.before_send = None
+    
+    def deliver(self, message):
+        if message.id == self.interrupt_at:
+            raise KeyboardInterrupt
+        if self.before_send:
+            self.before_send(message)
+        self.sent.append(message.id)
+        return message.id not in self.fail_ids
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    fake = FakePrimary()
+    monkeypatch.setattr(replay.DrainService, 'deliver_to_primary',
+                        lambda service, message, span=None: fake.deliver(message))
+    monkeypatch.setattr(replay.settings, 'REPLAY_PROGRESS_INTERVAL_SECONDS', 3600)
+    return fake
+
+
+def test_resume_continues_after_the_checkpointed_id(outbox, primary, tmp_path):
+    add_rows(outbox, range(1, 8))
+    checkpoint = str(tmp_path / 'replay.json')
+    args = ['--room', 'lobby', '--rate', '0', '--page-size', '2', '--checkpoint', checkpoint]
+    
+    primary.interrupt_at = 5
+    assert replay.main(args) == 130
+    saved = json.load(open(checkpoint))
+    assert (saved['last_id'], saved['delivered']) == (4, 4)
+    
+    primary.interrupt_at = None
+    assert replay.main(args + ['--resume']) == 0
+    assert primary.sent == [1, 2, 3, 4, 5, 6, 7]
+    saved = json.load(open(checkpoint))
+    assert (saved['last_id'], saved['delivered'], saved['failed']) == (7, 7, 0)
+
+
+def test_resume_keeps_failure_counts(outbox, primary, tmp_path):
+    add_rows(outbox, range(1, 5))
+    checkpoint = str(tmp_path / 'replay.json')
+    args = ['--rate', '0', '--page-size', '1', '--checkpoint', checkpoint]
+    
+    primary.fail_ids = {2}
+    primary.interrupt_at = 3
+    assert replay.main(args) == 130
+    
+    primary.interrupt_at = None
+    assert replay.main(args + ['--resume']) == 1
+    saved = json.load(open(checkpoint))
+    assert (saved['delivered'], saved['failed'], saved['failed_ids']) == (3, 1, [2])
+
+
+def test_resume_with_different_filters_is_refused(outbox, primary, tmp_path, capsys):
+    add_rows(outbox, range(1, 4))
+    checkpoint = str(tmp_path / 'replay.json')
+    primary.interrupt_at = 2
+    assert replay.main(['--room', 'lobby', '--checkpoint', checkpoint, '--rate', '0']) == 130
+    before = json.load(open(checkpoint))
+    primary.interrupt_at = None
+    
+    assert replay.main(['--room', 'dev', '--checkpoint', checkpoint, '--resume']) == 2
+    assert replay.main(['--checkpoint', checkpoint, '--resume', '--include-pending']) == 2
+    assert 'Cannot resume: Checkpoint filters do not match' in capsys.readouterr().err
+    assert primary.sent == [1]
+    assert json.load(open(checkpoint)) == before
+
+
+def test_resume_without_checkpoint_file_is_refused(outbox, primary, tmp_path):
+    assert replay.main(['--checkpoint', str(tmp_path / 'missing.json'), '--resume']) == 2
+    assert primary.sent == []
+
+
+def test_pending_rows_are_skipped_without_include_pending(outbox, primary):
+    add_rows(outbox, [1])
+    add_rows(outbox, [2], delivered_at=None)
+    
+    assert replay.main(['--rate', '0']) == 0
+    assert primary.sent == [1]
+    assert delivered_at(outbox)[2] is None
+
+
+def test_replayed_pending_rows_are_marked_delivered(outbox, primary):
+    add_rows(outbox, [1])
+    add_rows(outbox, [2, 3], delivered_at=None)
+    
+    assert replay.main(['--rate', '0', '--include-pending']) == 0
+    assert primary.sent == [1, 2, 3]
+    stamps = delivered_at(outbox)
+    assert stamps[1] == DELIVERED_AT
+    assert stamps[2] is not None and stamps[3] is not None
+    
+    # The live drain's pending query no longer sees them
+    with outbox() as db:
+        assert db.query(TempOutbox).filter(TempOutbox.delivered_at.is_(None)).count() == 0
+
+
+def test_failed_pending_row_is_left_for_the_drain(outbox, primary):
+    add_rows(outbox, [1, 2], delivered_at=None)
+    primary.fail_ids = {1}
+    
+    assert replay.main(['--rate', '0', '--include-pending']) == 1
+    stamps = delivered_at(outbox)
+    assert stamps[1] is None
+    assert stamps[2] is not None
+
+
+def test_pending_row_delivered_by_the_drain_meanwhile_is_skipped(outbox, primary, capsys):
+    add_rows(outbox, [1, 2], delivered_at=None)
+    
+    def drain_delivers_next(message):
+        # The live drain delivers row 2 while the replay sends row 1
+        if message.id == 1:
+            with outbox() as db:
+                db.query(TempOutbox).filter(TempOutbox.id == 2).update({'delivered_at': DELIVERED_AT})
+                db.commit()
+    primary.before_send = drain_delivers_next
+    
+    assert replay.main(['--rate', '0', '--include-pending']) == 0
+    assert primary.sent == [1]
+    assert delivered_at(outbox)[2] == DELIVERED_AT
+    assert 'delivered=1 failed=0 skipped=1' in capsys.readouterr().out
@@ -0,0 +1,117 @@
+"""
+Tests for reconnect handling (chatbot-bot.py): RoomConnection's duplicate
+filter and last-seen tracking used by catch-up, and the reconnect backoff.
+"""
+
+import asyncio
+import base64
+from urllib.parse import quote
+
+import pytest
+
+
+class RecordingBot:
+    """Stands in for a ChatBot persona; records delivered messages"""
+    
+    def __init__(self):
+        self.messages = []
+    
+    async def handle_message(self, message_data, context_seq, received_at):
+        self.messages.append((message_data['message']['id'], context_seq))
+
+
+@pytest.fixture
+def connection(chatbot):
+    store = chatbot.ContextStore(messages_per_room=20, max_rooms=10, max_bytes=0)
+    bot = RecordingBot()
+    conn = chatbot.RoomConnection('ws://localhost:8420', 'ChatBot', 'secret', 'lobby', [bot], store)
+    conn.bot = bot
+    return conn
+
+
+def new_message(message_id, text='hello'):
+    blob = base64.b64encode(quote(text).encode()).decode()
+    return {'type': 'new_message', 'message': {
+        'id': message_id, 'room_id': 'lobby', 'sender_handle': 'alice', 'cipher_blob': blob
+    }}
+
+
+def test_mark_seen_rejects_duplicates(connection):
+    assert connection.mark_seen(5)
+    assert not connection.mark_seen(5)
+    assert connection.mark_seen(6)
+
+
+def test_mark_seen_tracks_the_highest_id(chatbot, connection):
+    for message_id in (10, 12, 11):
+        connection.mark_seen(message_id)
+    
+    assert connection.last_seen_id == 12
+    
+    resumed = chatbot.RoomConnection('ws://x', 'ChatBot', 'secret', 'lobby', [], None, last_seen_id=40)
+    resumed.mark_seen(30)
+    assert resumed.last_seen_id == 40
+
+
+def test_messages_without_an_id_are_always_delivered(connection):
+    assert connection.mark_seen(None)
+    assert connection.mark_seen(None)
+    assert connection.last_seen_id is None
+
+
+def test_seen_ids_are_bounded(chatbot, connection):
+    size = chatbot.SEEN_IDS_SIZE
+    for message_id in range(size + 5):
+        connection.mark_seen(message_id)
+    
+    assert len(connection.seen_ids) == len(connection.seen_set) == size
+    # The oldest IDs were forgotten; recent ones are still duplicates
+    assert connection.mark_seen(0)
+    assert not connection.mark_seen(size + 4)
+
+
+def test_duplicate_delivery_is_dropped(connection):
+    async def run():
+        await connection.deliver(new_message(7))
+        await connection.deliver(new_message('7'))  # Catch-up returns IDs as strings
+        await connection.deliver(new_message(8))
+    asyncio.run(run())
+    
+    assert [message_id for message_id, _ in connection.bot.messages] == [7, 8]
+    assert connection.context_store.stats['recorded'] == 2
+    assert connection.last_seen_id == 8
+
+
+@pytest.fixture
+def backoff(chatbot, monkeypatch):
+    """Backoff whose jitter always picks the upper bound"""
+    monkeypatch.setattr(chatbot.random, 'uniform', lambda low, high: high)
+    return chatbot.ReconnectBackoff(base_delay=1, max_delay=60, stable_seconds=30)
+
+
+def test_backoff_doubles_up_to_the_cap(backoff):
+    delays = [backoff.next_delay(None) for _ in range(8)]
+    
+    assert delays == [1, 2, 4, 8, 16, 32, 60, 60]
+
+
+def test_short_lived_connection_keeps_backing_off(backoff):
+    backoff.next_delay(None)
+    backoff.next_delay(None)
+    
+    assert backoff.next_delay(uptime=5) == 4
+
+
+def test_stable_connection_resets_the_backoff(backoff):
+    for _ in range(5):
+        backoff.next_delay(None)
+    
+    assert backoff.next_delay(uptime=30) == 1
+    assert backoff.next_delay(None) == 2
+
+
+def test_delay_is_jittered_from_zero(chatbot):
+    backoff = chatbot.ReconnectBackoff(base_delay=1, max_delay=60, stable_seconds=30)
+    for attempt in range(10):
+        delay = backoff.next_delay(None)
+        assert 0 <= delay <= min(60, 2 ** attempt)
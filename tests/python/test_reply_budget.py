@@ -0,0 +1,92 @@
+"""
+Tests for ReplyBudget (chatbot-bot.py): sentence detection while tokens
+stream in, the sentence and character cut-offs, and the early first
+sentence hook.
+"""
+
+import pytest
+
+
+def stream(budget, text, size=3):
+    """Feed text in small chunks like a streamed reply; True if it stopped early"""
+    for start in range(0, len(text), size):
+        if budget.feed(text[start:start + size]):
+            return True
+    return False
+
+
+def test_stops_after_the_sentence_budget(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=2)
+    
+    assert stream(budget, 'One. Two! Three? Four.')
+    assert budget.result() == 'One. Two!'
+
+
+def test_sentence_needs_following_whitespace(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=1)
+    
+    # Not a sentence end yet: the stream may continue with "14" or more dots
+    assert not budget.feed('Pi is 3.')
+    assert not budget.feed('14 and so on..')
+    assert budget.feed('. Next')
+    assert budget.result() == 'Pi is 3.14 and so on...'
+
+
+@pytest.mark.parametrize('text, first', [
+    ('"Yes!" she said.', '"Yes!"'),
+    ('It works (mostly.) Fine', 'It works (mostly.)'),
+    ('Wait?! What', 'Wait?!'),
+    ('no sentence yet', None),
+])
+def test_first_sentence(chatbot, text, first):
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=0)
+    budget.feed(text)
+    
+    assert budget.first_sentence() == first
+
+
+def test_char_budget_cuts_at_the_last_complete_sentence(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=25, max_sentences=0)
+    
+    assert stream(budget, 'Short one. Another short. This one is far too long to keep.')
+    assert budget.result() == 'Short one. Another short.'
+
+
+def test_char_budget_cuts_at_a_word_boundary_without_sentences(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=20, max_sentences=0)
+    
+    assert stream(budget, 'a very long reply without any sentence end')
+    assert budget.result() == 'a very long reply...'
+
+
+def test_char_budget_cuts_a_single_long_word(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=8, max_sentences=0)
+    budget.feed('abcdefghijkl')
+    
+    assert budget.result() == 'abcdefgh...'
+
+
+def test_unlimited_budget_keeps_everything(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=0)
+    text = 'One. Two. Three. ' * 50
+    
+    assert not stream(budget, text)
+    assert budget.result() == text.strip()
+
+
+def test_first_sentence_hook_fires_once(chatbot):
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=3)
+    sent = []
+    for token in ['Hel', 'lo', '.', ' How', ' are', ' you?', ' Fine.']:
+        chatbot.ChatBot.consume_token(budget, token, sent.append)
+    
+    assert sent == ['Hello.']
+
+
+def test_first_sentence_hook_skipped_when_it_is_the_whole_reply(chatbot):
+    # With a one-sentence budget the full reply goes out normally instead
+    budget = chatbot.ReplyBudget(max_chars=0, max_sentences=1)
+    sent = []
+    
+    assert chatbot.ChatBot.consume_token(budget, 'Hello. ', sent.append)
+    assert sent == []
@@ -0,0 +1,129 @@
+"""
+Tests for ResponseCache (chatbot-bot.py): prompt normalization, LRU
+eviction and TTL expiry of the memory tier, and the SQLite tier.
+"""
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def clock(chatbot, monkeypatch):
+    """Controllable time.time() for TTL checks"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(chatbot.time, 'time', lambda: now[0])
+    return now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_normalize_ignores_case_punctuation_and_mentions(chatbot):
+    normalize = chatbot.ResponseCache.normalize
+    
+    assert normalize('Hello,   @ChatBot!!', 'ChatBot') == 'hello'
+    assert normalize("What's your NAME?") == "what's your name?"
+    assert normalize('chatbots are fun', 'ChatBot') == 'chatbots are fun'
+
+
+def test_key_depends_on_fingerprint(chatbot):
+    make_key = chatbot.ResponseCache.make_key
+    
+    assert make_key('hello', 'a') == make_key('hello', 'a')
+    assert make_key('hello', 'a') != make_key('hello', 'b')
+
+
+def test_hit_after_put(chatbot, clock):
+    cache = chatbot.ResponseCache(max_entries=10, ttl=60)
+    
+    async def scenario():
+        assert await cache.get('k') is None
+        await cache.put('k', 'reply')
+        return await cache.get('k')
+    
+    assert run(scenario()) == 'reply'
+    assert cache.summary()['hits'] == 1
+    assert cache.summary()['misses'] == 1
+    assert cache.summary()['hit_rate'] == 0.5
+
+
+def test_least_recently_used_entry_is_evicted(chatbot, clock):
+    cache = chatbot.ResponseCache(max_entries=2, ttl=60)
+    
+    async def scenario():
+        await cache.put('a', 'A')
+        await cache.put('b', 'B')
+        await cache.get('a')  # 'a' is now the most recently used
+        await cache.put('c', 'C')
+        return [await cache.get(key) for key in ('a', 'b', 'c')]
+    
+    assert run(scenario()) == ['A', None, 'C']
+    assert cache.stats['evictions'] == 1
+    assert list(cache.entries) == ['a', 'c']
+
+
+def test_entries_expire_after_ttl(chatbot, clock):
+    cache = chatbot.ResponseCache(max_entries=10, ttl=60)
+    run(cache.put('k', 'reply'))
+    
+    clock[0] += 59
+    assert run(cache.get('k')) == 'reply'
+    clock[0] += 1
+    assert run(cache.get('k')) is None
+    assert cache.stats['expired'] == 1
+    assert 'k' not in cache.entries
+
+
+def test_put_refreshes_ttl(chatbot, clock):
+    cache = chatbot.ResponseCache(max_entries=10, ttl=60)
+    run(cache.put('k', 'old'))
+    clock[0] += 50
+    run(cache.put('k', 'new'))
+    clock[0] += 50
+    
+    assert run(cache.get('k')) == 'new'
+
+
+@pytest.mark.parametrize('max_entries, ttl', [(0, 60), (10, 0)])
+def test_disabled_cache_stores_nothing(chatbot, clock, max_entries, ttl):
+    cache = chatbot.ResponseCache(max_entries=max_entries, ttl=ttl)
+    run(cache.put('k', 'reply'))
+    
+    assert run(cache.get('k')) is None
+    assert cache.entries == {}
+    assert cache.stats['misses'] == 0
+
+
+def test_disk_tier_survives_a_restart(chatbot, clock, tmp_path):
+    path = str(tmp_path / 'cache' / 'responses.sqlite')
+    cache = chatbot.ResponseCache(max_entries=10, ttl=60, path=path)
+    run(cache.put('k', 'reply'))
+    cache.close()
+    
+    restarted = chatbot.ResponseCache(max_entries=10, ttl=60, path=path)
+    assert run(restarted.get('k')) == 'reply'
+    assert restarted.stats['disk_hits'] == 1
+    # Promoted to the memory tier
+    assert run(restarted.get('k')) == 'reply'
+    assert restarted.stats['hits'] == 1
+    
+    clock[0] += 60
+    restarted.entries.clear()
+    assert run(restarted.get('k')) is None
+    restarted.close()
+
+
+def test_disk_tier_is_pruned_to_its_cap(chatbot, clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(chatbot.ResponseCache, 'DISK_PRUNE_EVERY', 1)
+    path = str(tmp_path / 'responses.sqlite')
+    cache = chatbot.ResponseCache(max_entries=10, ttl=60, path=path, disk_max_entries=2)
+    for key in ('a', 'b', 'c'):
+        run(cache.put(key, key.upper()))
+        clock[0] += 1
+    cache.close()
+    
+    restarted = chatbot.ResponseCache(max_entries=10, ttl=60, path=path)
+    assert [run(restarted.get(key)) for key in ('a', 'b', 'c')] == [None, 'B', 'C']
+    restarted.close()
@@ -0,0 +1,180 @@
+"""
+Tests for the supervisor's Node.js cluster coordination
+(websocket-server-python.py): relaying broadcasts between workers and
+electing the single temp_outbox poller.
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeStdin:
+    """Collects what the supervisor writes to a Node.js process"""
+    
+    def __init__(self, buffered=0, closing=False):
+        self.lines = []
+        self.closing = closing
+        self.transport = SimpleNamespace(get_write_buffer_size=lambda: buffered)
+    
+    def is_closing(self):
+        return self.closing
+    
+    def write(self, data):
+        self.lines.extend(json.loads(line) for line in data.decode().splitlines())
+
+
+class FakeProc:
+    def __init__(self, pid, **stdin):
+        self.pid = pid
+        self.returncode = None
+        self.stdin = FakeStdin(**stdin)
+
+
+@pytest.fixture
+def cluster(supervisor, supervisor_log, monkeypatch):
+    """Two listening workers with fake processes, installed as node_cluster"""
+    cluster = supervisor.NodeCluster(2, 'shared')
+    for index in range(2):
+        worker = supervisor.NodeWorker(index, 8420, cluster=cluster)
+        worker.process = FakeProc(100 + index)
+        worker.started_at = time.time()
+        worker.ready.set()
+        cluster.workers.append(worker)
+    monkeypatch.setattr(supervisor, 'node_cluster', cluster)
+    monkeypatch.setattr(supervisor, 'shutdown_event', None)
+    return cluster
+
+
+def procs(cluster):
+    return [worker.process for worker in cluster.workers]
+
+
+def test_relay_goes_to_every_other_process(supervisor, cluster):
+    source, other = procs(cluster)
+    staged = FakeProc(200)
+    cluster.workers[1].staged = staged
+    
+    supervisor.handle_node_line(cluster.workers[0], source, 'stdout',
+                                b'@@relay {"type": "room", "room_id": "lobby", "message": {"type": "new_message"}}')
+    
+    assert source.stdin.lines == []
+    assert other.stdin.lines == staged.stdin.lines == [
+        {'type': 'room', 'room_id': 'lobby', 'message': {'type': 'new_message'}}
+    ]
+    assert cluster.relay_counts == {'relayed': 1, 'delivered': 2, 'dropped': 0}
+
+
+def test_relay_line_is_not_logged(supervisor, cluster, supervisor_log, monkeypatch):
+    events = []
+    monkeypatch.setattr(supervisor, 'node_events', events)
+    source = procs(cluster)[0]
+    supervisor.handle_node_line(cluster.workers[0], source, 'stdout', b'@@relay {"type": "user"}')
+    
+    assert events == []
+    assert supervisor_log == []
+
+
+@pytest.mark.parametrize('stdin', [{'closing': True}, {'buffered': 10 ** 9}])
+def test_relay_to_a_process_that_stopped_reading_is_dropped(supervisor, cluster, stdin):
+    stuck = FakeProc(300, **stdin)
+    cluster.workers[1].process = stuck
+    cluster.relay(procs(cluster)[0], '{"type": "room"}')
+    
+    assert stuck.stdin.lines == []
+    assert cluster.relay_counts['dropped'] == 1
+
+
+def test_exited_processes_get_nothing(supervisor, cluster):
+    source, exited = procs(cluster)
+    exited.returncode = 1
+    cluster.relay(source, '{"type": "room"}')
+    
+    assert exited.stdin.lines == []
+    assert cluster.relay_counts == {'relayed': 1, 'delivered': 0, 'dropped': 0}
+
+
+def test_relay_lines_get_the_larger_cap(supervisor):
+    assert supervisor.line_limit(b'@@relay {}') == supervisor.NODE_MAX_IPC_BYTES
+    assert supervisor.line_limit(b'[WS] log') == supervisor.NODE_MAX_LINE_BYTES
+
+
+def poll_commands(proc):
+    return [line for line in proc.stdin.lines if line['type'] == 'poll_outbox']
+
+
+def test_exactly_one_worker_polls(cluster):
+    first, second = procs(cluster)
+    cluster.elect_poller()
+    cluster.elect_poller()
+    
+    assert poll_commands(first) == [{'type': 'poll_outbox', 'enabled': True}]
+    assert poll_commands(second) == []
+    assert cluster.stats()['outbox_poller'] == 0
+
+
+def test_listening_worker_becomes_poller_when_none_is(supervisor, cluster):
+    for worker in cluster.workers:
+        worker.ready.clear()
+    cluster.elect_poller()
+    assert cluster.poller is None
+    
+    worker = cluster.workers[1]
+    supervisor.handle_node_line(worker, worker.process, 'stdout', b'[WS] WebSocket server listening on port 8420')
+    
+    assert cluster.poller is worker.process
+    assert poll_commands(worker.process)
+
+
+def test_poller_is_succeeded_only_after_it_exits(cluster):
+    first, second = procs(cluster)
+    cluster.elect_poller()
+    
+    # A hung poller still owns the outbox; a second poller could send rows twice
+    cluster.workers[0].ready.clear()
+    cluster.elect_poller()
+    assert cluster.poller is first
+    
+    first.returncode = -9
+    cluster.elect_poller()
+    assert cluster.poller is second
+    assert cluster.poller_elections == 2
+
+
+def test_released_poller_is_succeeded_while_shutting_down(supervisor, cluster):
+    first, second = procs(cluster)
+    cluster.elect_poller()
+    supervisor.handle_node_line(cluster.workers[0], first, 'stdout', b'@@outbox released')
+    
+    assert cluster.poller is second
+    # The released process is never elected again, even if it is the only one left
+    second.returncode = 0
+    cluster.elect_poller()
+    assert cluster.poller is None
+
+
+def test_no_election_during_shutdown(supervisor, cluster, monkeypatch):
+    event = asyncio.Event()
+    event.set()
+    monkeypatch.setattr(supervisor, 'shutdown_event', event)
+    cluster.elect_poller()
+    
+    assert cluster.poller is None
+    assert all(poll_commands(proc) == [] for proc in procs(cluster))
+
+
+def test_cluster_stats_are_pushed_to_every_worker(supervisor, cluster):
+    aggregator = supervisor.StatsAggregator(history_size=10)
+    aggregator.update({'pid': 100, 'users': ['alice'], 'total_connections': 1, 'rooms': {'lobby': 1}})
+    aggregator.update({'pid': 101, 'users': ['alice', 'bob'], 'total_connections': 2, 'rooms': {'lobby': 2}})
+    aggregator.sample()
+    cluster.broadcast(supervisor.cluster_stats_message(aggregator.current))
+    
+    expected = {'type': 'cluster_stats', 'stats': {
+        'connected_users': 2, 'total_connections': 3, 'active_rooms': 1,
+        'users': ['alice', 'bob'], 'rooms': {'lobby': 3}, 'workers': 2
+    }}
+    assert [proc.stdin.lines for proc in procs(cluster)] == [[expected], [expected]]
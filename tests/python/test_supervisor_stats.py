@@ -0,0 +1,189 @@
+"""
+Tests for the supervisor's Node.js output handling (websocket-server-python.py):
+splitting worker pipes into capped lines, routing '@@stats' reports and
+aggregating them into cluster-wide totals and rates.
+"""
+
+import asyncio
+import json
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeWorker:
+    """Records the NodeWorker callbacks that handle_node_line makes"""
+    
+    def __init__(self):
+        self.index = 0
+        self.listening = []
+        self.probe_ports = []
+    
+    def mark_listening(self, proc):
+        self.listening.append(proc)
+    
+    def set_probe_port(self, proc, port):
+        self.probe_ports.append((proc, port))
+
+
+@pytest.fixture
+def node_output(supervisor, supervisor_log, monkeypatch):
+    """Fresh event buffer and stats aggregator for each test"""
+    events = deque()
+    aggregator = supervisor.StatsAggregator(history_size=100)
+    monkeypatch.setattr(supervisor, 'node_events', events)
+    monkeypatch.setattr(supervisor, 'node_event_counts', Counter())
+    monkeypatch.setattr(supervisor, 'stats_aggregator', aggregator)
+    return SimpleNamespace(events=events, aggregator=aggregator, log=supervisor_log)
+
+
+def stats_line(**report):
+    return '@@stats ' + json.dumps(report)
+
+
+def pump(supervisor, worker, *chunks):
+    """Run pump_node_stream over a pipe that delivers the given chunks"""
+    async def run():
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        await supervisor.pump_node_stream(worker, 'proc', reader, 'stdout')
+    asyncio.run(run())
+
+
+def test_pump_splits_lines_across_chunks(supervisor, node_output):
+    pump(supervisor, FakeWorker(), b'[WS] first\n[WS] sec', b'ond\n', b'[DB] no newline')
+    
+    assert [(e['tag'], e['message']) for e in node_output.events] == [
+        ('WS', 'first'), ('WS', 'second'), ('DB', 'no newline')
+    ]
+
+
+def test_pump_truncates_long_lines_and_drops_their_tail(supervisor, node_output, monkeypatch):
+    monkeypatch.setattr(supervisor, 'NODE_MAX_LINE_BYTES', 10)
+    monkeypatch.setattr(supervisor, 'NODE_READ_CHUNK', 8)
+    pump(supervisor, FakeWorker(), b'x' * 40 + b'\nafter\n')
+    
+    assert [e['message'] for e in node_output.events] == ['x' * 10 + ' [truncated]', 'after']
+
+
+def test_stats_lines_get_the_larger_cap(supervisor, node_output, monkeypatch):
+    monkeypatch.setattr(supervisor, 'NODE_MAX_LINE_BYTES', 10)
+    line = stats_line(pid=7, users=['u%d' % i for i in range(50)])
+    pump(supervisor, FakeWorker(), line.encode() + b'\n')
+    
+    assert not node_output.events
+    assert node_output.aggregator.reports[7][1]['users'][-1] == 'u49'
+
+
+def test_stats_report_is_routed_to_the_aggregator(supervisor, node_output):
+    worker = FakeWorker()
+    supervisor.handle_node_line(worker, 'proc', 'stdout', stats_line(pid='42', total_connections=3).encode())
+    
+    assert not node_output.events
+    assert node_output.aggregator.reports[42][1]['total_connections'] == 3
+
+
+def test_stats_prefix_on_stderr_is_a_log_line(supervisor, node_output):
+    supervisor.handle_node_line(FakeWorker(), 'proc', 'stderr', stats_line(pid=1).encode())
+    
+    assert not node_output.aggregator.reports
+    assert node_output.events[0]['level'] == 'error'
+
+
+@pytest.mark.parametrize('line', ['@@stats not json', '@@stats {"users": []}', '@@stats {"pid": "x"}'])
+def test_malformed_stats_report_is_logged_and_skipped(supervisor, node_output, line):
+    supervisor.handle_node_line(FakeWorker(), 'proc', 'stdout', line.encode())
+    
+    assert not node_output.aggregator.reports
+    assert node_output.log[0].startswith('Invalid Node.js stats report')
+
+
+def test_listening_and_probe_port_lines_reach_the_worker(supervisor, node_output):
+    worker = FakeWorker()
+    supervisor.handle_node_line(worker, 'proc', 'stdout', b'[WS] WebSocket server listening on port 8420')
+    supervisor.handle_node_line(worker, 'proc', 'stdout', b'[WS] Probe endpoint listening on port 9100')
+    
+    assert worker.listening == ['proc']
+    assert worker.probe_ports == [('proc', 9100)]
+
+
+def test_aggregate_dedupes_users_and_sums_rooms(supervisor):
+    aggregator = supervisor.StatsAggregator(history_size=10)
+    aggregator.update({'pid': 1, 'users': ['alice', 'bob'], 'total_connections': 3,
+                       'rooms': {'lobby': 2, 'dev': 1}, 'counters': {'messages_received': 5}})
+    aggregator.update({'pid': 2, 'users': ['bob', 'carol'], 'total_connections': 2,
+                       'rooms': {'lobby': 1}, 'counters': {'messages_received': 4, 'broadcasts': 1}})
+    aggregator.sample()
+    
+    current = aggregator.current
+    assert current['reporting_workers'] == 2
+    assert current['connected_users'] == 3
+    assert current['total_connections'] == 5
+    assert current['rooms'] == {'lobby': 3, 'dev': 1}
+    assert current['active_rooms'] == 2
+    assert current['counters'] == {'messages_received': 9, 'broadcasts': 1, 'messages_delivered': 0}
+
+
+def test_newer_report_replaces_the_previous_one(supervisor):
+    aggregator = supervisor.StatsAggregator(history_size=10)
+    aggregator.update({'pid': 1, 'counters': {'messages_received': 5}})
+    aggregator.update({'pid': 1, 'counters': {'messages_received': 8}})
+    aggregator.sample()
+    
+    assert aggregator.current['counters']['messages_received'] == 8
+
+
+def test_forget_keeps_counters_monotonic(supervisor):
+    aggregator = supervisor.StatsAggregator(history_size=10)
+    aggregator.update({'pid': 1, 'users': ['alice'], 'counters': {'messages_received': 5}})
+    aggregator.forget(1)
+    aggregator.forget(1)  # Already gone: no double counting
+    aggregator.update({'pid': 2, 'counters': {'messages_received': 2}})
+    aggregator.sample()
+    
+    assert aggregator.current['counters']['messages_received'] == 7
+    assert aggregator.current['connected_users'] == 0
+    assert aggregator.current['reporting_workers'] == 1
+
+
+def test_silent_worker_counts_as_stale(supervisor, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(supervisor.time, 'time', lambda: clock[0])
+    aggregator = supervisor.StatsAggregator(history_size=10)
+    aggregator.update({'pid': 1})
+    clock[0] += supervisor.NODE_STATS_STALE_AFTER + 1
+    aggregator.update({'pid': 2})
+    aggregator.sample()
+    
+    assert aggregator.current['stale_workers'] == 1
+
+
+def test_rates_use_the_oldest_sample_inside_each_window(supervisor, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(supervisor.time, 'time', lambda: clock[0])
+    aggregator = supervisor.StatsAggregator(history_size=100)
+    assert aggregator.rates() == {}
+    
+    # One sample every 10 seconds, 100 more messages each time
+    for step in range(31):
+        aggregator.update({'pid': 1, 'counters': {'messages_received': step * 100}})
+        aggregator.sample()
+        clock[0] += 10
+    
+    rates = aggregator.rates()
+    assert set(rates) == {'10s', '60s', '300s'}
+    assert rates['10s']['messages_received'] == 10.0
+    assert rates['60s']['messages_received'] == 10.0
+    assert rates['300s']['messages_delivered'] == 0.0
+    assert len(aggregator.history_points()) == 31
+
+
+def test_history_is_bounded(supervisor):
+    aggregator = supervisor.StatsAggregator(history_size=3)
+    for _ in range(5):
+        aggregator.sample()
+    
+    assert len(aggregator.history_points()) == 3
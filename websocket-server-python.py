@@ -3,130 +3,1737 @@
 Sentinel Chat Platform - Python WebSocket Server (Primary)
 Port: 4291
 
-Spawns and monitors Node.js WebSocket server (port 8420) as secondary.
-Reports status of both systems.
+Spawns and monitors a cluster of Node.js WebSocket server workers
+(port 8420) as secondary. Reports status of both systems.
+
+By default one Node.js worker runs per CPU core, all accepting from a
+listening socket bound once by this supervisor. Each worker is health
+tracked and restarted on its own; SIGHUP replaces the workers one at a
+time (rolling restart) so clients are never all disconnected at once.
+
+Workers keep their own client maps, so every room broadcast, presence
+change, typing indicator, read receipt and IM a worker sends is also
+written to its stdout as an '@@relay' line; the supervisor forwards it
+to every other worker's stdin, which delivers it to its own clients.
+Exactly one worker at a time is told to poll temp_outbox; a new one is
+elected only after it exits, so a row is never broadcast by two.
+
+Node.js stdout and stderr are drained concurrently by asyncio stream
+readers, so a chatty or failing Node process can never block on a full
+pipe. Output lines are parsed into structured events and only a bounded
+number of recent events is kept in memory.
+
+Every worker also exposes a loopback-only probe websocket. The
+supervisor runs a ping/pong round trip against it every few seconds,
+keeps latency histograms, and restarts workers whose event loop is hung
+or saturated (repeated failed or slow probes), backing off exponentially
+when a worker keeps crashing.
+
+Node.js workers push connection, room and message counters over their
+stdout pipe every few seconds. The supervisor aggregates them into a
+sampled history (for message rates) and serves cached /stats snapshots
+from an asyncio HTTP server, so slow stats clients never block others.
+
+With WS_MODE=native no Node.js process is started. The supervisor then
+serves the same websocket protocol itself on port 4291 (FanoutServer),
+broadcasting temp_outbox messages to room subscribers. This mode exists
+so the two implementations can be compared under load.
+
+Log lines are queued to a background writer thread that batches writes,
+rotates websocket-python.log by size or age into logs/archived/ (gzip,
+same naming as the PHP LogRotationService) and drops lines instead of
+blocking when the queue is full.
 """
 
+import asyncio
+import base64
+import bisect
+import gzip
+import hashlib
+import hmac
+import queue
+import shutil
 import subprocess
 import time
 import threading
 import json
 import os
+import re
 import sys
 import signal
-import http.server
-import socketserver
-from urllib.parse import urlparse, parse_qs
-from http.server import HTTPServer, BaseHTTPRequestHandler
-# websocket import not needed - this script only spawns Node.js
-# import websocket
-import _thread
+import socket
+import urllib.parse
+import urllib.request
+from collections import deque
+from datetime import datetime, timezone
+
+try:
+    import pymysql
+    import pymysql.cursors
+except ImportError:
+    pymysql = None  # Native mode then only receives messages via POST /broadcast
 
 # Configuration
 PYTHON_WS_PORT = 4291
 NODE_WS_PORT = 8420
 NODE_SCRIPT = os.path.join(os.path.dirname(__file__), 'websocket-server.js')
-LOG_FILE = os.path.join(os.path.dirname(__file__), 'logs', 'websocket-python.log')
-PID_FILE = os.path.join(os.path.dirname(__file__), 'logs', 'websocket-python.pid')
+LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+LOG_FILE = os.path.join(LOG_DIR, 'websocket-python.log')
+PID_FILE = os.path.join(LOG_DIR, 'websocket-python.pid')
+NODE_WORKERS = int(os.getenv('NODE_WORKERS', '0'))  # 0 = one per CPU core in shared mode, else 1
+NODE_PORT_MODE = os.getenv('NODE_PORT_MODE', 'shared' if os.name == 'posix' else 'range')  # 'shared' or 'range'
+NODE_RESTART_DELAY = 5  # Seconds to wait before restarting a crashed Node.js process
+NODE_RESTART_MAX_DELAY = 300  # Cap for the doubling delay of a crash-looping worker
+NODE_STABLE_SECONDS = 60  # Uptime after which a crash no longer counts as a crash loop
+NODE_STOP_TIMEOUT = 5  # Seconds a Node.js process gets to exit before it is killed
+NODE_READY_TIMEOUT = 30  # Seconds a replacement worker gets to start listening
+NODE_ROLLING_RESTART_PAUSE = 2  # Seconds between workers during a rolling restart
+NODE_STATS_PREFIX = '@@stats '  # Marks worker stats reports on Node.js stdout
+NODE_STATS_PREFIX_BYTES = NODE_STATS_PREFIX.encode()
+NODE_RELAY_PREFIX = '@@relay '  # Marks broadcasts to forward to the other workers
+NODE_RELAY_PREFIX_BYTES = NODE_RELAY_PREFIX.encode()
+NODE_OUTBOX_RELEASED = '@@outbox released'  # A shutting-down poller has stopped polling temp_outbox
+NODE_STDIN_MAX_BUFFER = 4 * 1024 * 1024  # Bytes queued for a worker's stdin before relays to it are dropped
+NODE_STATS_INTERVAL = 2  # Seconds between stats reports from each worker
+NODE_STATS_STALE_AFTER = 10  # Seconds without a report before a worker counts as stale
+STATS_SAMPLE_INTERVAL = 2  # Seconds between aggregated stats samples
+STATS_HISTORY_SIZE = 150  # Samples kept for rate calculations (5 minutes)
+STATS_RATE_WINDOWS = (10, 60, 300)  # Seconds covered by each reported message rate
+STATS_CACHE_TTL = 1  # Seconds a rendered /stats response is reused
+NODE_PROBE_INTERVAL = 5  # Seconds between liveness probes of each worker
+NODE_PROBE_TIMEOUT = 3  # Seconds a probe (connect + ping/pong) may take
+NODE_PROBE_LATENCY_THRESHOLD_MS = 1000  # Slower pongs count as unhealthy
+NODE_PROBE_MAX_FAILURES = 3  # Consecutive unhealthy probes before a worker is restarted
+NODE_PROBE_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+NODE_PROBE_RECENT = 200  # Recent probe latencies kept for percentiles
+HTTP_READ_TIMEOUT = 5  # Seconds a stats client gets to send its request
+WS_MODE = os.getenv('WS_MODE', 'node')  # 'node' (Node.js cluster) or 'native' (asyncio fan-out on PYTHON_WS_PORT)
+NATIVE_HOST = os.getenv('NATIVE_WS_HOST', '0.0.0.0')  # Bind address in native mode
+NATIVE_SEND_QUEUE = 256  # Frames queued per client before it is disconnected as too slow
+NATIVE_MAX_MESSAGE_BYTES = 65536  # Largest client message accepted
+NATIVE_PING_INTERVAL = 30  # Seconds between websocket pings
+NATIVE_IDLE_TIMEOUT = 90  # Clients silent this long are disconnected
+NATIVE_CLOSE_TIMEOUT = 2  # Seconds clients get to finish the close handshake
+NATIVE_POLL_INTERVAL = 0.5  # Seconds between temp_outbox polls (same as Node.js)
+CREDENTIALS_URL = os.getenv('CREDENTIALS_URL', 'http://localhost/iChat/api/websocket-credentials.php?action=get')
+DB_HOST = os.getenv('DB_HOST', '127.0.0.1')
+DB_PORT = int(os.getenv('DB_PORT', '3306'))
+DB_NAME = os.getenv('DB_NAME', 'sentinel_temp')
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+NODE_READ_CHUNK = 65536  # Bytes read from a Node.js pipe per wakeup
+NODE_MAX_LINE_BYTES = 8192  # Longer output lines are truncated
+NODE_MAX_IPC_BYTES = 4 * 1024 * 1024  # Cap for a single stats report or relay line
+NODE_EVENT_BUFFER = 500  # Recent structured output events kept in memory
+LOG_ARCHIVE_DIR = os.path.join(LOG_DIR, 'archived')
+LOG_QUEUE_SIZE = 10000  # Lines buffered before new lines are dropped
+LOG_BATCH_SIZE = 500  # Max lines written per flush
+LOG_FLUSH_INTERVAL = 0.5  # Seconds between flushes when idle
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate when the log grows past this size
+LOG_ROTATE_SECONDS = 24 * 3600  # Rotate at least this often
+LOG_BACKUP_COUNT = 10  # Compressed archives kept
+
+# Node.js log lines look like "[WS] Client connected: ..." or "[DB] ..."
+NODE_LOG_PATTERN = re.compile(r'^\[(?P<tag>[A-Z]+)\]\s*(?P<message>.*)$')
+NODE_PROBE_PORT_PATTERN = re.compile(r'^Probe endpoint listening on port (?P<port>\d+)')
+NODE_ERROR_PATTERN = re.compile(r'\b(error|failed|exception|fatal)\b', re.IGNORECASE)
 
 # Global state
-node_process = None
-monitor_thread = None
+node_cluster = None
+fanout_server = None  # Native mode only
+outbox_poller = None  # Native mode with PyMySQL only
 server_start_time = time.time()
-connected_clients = {}
-room_subscriptions = {}
 node_restart_count = 0  # Track Node.js restarts
+node_events = deque(maxlen=NODE_EVENT_BUFFER)  # Recent parsed Node.js output
+node_event_counts = {'info': 0, 'warning': 0, 'error': 0}
+supervisor_loop = None
+shutdown_event = None
+background_tasks = set()  # Keeps fire-and-forget tasks referenced
+stats_body = None  # Cached /stats response
+stats_body_built_at = 0
+
+class AsyncLogWriter:
+    """
+    Queue-backed log writer running on a background thread.
+    
+    Callers only format a line and enqueue it; the writer thread keeps the
+    log file open, writes in batches, and rotates/compresses old logs. The
+    queue is bounded so logging never stalls output capture: when it is
+    full, lines are dropped and counted instead.
+    """
+    
+    def __init__(self, path, archive_dir, queue_size, batch_size, flush_interval,
+                 max_bytes, rotate_seconds, backup_count):
+        self.path = path
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = 0
+        self._reported_dropped = 0
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+    
+    def write(self, message):
+        """Enqueue a log line without ever blocking the caller"""
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._queue.put_nowait(f"[{timestamp}] {message}\n")
+        except queue.Full:
+            self.dropped += 1
+    
+    def close(self, timeout=5):
+        """Flush pending lines and stop the writer thread"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+    
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'rotations': self.rotations
+        }
+    
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            if None in batch:
+                stopping = True
+                batch = [line for line in batch if line is not None]
+            
+            if self.dropped != self._reported_dropped:
+                missed = self.dropped - self._reported_dropped
+                self._reported_dropped = self.dropped
+                batch.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Log queue full, dropped {missed} line(s)\n")
+            
+            if batch:
+                self._write_batch(batch)
+        
+        if self._file:
+            self._file.close()
+            self._file = None
+    
+    def _write_batch(self, batch):
+        try:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._rotate()
+            self._file.write(''.join(batch))
+            self._file.flush()
+            self.written += len(batch)
+        except Exception as e:
+            print(f"Log error: {e}")
+            if self._file:
+                self._file.close()
+                self._file = None
+    
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._opened_at = time.time()
+    
+    def _should_rotate(self):
+        if self._file.tell() >= self.max_bytes:
+            return True
+        return time.time() - self._opened_at >= self.rotate_seconds and self._file.tell() > 0
+    
+    def _rotate(self):
+        """Move the current log aside and compress it off the writer thread"""
+        self._file.close()
+        self._file = None
+        
+        os.makedirs(self.archive_dir, exist_ok=True)
+        base = os.path.join(
+            self.archive_dir,
+            f"{os.path.basename(self.path)}.{time.strftime('%Y-%m-%d_%H%M%S')}"
+        )
+        rotated = base
+        suffix = 0
+        while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+            suffix += 1
+            rotated = f"{base}-{suffix}"
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        self._open()
+        
+        threading.Thread(target=self._compress, args=(rotated,), daemon=True).start()
+    
+    def _compress(self, rotated):
+        try:
+            with open(rotated, 'rb') as src, gzip.open(f"{rotated}.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+            self._prune_archives()
+        except Exception as e:
+            print(f"Log compression error: {e}")
+    
+    def _prune_archives(self):
+        prefix = f"{os.path.basename(self.path)}."
+        archives = sorted(
+            (os.path.join(self.archive_dir, name) for name in os.listdir(self.archive_dir)
+             if name.startswith(prefix) and name.endswith('.gz')),
+            key=os.path.getmtime
+        )
+        for path in archives[:-self.backup_count]:
+            os.remove(path)
+
+log_writer = AsyncLogWriter(
+    LOG_FILE,
+    LOG_ARCHIVE_DIR,
+    queue_size=LOG_QUEUE_SIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    max_bytes=LOG_MAX_BYTES,
+    rotate_seconds=LOG_ROTATE_SECONDS,
+    backup_count=LOG_BACKUP_COUNT
+)
 
 def log_to_file(message):
-    """Log message to file"""
+    """Log message to file (queued; written by the background log writer)"""
+    log_writer.write(message)
+
+def parse_node_line(stream, line):
+    """Parse one Node.js output line into a structured event"""
+    match = NODE_LOG_PATTERN.match(line)
+    tag = match.group('tag') if match else None
+    message = match.group('message') if match else line
+    
+    if stream == 'stderr':
+        level = 'error'
+    elif NODE_ERROR_PATTERN.search(message):
+        level = 'warning'
+    else:
+        level = 'info'
+    
+    return {
+        'timestamp': time.time(),
+        'stream': stream,
+        'tag': tag,
+        'level': level,
+        'message': message
+    }
+
+class StatsAggregator:
+    """
+    Cluster-wide traffic counters built from Node.js worker reports.
+    
+    Each worker process reports its connections, room subscriptions and
+    cumulative message counters. Reports are kept per PID; when a process
+    exits its message counters are folded into retired totals, so the
+    cluster totals stay monotonic across restarts. sample() aggregates
+    the latest reports and appends the totals to a bounded history that
+    message rates are computed from.
+    """
+    
+    COUNTERS = ('messages_received', 'broadcasts', 'messages_delivered')
+    
+    def __init__(self, history_size):
+        self.reports = {}  # pid -> (received_at, report)
+        self.retired = dict.fromkeys(self.COUNTERS, 0)
+        self.history = deque(maxlen=history_size)  # (timestamp, totals)
+        self.current = self._aggregate(time.time())
+    
+    def update(self, report):
+        """Store the latest report of a worker process"""
+        self.reports[report['pid']] = (time.time(), report)
+    
+    def forget(self, pid):
+        """Drop an exited process, keeping its message counters in the totals"""
+        entry = self.reports.pop(pid, None)
+        if entry is None:
+            return
+        counters = entry[1].get('counters', {})
+        for name in self.COUNTERS:
+            self.retired[name] += counters.get(name, 0)
+    
+    def sample(self):
+        """Aggregate the latest reports and record a history point"""
+        now = time.time()
+        self.current = self._aggregate(now)
+        self.history.append((now, self.current['counters']))
+    
+    def _aggregate(self, now):
+        users = set()
+        rooms = {}
+        connections = 0
+        stale = 0
+        totals = dict(self.retired)
+        processes = []
+        
+        for received_at, report in self.reports.values():
+            if now - received_at > NODE_STATS_STALE_AFTER:
+                stale += 1
+            if 'rss_bytes' in report:
+                processes.append({
+                    'worker': report.get('worker'),
+                    'pid': report['pid'],
+                    'cpu_seconds': report.get('cpu_seconds'),
+                    'rss_bytes': report['rss_bytes']
+                })
+            users.update(report.get('users', []))
+            connections += report.get('total_connections', 0)
+            for room_id, subscribers in report.get('rooms', {}).items():
+                rooms[room_id] = rooms.get(room_id, 0) + subscribers
+            counters = report.get('counters', {})
+            for name in self.COUNTERS:
+                totals[name] += counters.get(name, 0)
+        
+        return {
+            'sampled_at': now,
+            'reporting_workers': len(self.reports),
+            'stale_workers': stale,
+            'connected_users': len(users),
+            'users': sorted(users),
+            'total_connections': connections,
+            'active_rooms': len(rooms),
+            'rooms': rooms,
+            'counters': totals,
+            'processes': processes
+        }
+    
+    def rates(self):
+        """Per-second message rates over each of STATS_RATE_WINDOWS"""
+        if len(self.history) < 2:
+            return {}
+        
+        latest_at, latest = self.history[-1]
+        rates = {}
+        for window in STATS_RATE_WINDOWS:
+            # Oldest sample still inside the window
+            start_at, start = next(
+                (point for point in self.history if latest_at - point[0] <= window),
+                self.history[-1]
+            )
+            elapsed = latest_at - start_at
+            rates[f'{window}s'] = {
+                name: round((latest[name] - start[name]) / elapsed, 2) if elapsed > 0 else 0.0
+                for name in self.COUNTERS
+            }
+        return rates
+    
+    def history_points(self):
+        return [{'timestamp': timestamp, **totals} for timestamp, totals in self.history]
+
+stats_aggregator = StatsAggregator(STATS_HISTORY_SIZE)
+
+def handle_stats_report(line):
+    """Parse a worker stats report line; malformed reports are logged and skipped"""
     try:
-        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-            f.write(f"[{timestamp}] {message}\n")
-    except Exception as e:
-        print(f"Log error: {e}")
+        report = json.loads(line[len(NODE_STATS_PREFIX):])
+        report['pid'] = int(report['pid'])
+    except (ValueError, KeyError, TypeError) as e:
+        log_to_file(f"Invalid Node.js stats report: {e}")
+        return
+    stats_aggregator.update(report)
 
-def start_node_wss():
-    """Spawn Node.js WebSocket server"""
-    global node_process
+def handle_node_line(worker, proc, stream, raw_line):
+    """Record and log a single line of Node.js output"""
+    line = raw_line.decode('utf-8', errors='replace').strip()
+    if not line:
+        return
     
-    if node_process and node_process.poll() is None:
-        log_to_file("Node.js process already running")
-        return node_process
+    if stream == 'stdout' and line.startswith(NODE_STATS_PREFIX):
+        handle_stats_report(line)
+        return
+    if stream == 'stdout' and line.startswith(NODE_RELAY_PREFIX):
+        if node_cluster is not None:
+            node_cluster.relay(proc, line[len(NODE_RELAY_PREFIX):])
+        return
+    if stream == 'stdout' and line == NODE_OUTBOX_RELEASED:
+        if node_cluster is not None:
+            node_cluster.poller_released(proc)
+        return
     
-    log_to_file(f"Starting Node.js WebSocket server on port {NODE_WS_PORT}...")
+    event = parse_node_line(stream, line)
+    event['worker'] = worker.index
+    node_events.append(event)
+    node_event_counts[event['level']] += 1
     
-    # Set environment variables for Node.js
-    env = os.environ.copy()
-    env['WS_PORT'] = str(NODE_WS_PORT)
+    if event['tag'] == 'WS':
+        if event['message'].startswith('WebSocket server listening'):
+            worker.mark_listening(proc)
+        probe_match = NODE_PROBE_PORT_PATTERN.match(event['message'])
+        if probe_match:
+            worker.set_probe_port(proc, int(probe_match.group('port')))
     
+    if stream == 'stderr':
+        log_to_file(f"[Node WSS {worker.index}][stderr] {line}")
+    else:
+        log_to_file(f"[Node WSS {worker.index}] {line}")
+
+def line_limit(raw_line):
+    """Byte cap for an output line; stats reports and relays may be much longer than log lines"""
+    if raw_line.startswith(NODE_STATS_PREFIX_BYTES) or raw_line.startswith(NODE_RELAY_PREFIX_BYTES):
+        return NODE_MAX_IPC_BYTES
+    return NODE_MAX_LINE_BYTES
+
+def write_to_node(proc, data):
+    """Queue bytes for a Node.js process's stdin; False if it has exited or stopped reading"""
+    stdin = proc.stdin
+    if proc.returncode is not None or stdin is None or stdin.is_closing():
+        return False
+    if stdin.transport.get_write_buffer_size() > NODE_STDIN_MAX_BUFFER:
+        return False
+    stdin.write(data)
+    return True
+
+async def pump_node_stream(worker, proc, reader, stream):
+    """Drain one Node.js pipe until EOF, splitting it into capped lines"""
+    pending = b''
+    discarding = False  # Skipping the tail of an over-long line
+    
+    while True:
+        chunk = await reader.read(NODE_READ_CHUNK)
+        if not chunk:
+            break
+        
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for raw_line in lines:
+            if discarding:
+                discarding = False
+                continue
+            limit = line_limit(raw_line)
+            if len(raw_line) > limit:
+                raw_line = raw_line[:limit] + b' [truncated]'
+            handle_node_line(worker, proc, stream, raw_line)
+        
+        limit = line_limit(pending)
+        if len(pending) > limit:
+            if not discarding:
+                handle_node_line(worker, proc, stream, pending[:limit] + b' [truncated]')
+                discarding = True
+            pending = b''
+    
+    if pending and not discarding:
+        handle_node_line(worker, proc, stream, pending)
+
+async def wait_for_shutdown(timeout):
+    """Sleep for up to timeout seconds; True if shutdown was requested meanwhile"""
+    try:
+        await asyncio.wait_for(shutdown_event.wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def terminate_process(proc, timeout=NODE_STOP_TIMEOUT):
+    """Terminate a process, killing it if it does not exit in time"""
+    if proc.returncode is not None:
+        return
+    
+    proc.terminate()
     try:
-        node_process = subprocess.Popen(
-            ["node", NODE_SCRIPT],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            env=env,
-            cwd=os.path.dirname(__file__)
+        await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        log_to_file(f"Force killing Node.js process {proc.pid}...")
+        proc.kill()
+        await proc.wait()
+
+class WebSocketProtocolError(ConnectionError):
+    """A websocket peer broke RFC 6455; code is the close status to answer with"""
+    
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+def encode_frame(payload, opcode=0x1, mask=False):
+    """Encode a single unfragmented WebSocket frame (RFC 6455)"""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += length.to_bytes(2, 'big')
+    else:
+        header.append(mask_bit | 127)
+        header += length.to_bytes(8, 'big')
+    
+    if not mask:
+        return bytes(header) + payload
+    
+    key = os.urandom(4)
+    return bytes(header) + key + apply_mask(payload, key)
+
+def apply_mask(payload, key):
+    """XOR a payload with a 4-byte websocket mask (one big-int operation)"""
+    length = len(payload)
+    if not length:
+        return payload
+    repeated = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+
+async def read_frame(reader, max_size=1024 * 1024, require_mask=False):
+    """Read one WebSocket frame; returns (fin, opcode, payload)"""
+    first, second = await reader.readexactly(2)
+    if first & 0x70:
+        raise WebSocketProtocolError(1002, "reserved bits set")
+    if require_mask and not second & 0x80:
+        raise WebSocketProtocolError(1002, "client frame is not masked")
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), 'big')
+    if length > max_size:
+        raise WebSocketProtocolError(1009, f"frame of {length} bytes exceeds limit")
+    
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if key:
+        payload = apply_mask(payload, key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+async def probe_websocket(port):
+    """
+    Open a websocket to a worker probe endpoint and time one ping/pong.
+    
+    Args:
+        port: Loopback port the worker announced for probing
+    
+    Returns:
+        Ping/pong round trip in milliseconds (handshake excluded)
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            "GET / HTTP/1.1\r\n"
+            f"Host: 127.0.0.1:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n".encode()
         )
+        response = await reader.readuntil(b'\r\n\r\n')
+        status_line = response.split(b'\r\n', 1)[0].decode('latin-1')
+        if ' 101 ' not in f"{status_line} ":
+            raise ConnectionError(f"upgrade refused: {status_line}")
+        
+        started = time.monotonic()
+        writer.write(encode_frame(b'{"type":"ping"}', mask=True))
+        await writer.drain()
+        while True:
+            _, opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                raise ConnectionError("probe connection closed by worker")
+            if opcode == 0x1 and b'"pong"' in payload:
+                latency = (time.monotonic() - started) * 1000
+                writer.write(encode_frame((1000).to_bytes(2, 'big'), opcode=0x8, mask=True))
+                return latency
+    finally:
+        writer.close()
+
+class LatencyHistogram:
+    """Probe latencies in fixed millisecond buckets plus recent samples"""
+    
+    def __init__(self, buckets_ms, recent_size):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)  # Last slot: above the largest bucket
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=recent_size)
+    
+    def observe(self, latency_ms):
+        self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+        self.recent.append(latency_ms)
+    
+    def percentile(self, p):
+        """Nearest-rank percentile over the recent samples"""
+        values = sorted(self.recent)
+        if not values:
+            return None
+        rank = max(-(-p * len(values) // 100), 1)
+        return round(values[rank - 1], 2)
+    
+    def stats(self):
+        buckets = {f"<={bound}ms": count for bound, count in zip(self.buckets_ms, self.counts)}
+        buckets[f">{self.buckets_ms[-1]}ms"] = self.counts[-1]
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 2),
+            'buckets': buckets
+        }
+
+class NodeWorker:
+    """
+    One Node.js WebSocket server process of the cluster.
+    
+    The worker outlives its processes: a crashed or replaced process is
+    started again under the same index, port and PID file, and restart
+    counts accumulate per worker.
+    
+    During an overlapping replace the new process is staged: its output is
+    drained and its readiness tracked separately, and it only becomes the
+    worker's process once it is listening and passes a probe.
+    """
+    
+    def __init__(self, index, port, listen_fd=None, cluster=None):
+        self.index = index
+        self.port = port
+        self.listen_fd = listen_fd  # Shared listening socket inherited by Node.js
+        self.cluster = cluster  # Told when a process starts listening or exits (outbox poller election)
+        self.pid_file = os.path.join(LOG_DIR, f'websocket-node-{index}.pid')
+        self.process = None
+        self.started_at = None
+        self.restart_count = 0
+        self.last_exit_code = None
+        self.ready = asyncio.Event()  # Set once Node.js reports it is listening
+        self.crash_streak = 0  # Crashes in a row without a stable run in between
+        self.probe_port = None  # Announced by the current process
+        self.latency = LatencyHistogram(NODE_PROBE_BUCKETS_MS, NODE_PROBE_RECENT)
+        self.probes = 0
+        self.probe_failures = 0
+        self.consecutive_unhealthy = 0
+        self.last_probe_ms = None
+        self.hang_restarts = 0
+        self._watch_task = None
+        self._replacing = False
+        self.staged = None  # Replacement process not yet swapped in
+        self.staged_ready = asyncio.Event()
+        self.staged_probe_announced = asyncio.Event()
+        self.staged_probe_port = None
+    
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None
+    
+    def mark_listening(self, proc):
+        """Record that proc reported its WebSocket server is listening"""
+        if proc is self.staged:
+            self.staged_ready.set()
+        elif proc is self.process:
+            self.ready.set()
+            if self.cluster is not None:
+                self.cluster.elect_poller()
+    
+    def set_probe_port(self, proc, port):
+        """Record the probe port announced by proc"""
+        if proc is self.staged:
+            self.staged_probe_port = port
+            self.staged_probe_announced.set()
+        elif proc is self.process:
+            self.probe_port = port
+    
+    async def start(self):
+        """Spawn a Node.js process for this worker and start draining its output"""
+        proc = await self._spawn()
+        if proc is None:
+            return None
+        self._adopt(proc, asyncio.create_task(self._watch(proc)))
+        return proc
+    
+    async def _spawn(self):
+        """Start a Node.js process for this worker; None if it could not be started"""
+        log_to_file(f"Starting Node.js worker {self.index} on port {self.port}...")
+        
+        # Set environment variables for Node.js
+        env = os.environ.copy()
+        env['WS_PORT'] = str(self.port)
+        env['WS_WORKER_ID'] = str(self.index)
+        env['SUPERVISOR_IPC'] = '1'
+        env['WS_STATS_INTERVAL_MS'] = str(NODE_STATS_INTERVAL * 1000)
+        pass_fds = ()
+        if self.listen_fd is not None:
+            env['WS_LISTEN_FD'] = str(self.listen_fd)
+            pass_fds = (self.listen_fd,)
+        
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "node", NODE_SCRIPT,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.PIPE,
+                env=env,
+                cwd=os.path.dirname(__file__) or None,
+                pass_fds=pass_fds
+            )
+        except Exception as e:
+            log_to_file(f"Failed to start Node.js worker {self.index}: {e}")
+            return None
+        return proc
+    
+    def _adopt(self, proc, watch_task, ready=False, probe_port=None):
+        """Make proc this worker's current process and point the PID file at it"""
+        self.process = proc
+        self.started_at = time.time()
+        if ready:
+            self.ready.set()
+        else:
+            self.ready.clear()
+        self.probe_port = probe_port
+        self.consecutive_unhealthy = 0
+        self._watch_task = watch_task
         
-        # Write PID to file
         try:
-            os.makedirs(os.path.dirname(PID_FILE), exist_ok=True)
-            with open(PID_FILE, 'w') as f:
-                f.write(str(node_process.pid))
+            os.makedirs(os.path.dirname(self.pid_file), exist_ok=True)
+            with open(self.pid_file, 'w') as f:
+                f.write(str(proc.pid))
         except Exception as e:
             log_to_file(f"Failed to write PID file: {e}")
         
-        log_to_file(f"Node.js process started with PID: {node_process.pid}")
-        return node_process
-    except Exception as e:
-        log_to_file(f"Failed to start Node.js process: {e}")
-        return None
-
-def monitor_node_process(proc):
-    """Monitor Node.js process output (non-blocking)"""
-    global node_process
+        log_to_file(f"Node.js worker {self.index} started with PID: {proc.pid}")
     
-    log_to_file("Node.js monitor thread started")
+    async def _watch(self, proc):
+        """Drain stdout and stderr of one process until it exits"""
+        await asyncio.gather(
+            pump_node_stream(self, proc, proc.stdout, 'stdout'),
+            pump_node_stream(self, proc, proc.stderr, 'stderr'),
+        )
+        exit_code = await proc.wait()
+        stats_aggregator.forget(proc.pid)
+        
+        log_to_file(f"Node.js worker {self.index} (PID {proc.pid}) exited with code {exit_code}")
+        if self.process is proc:
+            self.last_exit_code = exit_code
+            self.ready.clear()
+            self._remove_pid_file()
+        if self.cluster is not None:
+            self.cluster.elect_poller()
+        return exit_code
     
-    while True:
-        if proc is None:
-            break
+    async def run(self):
+        """Keep this worker alive, restarting it after crashes until shutdown"""
+        global node_restart_count
+        
+        while not shutdown_event.is_set():
+            if self.process is None and await self.start() is None:
+                if await wait_for_shutdown(NODE_RESTART_DELAY):
+                    break
+                continue
+            
+            proc = self.process
+            exit_code = await self._watch_task
+            
+            if shutdown_event.is_set():
+                break
+            if self.process is not proc:
+                # Replaced by a rolling restart; keep watching the new process
+                continue
             
-        # Read stdout
-        line = proc.stdout.readline()
-        if not line:
-            if proc.poll() is not None:
+            self.process = None
+            if self._replacing:
+                self._replacing = False
+                continue
+            if exit_code == 0:
+                log_to_file(f"Node.js worker {self.index} exited cleanly, not restarting")
                 break
-            time.sleep(0.1)
+            
+            # Double the delay for every crash that follows a short run
+            if time.time() - self.started_at >= NODE_STABLE_SECONDS:
+                self.crash_streak = 0
+            self.crash_streak += 1
+            delay = min(NODE_RESTART_DELAY * 2 ** (self.crash_streak - 1), NODE_RESTART_MAX_DELAY)
+            
+            self.restart_count += 1
+            node_restart_count += 1
+            log_to_file(f"Node.js worker {self.index} crashed (exit code: {exit_code}), attempting restart in {delay} seconds... (restart #{self.restart_count})")
+            if await wait_for_shutdown(delay):
+                break
+    
+    async def probe(self):
+        """Run one liveness probe and restart the process if it looks hung"""
+        proc = self.process
+        if not self.running or not self.ready.is_set() or self.probe_port is None:
+            return
+        
+        try:
+            latency_ms = await asyncio.wait_for(probe_websocket(self.probe_port), timeout=NODE_PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            latency_ms = None
+            reason = str(e) or type(e).__name__
+        
+        self.probes += 1
+        if latency_ms is not None:
+            self.latency.observe(latency_ms)
+            self.last_probe_ms = round(latency_ms, 2)
+            if latency_ms < NODE_PROBE_LATENCY_THRESHOLD_MS:
+                self.consecutive_unhealthy = 0
+                return
+            reason = f"pong after {latency_ms:.0f}ms"
+        else:
+            self.probe_failures += 1
+        
+        if self.process is not proc:
+            return
+        self.consecutive_unhealthy += 1
+        log_to_file(f"Node.js worker {self.index} probe unhealthy ({self.consecutive_unhealthy}/{NODE_PROBE_MAX_FAILURES}): {reason}")
+        
+        if self.consecutive_unhealthy >= NODE_PROBE_MAX_FAILURES and self.running:
+            self.hang_restarts += 1
+            self.consecutive_unhealthy = 0
+            log_to_file(f"Node.js worker {self.index} (PID {proc.pid}) looks hung, restarting it")
+            await terminate_process(proc)
+    
+    async def wait_ready(self, timeout):
+        """Wait until the current process is listening; False on timeout"""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def replace(self, overlap):
+        """
+        Replace the running process with a fresh one.
+        
+        Args:
+            overlap: Start the new process before stopping the old one
+                     (only possible when workers share the listening socket)
+        
+        Returns:
+            True if the new process came up and is listening
+        """
+        old = self.process if self.running else None
+        
+        if overlap and old is not None:
+            return await self._replace_overlapped(old)
+        
+        # The port is exclusive to this worker: stop first, run() starts it again
+        if old is not None:
+            self._replacing = True
+            self.ready.clear()
+            await terminate_process(old)
+        return await self.wait_ready(NODE_READY_TIMEOUT)
+    
+    async def _replace_overlapped(self, old):
+        """Stage a new process next to old and swap only once it is healthy"""
+        new = await self._spawn()
+        if new is None:
+            return False
+        
+        self.staged = new
+        self.staged_ready.clear()
+        self.staged_probe_announced.clear()
+        self.staged_probe_port = None
+        watch_task = asyncio.create_task(self._watch(new))
+        try:
+            healthy, reason = await self._check_staged(watch_task)
+        finally:
+            probe_port = self.staged_probe_port
+            self.staged = None
+        
+        if not healthy:
+            log_to_file(f"Replacement for Node.js worker {self.index} (PID {new.pid}) {reason}, keeping PID {old.pid}")
+            await terminate_process(new)
+            await watch_task
+            return False
+        
+        self._adopt(new, watch_task, ready=True, probe_port=probe_port)
+        await terminate_process(old)
+        return True
+    
+    async def _staged_listening(self):
+        await self.staged_ready.wait()
+        await self.staged_probe_announced.wait()
+    
+    async def _check_staged(self, watch_task):
+        """Wait for the staged process to listen and announce its probe port, then probe it; (healthy, reason)"""
+        ready_task = asyncio.create_task(self._staged_listening())
+        try:
+            await asyncio.wait({ready_task, watch_task}, timeout=NODE_READY_TIMEOUT,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready_task.cancel()
+        
+        if watch_task.done():
+            return False, f"exited with code {watch_task.result()}"
+        if not (self.staged_ready.is_set() and self.staged_probe_announced.is_set()):
+            return False, f"was not listening after {NODE_READY_TIMEOUT}s"
+        
+        try:
+            latency_ms = await asyncio.wait_for(probe_websocket(self.staged_probe_port), timeout=NODE_PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            return False, f"failed its probe: {str(e) or type(e).__name__}"
+        if latency_ms >= NODE_PROBE_LATENCY_THRESHOLD_MS:
+            return False, f"failed its probe: pong after {latency_ms:.0f}ms"
+        return True, None
+    
+    async def stop(self):
+        """Stop the current process and wait for its output to drain"""
+        if self.staged is not None:
+            await terminate_process(self.staged)
+        self.ready.clear()
+        if self.running:
+            await terminate_process(self.process)
+        if self._watch_task is not None:
+            await self._watch_task
+        self._remove_pid_file()
+    
+    def _remove_pid_file(self):
+        try:
+            os.remove(self.pid_file)
+        except OSError:
+            pass
+    
+    def stats(self):
+        if not self.running:
+            state = 'stopped'
+        elif self.ready.is_set():
+            state = 'running'
+        else:
+            state = 'starting'
+        
+        return {
+            'index': self.index,
+            'state': state,
+            'port': self.port,
+            'pid': self.process.pid if self.process else None,
+            'uptime_seconds': int(time.time() - self.started_at) if self.running else 0,
+            'restart_count': self.restart_count,
+            'crash_streak': self.crash_streak,
+            'last_exit_code': self.last_exit_code,
+            'health': {
+                'probes': self.probes,
+                'probe_failures': self.probe_failures,
+                'consecutive_unhealthy': self.consecutive_unhealthy,
+                'last_latency_ms': self.last_probe_ms,
+                'hang_restarts': self.hang_restarts,
+                'latency': self.latency.stats()
+            }
+        }
+
+class NodeCluster:
+    """
+    Pool of Node.js workers serving the public WebSocket port.
+    
+    In 'shared' mode the supervisor binds NODE_WS_PORT once and every
+    worker accepts connections from the inherited socket, so the kernel
+    spreads clients across workers. In 'range' mode (Windows, or when set
+    explicitly) worker n listens on NODE_WS_PORT + n and balancing is left
+    to the proxy in front.
+    
+    Broadcasts are relayed between all live processes, including a staged
+    replacement, which already accepts connections. The outbox poller is
+    a process rather than a worker: it is succeeded once it has exited or,
+    when shutting down, reported that it stopped polling.
+    """
+    
+    def __init__(self, size, port_mode):
+        self.size = size
+        self.port_mode = port_mode
+        self.workers = []
+        self.rolling_restart_active = False
+        self.poller = None  # Process that polls temp_outbox
+        self.released_pollers = set()  # Shutting-down processes that gave the role up
+        self.poller_elections = 0
+        self.relay_counts = {'relayed': 0, 'delivered': 0, 'dropped': 0}
+        self._listen_socket = None
+        self._tasks = []
+    
+    async def start(self):
+        """Bind the shared port if needed and start every worker"""
+        listen_fd = None
+        if self.port_mode == 'shared':
+            try:
+                self._listen_socket = create_listen_socket(NODE_WS_PORT)
+            except OSError as e:
+                log_to_file(f"Failed to bind Node.js port {NODE_WS_PORT}: {e}")
+                return False
+            listen_fd = self._listen_socket.fileno()
+        
+        for index in range(self.size):
+            port = NODE_WS_PORT if self.port_mode == 'shared' else NODE_WS_PORT + index
+            self.workers.append(NodeWorker(index, port, listen_fd, cluster=self))
+        
+        started = [await worker.start() for worker in self.workers]
+        if not any(started):
+            return False
+        
+        self._tasks = [asyncio.create_task(worker.run()) for worker in self.workers]
+        return True
+    
+    async def rolling_restart(self):
+        """Replace workers one at a time so clients never all drop at once"""
+        if self.rolling_restart_active:
+            log_to_file("Rolling restart already in progress")
+            return
+        
+        self.rolling_restart_active = True
+        log_to_file(f"Rolling restart of {len(self.workers)} Node.js worker(s) started")
+        try:
+            for worker in self.workers:
+                if shutdown_event.is_set():
+                    break
+                if await worker.replace(overlap=self.port_mode == 'shared'):
+                    log_to_file(f"Node.js worker {worker.index} replaced (PID {worker.process.pid})")
+                else:
+                    log_to_file(f"Node.js worker {worker.index} was not replaced cleanly")
+                if await wait_for_shutdown(NODE_ROLLING_RESTART_PAUSE):
+                    break
+        finally:
+            self.rolling_restart_active = False
+        log_to_file("Rolling restart finished")
+    
+    async def stop(self):
+        """Stop all workers concurrently and release the shared socket"""
+        log_to_file("Terminating Node.js workers...")
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        await asyncio.gather(*self._tasks)
+        if self._listen_socket is not None:
+            self._listen_socket.close()
+            self._listen_socket = None
+    
+    def processes(self):
+        """Live Node.js processes: every worker's current and staged process"""
+        for worker in self.workers:
+            for proc in (worker.process, worker.staged):
+                if proc is not None and proc.returncode is None:
+                    yield proc
+    
+    def relay(self, source, payload):
+        """Forward a broadcast from one process to every other live process"""
+        data = (payload + '\n').encode()
+        self.relay_counts['relayed'] += 1
+        for proc in self.processes():
+            if proc is source:
+                continue
+            if write_to_node(proc, data):
+                self.relay_counts['delivered'] += 1
+            else:
+                self.relay_counts['dropped'] += 1
+    
+    def broadcast(self, message):
+        """Send a supervisor message to every live process"""
+        data = (json.dumps(message) + '\n').encode()
+        for proc in self.processes():
+            write_to_node(proc, data)
+    
+    def poller_released(self, proc):
+        """A shutting-down process stopped polling; hand the outbox to another one"""
+        self.released_pollers.add(proc)
+        if proc is self.poller:
+            self.poller = None
+        self.elect_poller()
+    
+    def elect_poller(self):
+        """Make one listening worker poll temp_outbox unless a live process already does"""
+        self.released_pollers = {proc for proc in self.released_pollers if proc.returncode is None}
+        if self.poller is not None and self.poller.returncode is None:
+            return
+        self.poller = None
+        if shutdown_event is not None and shutdown_event.is_set():
+            return
+        
+        message = (json.dumps({'type': 'poll_outbox', 'enabled': True}) + '\n').encode()
+        for worker in self.workers:
+            if worker.process in self.released_pollers:
+                continue
+            if worker.running and worker.ready.is_set() and write_to_node(worker.process, message):
+                self.poller = worker.process
+                self.poller_elections += 1
+                log_to_file(f"Node.js worker {worker.index} (PID {worker.process.pid}) now polls temp_outbox")
+                return
+        log_to_file("No Node.js worker is listening; temp_outbox polling paused")
+    
+    def poller_index(self):
+        for worker in self.workers:
+            if self.poller is not None and worker.process is self.poller:
+                return worker.index
+        return None
+    
+    def primary(self):
+        """First running worker (used for the single-process stats fields)"""
+        for worker in self.workers:
+            if worker.running:
+                return worker
+        return self.workers[0] if self.workers else None
+    
+    def stats(self):
+        return {
+            'port_mode': self.port_mode,
+            'size': self.size,
+            'running': sum(1 for worker in self.workers if worker.running),
+            'rolling_restart_active': self.rolling_restart_active,
+            'outbox_poller': self.poller_index(),
+            'poller_elections': self.poller_elections,
+            'relay': dict(self.relay_counts),
+            'workers': [worker.stats() for worker in self.workers]
+        }
+
+async def probe_workers():
+    """Probe every Node.js worker concurrently until shutdown"""
+    while not await wait_for_shutdown(NODE_PROBE_INTERVAL):
+        if node_cluster is None or node_cluster.rolling_restart_active:
             continue
+        await asyncio.gather(*(worker.probe() for worker in node_cluster.workers))
+
+def create_listen_socket(port):
+    """Bind the public Node.js port once so all workers can inherit it"""
+    if socket.has_dualstack_ipv6():
+        sock = socket.create_server(('', port), family=socket.AF_INET6, dualstack_ipv6=True, backlog=511)
+    else:
+        sock = socket.create_server(('', port), backlog=511)
+    sock.set_inheritable(True)
+    return sock
+
+def resolve_worker_count():
+    """Worker count: NODE_WORKERS, else one per core when the port can be shared"""
+    if NODE_WORKERS > 0:
+        return NODE_WORKERS
+    if NODE_PORT_MODE == 'shared':
+        return os.cpu_count() or 1
+    return 1
+
+def iso_now():
+    """Current UTC time formatted like JavaScript's Date.toISOString()"""
+    return js_timestamp(datetime.now(timezone.utc))
+
+def js_timestamp(value):
+    """Format a datetime the way Node.js serializes it (naive values are local time)"""
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def load_credentials():
+    """
+    Load the API secret and database credentials like websocket-server.js:
+    environment first, then the PHP credentials endpoint, then defaults.
+    """
+    credentials = {}
+    if not (os.getenv('DB_USER') and os.getenv('DB_PASSWORD')):
+        try:
+            with urllib.request.urlopen(CREDENTIALS_URL, timeout=5) as response:
+                data = json.loads(response.read().decode('utf-8'))
+            if data.get('success') and data.get('credentials'):
+                credentials = data['credentials']
+                log_to_file("[CRED] Credentials loaded successfully")
+            else:
+                log_to_file(f"[CRED] Failed to fetch credentials: {data.get('error', 'unknown error')}")
+        except Exception as e:
+            log_to_file(f"[CRED] Failed to fetch credentials: {e}")
+    
+    return {
+        'api_secret': credentials.get('api_secret') or os.getenv('API_SHARED_SECRET', 'change-me-now'),
+        'db_user': credentials.get('db_user') or os.getenv('DB_USER', 'root'),
+        'db_password': credentials.get('db_password') or os.getenv('DB_PASSWORD', '')
+    }
+
+class FanoutClient:
+    """One websocket connection of the native fan-out server"""
+    
+    def __init__(self, user_handle, room_id, writer, queue_size):
+        self.user_handle = user_handle
+        self.room_id = room_id
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.closed = False
+    
+    def enqueue(self, frame):
+        """Queue an encoded frame; False when the client cannot keep up"""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+    
+    async def send_loop(self):
+        """Write queued frames in order until the None sentinel"""
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                break
+            self.writer.write(frame)
+            await self.writer.drain()
+
+class FanoutServer:
+    """
+    Native asyncio websocket fan-out server (WS_MODE=native).
+    
+    Speaks the websocket-server.js protocol used by js/app.js and
+    chatbot-bot.py: same query-string auth, connected, ping/pong,
+    join_room/room_joined, leave_room, presence_update, get_stats and
+    new_message broadcasts. Clients are indexed by user and by room.
+    
+    Every broadcast is serialized and framed once and the same bytes are
+    queued for each subscriber. Send queues are bounded: a client whose
+    queue is full is disconnected instead of buffering without limit, so
+    one slow reader cannot hold memory or delay the room.
+    """
+    
+    def __init__(self, api_secret, queue_size):
+        self.api_secret = api_secret
+        self.queue_size = queue_size
+        self.connected_clients = {}  # user_handle -> set of FanoutClient
+        self.room_subscriptions = {}  # room_id -> set of FanoutClient
+        self.counters = dict.fromkeys(StatsAggregator.COUNTERS, 0)
+        self.accepted = 0
+        self.rejected = 0
+        self.slow_disconnects = 0
+        self.started_at = time.time()
+    
+    def authenticate(self, query):
+        """
+        Validate connection parameters like validateConnection() in Node.js.
+        
+        Returns:
+            (user_handle, room_id) tuple
+        
+        Raises:
+            ValueError: With the rejection reason
+        """
+        params = urllib.parse.parse_qs(query)
+        user_handle = params.get('user_handle', [''])[0]
+        token = params.get('token', [''])[0]
+        api_secret = params.get('api_secret', [''])[0]
+        room_id = params.get('room_id', [''])[0] or 'lobby'
+        
+        if not user_handle:
+            raise ValueError('Missing user handle')
+        
+        if token:
+            try:
+                parts = base64.b64decode(token).decode('utf-8').split(':')
+            except (ValueError, UnicodeDecodeError) as e:
+                raise ValueError(f'Token validation error: {e}')
+            if len(parts) != 3:
+                raise ValueError('Invalid token format')
+            token_user, expires_at, token_hash = parts
+            if not expires_at.isdigit() or int(expires_at) < time.time():
+                raise ValueError('Token expired')
+            expected = hashlib.sha256(f"{token_user}:{expires_at}:{self.api_secret}".encode()).hexdigest()
+            if not hmac.compare_digest(token_hash.encode(), expected.encode()):
+                raise ValueError('Invalid token')
+            if token_user != user_handle:
+                raise ValueError('Token user mismatch')
+            return user_handle, room_id
+        
+        if api_secret:
+            provided = hashlib.sha256(api_secret.encode()).digest()
+            expected = hashlib.sha256(self.api_secret.encode()).digest()
+            if not hmac.compare_digest(provided, expected):
+                raise ValueError('Invalid API secret')
+            return user_handle, room_id
+        
+        raise ValueError('Missing authentication (token or api_secret required)')
+    
+    async def handle(self, reader, writer, query, headers):
+        """Complete the websocket handshake and serve the connection"""
+        key = headers.get('sec-websocket-key', '')
+        if not key or headers.get('sec-websocket-version') != '13':
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await close_writer(writer)
+            return
+        
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        
+        try:
+            user_handle, room_id = self.authenticate(query)
+        except ValueError as e:
+            self.rejected += 1
+            writer.write(encode_frame(close_payload(1008, str(e)), opcode=0x8))
+            await close_writer(writer)
+            return
+        
+        client = FanoutClient(user_handle, room_id, writer, self.queue_size)
+        self.accepted += 1
+        self.connected_clients.setdefault(user_handle, set()).add(client)
+        self.subscribe(client, room_id)
+        self.broadcast_presence(room_id, user_handle, 'online')
+        self.send(client, {
+            'type': 'connected',
+            'user_handle': user_handle,
+            'room_id': room_id,
+            'timestamp': iso_now()
+        })
+        
+        sender = asyncio.create_task(client.send_loop())
+        try:
+            await self.read_loop(client, reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.unregister(client)
+            if not client.closed:
+                client.closed = True
+                client.enqueue(None)
+            try:
+                await asyncio.wait_for(sender, timeout=NATIVE_CLOSE_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError):
+                sender.cancel()
+            await close_writer(writer)
+    
+    async def read_loop(self, client, reader):
+        """Read frames until the client closes; protocol errors are answered with a close frame"""
+        try:
+            await self.read_messages(client, reader)
+        except WebSocketProtocolError as e:
+            client.enqueue(encode_frame(close_payload(e.code, str(e)), opcode=0x8))
+    
+    async def read_messages(self, client, reader):
+        """Read frames until the client closes, reassembling fragmented messages"""
+        fragments = []
+        message_opcode = None
+        size = 0
+        while True:
+            fin, opcode, payload = await read_frame(reader, NATIVE_MAX_MESSAGE_BYTES, require_mask=True)
+            client.last_seen = time.monotonic()
+            
+            if opcode >= 0x8:
+                if not fin or len(payload) > 125:
+                    raise WebSocketProtocolError(1002, 'Invalid control frame')
+                if opcode == 0x8:
+                    code = close_code(payload)
+                    client.enqueue(encode_frame(close_payload(code) if code else b'', opcode=0x8))
+                    return
+                if opcode == 0x9:
+                    client.enqueue(encode_frame(payload, opcode=0xA))
+                elif opcode != 0xA:
+                    raise WebSocketProtocolError(1002, f'Unknown opcode {opcode}')
+                continue
             
-        if line.strip():
-            log_to_file(f"[Node WSS] {line.strip()}")
+            if opcode == 0x0:
+                if message_opcode is None:
+                    raise WebSocketProtocolError(1002, 'Unexpected continuation frame')
+            elif opcode in (0x1, 0x2):
+                if message_opcode is not None:
+                    raise WebSocketProtocolError(1002, 'Expected continuation frame')
+                message_opcode = opcode
+            else:
+                raise WebSocketProtocolError(1002, f'Unknown opcode {opcode}')
+            
+            fragments.append(payload)
+            size += len(payload)
+            if size > NATIVE_MAX_MESSAGE_BYTES:
+                raise WebSocketProtocolError(1009, 'Message too big')
+            if fin:
+                data = b''.join(fragments)
+                if message_opcode == 0x1:
+                    try:
+                        data.decode('utf-8')
+                    except UnicodeDecodeError:
+                        raise WebSocketProtocolError(1007, 'Invalid UTF-8 in text message')
+                fragments = []
+                message_opcode = None
+                size = 0
+                self.handle_message(client, data)
     
-    # Process exited
-    exit_code = proc.poll()
-    log_to_file(f"Node.js process exited with code {exit_code}")
+    def handle_message(self, client, data):
+        """Dispatch one client message (mirrors handleMessage() in Node.js)"""
+        self.counters['messages_received'] += 1
+        try:
+            message = json.loads(data)
+            message_type = message.get('type')
+        except (ValueError, AttributeError):
+            self.send(client, {'type': 'error', 'message': 'Invalid message format'})
+            return
+        
+        if message_type == 'ping':
+            self.send(client, {'type': 'pong'})
+        elif message_type == 'get_stats':
+            self.send(client, {'type': 'server_stats', 'stats': self.server_stats(), 'timestamp': iso_now()})
+        elif message_type == 'join_room':
+            old_room = client.room_id
+            new_room = message.get('room_id') or 'lobby'
+            self.unsubscribe(client, old_room)
+            self.subscribe(client, new_room)
+            client.room_id = new_room
+            self.broadcast_presence(old_room, client.user_handle, 'offline')
+            self.broadcast_presence(new_room, client.user_handle, 'online')
+            self.send(client, {'type': 'room_joined', 'room_id': new_room, 'timestamp': iso_now()})
+        elif message_type == 'leave_room':
+            self.unsubscribe(client, client.room_id)
+            self.broadcast_presence(client.room_id, client.user_handle, 'offline')
+        elif message_type == 'presence_update':
+            self.broadcast_presence(client.room_id, client.user_handle, message.get('status') or 'online')
+        # typing and read_receipt need the IM tables and are ignored here
     
-    # Auto-restart logic (optional)
-    if exit_code != 0:
-        global node_restart_count
-        node_restart_count += 1
-        log_to_file(f"Node.js process crashed (exit code: {exit_code}), attempting restart in 5 seconds... (restart #{node_restart_count})")
-        time.sleep(5)
-        if node_process == proc:  # Only restart if it's still the current process
-            start_node_wss()
-            if node_process:
-                monitor_node_process(node_process)
+    def subscribe(self, client, room_id):
+        self.room_subscriptions.setdefault(room_id, set()).add(client)
+    
+    def unsubscribe(self, client, room_id):
+        subscribers = self.room_subscriptions.get(room_id)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.room_subscriptions[room_id]
+    
+    def unregister(self, client):
+        """Remove a disconnected client from both indexes and announce it"""
+        clients = self.connected_clients.get(client.user_handle)
+        if clients is None or client not in clients:
+            return
+        clients.discard(client)
+        if not clients:
+            del self.connected_clients[client.user_handle]
+        self.unsubscribe(client, client.room_id)
+        self.broadcast_presence(client.room_id, client.user_handle, 'offline')
+    
+    def send(self, client, message):
+        """Send a message to a single client"""
+        if not client.closed and not client.enqueue(encode_frame(json_bytes(message))):
+            self.disconnect_slow(client)
+    
+    def broadcast(self, room_id, message):
+        """
+        Queue one encoded frame for every subscriber of a room.
+        
+        Returns:
+            Number of clients the frame was queued for
+        """
+        subscribers = self.room_subscriptions.get(room_id)
+        if not subscribers:
+            return 0
+        
+        frame = encode_frame(json_bytes(message))
+        sent = 0
+        for client in list(subscribers):
+            if client.closed:
+                continue
+            if client.enqueue(frame):
+                sent += 1
+            else:
+                self.disconnect_slow(client)
+        
+        self.counters['broadcasts'] += 1
+        self.counters['messages_delivered'] += sent
+        return sent
+    
+    def broadcast_presence(self, room_id, user_handle, status):
+        self.broadcast(room_id, {
+            'type': 'presence_update',
+            'room_id': room_id,
+            'user_handle': user_handle,
+            'status': status,
+            'timestamp': iso_now()
+        })
+    
+    def disconnect_slow(self, client):
+        """Drop a client whose send queue is full"""
+        client.closed = True
+        self.slow_disconnects += 1
+        log_to_file(f"[Native WS] Disconnecting slow client {client.user_handle} (send queue full)")
+        client.writer.transport.abort()
+    
+    async def keepalive(self):
+        """Ping every client periodically and drop the ones that went silent"""
+        ping = encode_frame(b'', opcode=0x9)
+        while not await wait_for_shutdown(NATIVE_PING_INTERVAL):
+            cutoff = time.monotonic() - NATIVE_IDLE_TIMEOUT
+            for clients in list(self.connected_clients.values()):
+                for client in list(clients):
+                    if client.closed:
+                        continue
+                    if client.last_seen < cutoff:
+                        client.closed = True
+                        client.writer.transport.abort()
+                    elif not client.enqueue(ping):
+                        self.disconnect_slow(client)
+    
+    async def close(self):
+        """Send a going-away close frame to every client, then drop stragglers"""
+        frame = encode_frame(close_payload(1001, 'Server shutting down'), opcode=0x8)
+        clients = [client for group in self.connected_clients.values() for client in group]
+        for client in clients:
+            if not client.closed:
+                client.closed = True
+                client.enqueue(frame)
+                client.enqueue(None)
+        
+        deadline = time.monotonic() + NATIVE_CLOSE_TIMEOUT
+        while self.connected_clients and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for client in clients:
+            client.writer.transport.abort()
+    
+    def server_stats(self):
+        """Statistics in the shape of getServerStats() in Node.js"""
+        uptime_seconds = int(time.time() - self.started_at)
+        return {
+            'uptime': f"{uptime_seconds // 3600}h {(uptime_seconds % 3600) // 60}m {uptime_seconds % 60}s",
+            'uptime_seconds': uptime_seconds,
+            'connected_users': len(self.connected_clients),
+            'total_connections': sum(len(clients) for clients in self.connected_clients.values()),
+            'active_rooms': len(self.room_subscriptions),
+            'users': list(self.connected_clients),
+            'rooms': {room_id: len(clients) for room_id, clients in self.room_subscriptions.items()}
+        }
+    
+    def report(self):
+        """Stats report in the format Node.js workers send to the aggregator"""
+        stats = self.server_stats()
+        return {
+            'worker': 'native',
+            'pid': os.getpid(),
+            'total_connections': stats['total_connections'],
+            'users': stats['users'],
+            'rooms': stats['rooms'],
+            'counters': dict(self.counters)
+        }
+    
+    def stats(self):
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'slow_disconnects': self.slow_disconnects,
+            'send_queue_size': self.queue_size,
+            'queued_frames': sum(
+                client.queue.qsize()
+                for clients in self.connected_clients.values()
+                for client in clients
+            )
+        }
+
+class OutboxPoller:
+    """
+    Broadcasts undelivered temp_outbox messages through the native server,
+    like pollAndBroadcastMessages() in websocket-server.js.
+    
+    Needs PyMySQL. Without it the native server only receives messages
+    posted to /broadcast.
+    """
+    
+    def __init__(self, fanout, credentials):
+        self.fanout = fanout
+        self.credentials = credentials
+        self.connection = None
+        self.broadcast_total = 0
+        self.errors = 0
+    
+    def _connect(self):
+        if self.connection is None:
+            self.connection = pymysql.connect(
+                host=DB_HOST,
+                port=DB_PORT,
+                database=DB_NAME,
+                user=self.credentials['db_user'],
+                password=self.credentials['db_password'],
+                charset='utf8mb4',
+                autocommit=True,
+                cursorclass=pymysql.cursors.DictCursor
+            )
+        return self.connection
+    
+    def _fetch_pending(self):
+        with self._connect().cursor() as cursor:
+            cursor.execute("""
+                SELECT id, room_id, sender_handle, cipher_blob, filter_version, queued_at,
+                       is_hidden, edited_at, edited_by, original_cipher_blob, hidden_by
+                FROM temp_outbox
+                WHERE delivered_at IS NULL
+                  AND deleted_at IS NULL
+                  AND is_hidden = FALSE
+                ORDER BY queued_at ASC
+                LIMIT 100
+            """)
+            return cursor.fetchall()
+    
+    def _mark_delivered(self, ids):
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self._connect().cursor() as cursor:
+            cursor.execute(f"UPDATE temp_outbox SET delivered_at = NOW() WHERE id IN ({placeholders})", ids)
+    
+    async def run(self):
+        """Poll and broadcast until shutdown"""
+        while not await wait_for_shutdown(NATIVE_POLL_INTERVAL):
+            try:
+                rows = await asyncio.to_thread(self._fetch_pending)
+                for row in rows:
+                    self.fanout.broadcast(row['room_id'], {
+                        'type': 'new_message',
+                        'message': {
+                            'id': str(row['id']),
+                            'room_id': row['room_id'],
+                            'sender_handle': row['sender_handle'],
+                            'cipher_blob': row['cipher_blob'],
+                            'filter_version': row['filter_version'],
+                            'queued_at': js_timestamp(row['queued_at']),
+                            'is_hidden': 1 if row['is_hidden'] else 0,
+                            'edited_at': js_timestamp(row['edited_at']),
+                            'edited_by': row['edited_by'],
+                            'original_cipher_blob': row['original_cipher_blob'],
+                            'hidden_by': row['hidden_by']
+                        },
+                        'timestamp': iso_now()
+                    })
+                if rows:
+                    await asyncio.to_thread(self._mark_delivered, [row['id'] for row in rows])
+                    self.broadcast_total += len(rows)
+            except Exception as e:
+                self.errors += 1
+                log_to_file(f"[DB] Error polling messages: {e}")
+                if self.connection is not None:
+                    try:
+                        self.connection.close()
+                    except Exception:
+                        pass
+                    self.connection = None
+        
+        if self.connection is not None:
+            self.connection.close()
+    
+    def stats(self):
+        return {'broadcast_total': self.broadcast_total, 'errors': self.errors}
+
+def json_bytes(message):
+    """Compact JSON like JSON.stringify()"""
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+def close_payload(code, reason=''):
+    return code.to_bytes(2, 'big') + reason.encode('utf-8')[:120]
+
+def close_code(payload):
+    """
+    Status code of a received close frame, None when it carries none.
+    
+    Raises:
+        WebSocketProtocolError: For codes a peer may not send (RFC 6455 7.4)
+    """
+    if not payload:
+        return None
+    code = int.from_bytes(payload[:2], 'big')
+    if len(payload) == 1 or not (1000 <= code <= 1014 and code not in (1004, 1005, 1006) or 3000 <= code <= 4999):
+        raise WebSocketProtocolError(1002, 'Invalid close code')
+    try:
+        payload[2:].decode('utf-8')
+    except UnicodeDecodeError:
+        raise WebSocketProtocolError(1007, 'Invalid UTF-8 in close reason')
+    return code
+
+async def close_writer(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
 
 def get_server_stats():
     """Get statistics for both Python and Node.js servers"""
-    global node_process, server_start_time, connected_clients, room_subscriptions, node_restart_count
+    global server_start_time, node_restart_count
     
     uptime_seconds = int(time.time() - server_start_time)
     hours = uptime_seconds // 3600
@@ -134,117 +1741,330 @@ def get_server_stats():
     seconds = uptime_seconds % 60
     uptime_str = f"{hours}h {minutes}m {seconds}s"
     
-    node_running = node_process is not None and node_process.poll() is None
-    node_pid = node_process.pid if node_process else None
+    primary = node_cluster.primary() if node_cluster else None
+    traffic = stats_aggregator.current
     
     return {
         'python_server': {
             'running': True,
+            'mode': WS_MODE,
             'port': PYTHON_WS_PORT,
             'pid': os.getpid(),
             'uptime': uptime_str,
-            'connected_clients': len(connected_clients),
-            'active_rooms': len(room_subscriptions),
+            'connected_clients': traffic['total_connections'],
+            'active_rooms': traffic['active_rooms'],
             'node_restarts': node_restart_count
         },
         'node_server': {
-            'running': node_running,
+            'running': primary is not None and primary.running,
             'port': NODE_WS_PORT,
-            'pid': node_pid,
-            'exit_code': node_process.poll() if node_process else None,
-            'restart_count': node_restart_count
+            'pid': primary.process.pid if primary and primary.process else None,
+            'exit_code': primary.last_exit_code if primary else None,
+            'restart_count': node_restart_count,
+            'cluster': node_cluster.stats() if node_cluster else None,
+            'output_events': dict(node_event_counts),
+            'recent_errors': [e for e in list(node_events) if e['level'] == 'error'][-10:]
+        },
+        'traffic': {
+            'sampled_at': traffic['sampled_at'],
+            'reporting_workers': traffic['reporting_workers'],
+            'stale_workers': traffic['stale_workers'],
+            'connected_users': traffic['connected_users'],
+            'total_connections': traffic['total_connections'],
+            'active_rooms': traffic['active_rooms'],
+            'rooms': traffic['rooms'],
+            'counters': traffic['counters'],
+            'rates_per_second': stats_aggregator.rates()
+        },
+        'resources': get_resource_stats(traffic),
+        'native_server': {
+            **fanout_server.stats(),
+            'outbox_poller': outbox_poller.stats() if outbox_poller else None
+        } if fanout_server else None,
+        'logging': log_writer.stats()
+    }
+
+def supervisor_usage():
+    """CPU seconds and resident memory of this process (RSS needs /proc)"""
+    rss_bytes = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss_bytes = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {'pid': os.getpid(), 'cpu_seconds': round(time.process_time(), 3), 'rss_bytes': rss_bytes}
+
+def get_resource_stats(traffic):
+    """CPU and memory of the supervisor plus every reporting Node.js worker"""
+    supervisor = supervisor_usage()
+    workers = traffic['processes']
+    return {
+        'supervisor': supervisor,
+        'node_workers': workers,
+        'total_cpu_seconds': round(supervisor['cpu_seconds'] + sum(w['cpu_seconds'] or 0 for w in workers), 3),
+        'total_rss_bytes': (supervisor['rss_bytes'] or 0) + sum(w['rss_bytes'] for w in workers)
+    }
+
+def cached_stats_body():
+    """Rendered /stats response, rebuilt at most once per STATS_CACHE_TTL"""
+    global stats_body, stats_body_built_at
+    
+    now = time.monotonic()
+    if stats_body is None or now - stats_body_built_at >= STATS_CACHE_TTL:
+        stats_body = json.dumps({'success': True, 'stats': get_server_stats()}).encode()
+        stats_body_built_at = now
+    return stats_body
+
+def cluster_stats_message(traffic):
+    """Cluster-wide connection totals for the Node.js workers' own stats endpoints"""
+    return {
+        'type': 'cluster_stats',
+        'stats': {
+            'connected_users': traffic['connected_users'],
+            'total_connections': traffic['total_connections'],
+            'active_rooms': traffic['active_rooms'],
+            'users': traffic['users'],
+            'rooms': traffic['rooms'],
+            'workers': traffic['reporting_workers']
         }
     }
 
-class StatsHandler(BaseHTTPRequestHandler):
-    """HTTP handler for /stats endpoint"""
-    def do_GET(self):
-        if self.path == '/stats':
-            stats = get_server_stats()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True, 'stats': stats}).encode())
+async def sample_stats():
+    """Aggregate worker reports into the stats history until shutdown"""
+    while True:
+        if fanout_server is not None:
+            stats_aggregator.update(fanout_server.report())
+        stats_aggregator.sample()
+        if node_cluster is not None:
+            node_cluster.broadcast(cluster_stats_message(stats_aggregator.current))
+        if await wait_for_shutdown(STATS_SAMPLE_INTERVAL):
+            break
+
+async def handle_http_client(reader, writer):
+    """Serve one HTTP request on port 4291, or a websocket in native mode"""
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=HTTP_READ_TIMEOUT)
+        lines = request.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        method = parts[0] if parts else ''
+        path, _, query = (parts[1] if len(parts) > 1 else '').partition('?')
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(':')
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        
+        if fanout_server is not None and headers.get('upgrade', '').lower() == 'websocket':
+            # The fan-out server owns the connection from here on
+            await fanout_server.handle(reader, writer, query, headers)
+            return
+        
+        if method == 'GET' and path == '/stats':
+            status, body = '200 OK', cached_stats_body()
+        elif method == 'GET' and path == '/stats/history':
+            status, body = '200 OK', json.dumps({
+                'success': True,
+                'interval': STATS_SAMPLE_INTERVAL,
+                'history': stats_aggregator.history_points()
+            }).encode()
+        elif method == 'POST' and path == '/broadcast' and fanout_server is not None:
+            status, body = await handle_broadcast_request(reader, writer, headers)
+        elif method not in ('GET', 'POST'):
+            status, body = '405 Method Not Allowed', b'Method Not Allowed'
         else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def log_message(self, format, *args):
-        # Suppress HTTP server logs
+            status, body = '404 Not Found', b'Not Found'
+        
+        content_type = 'application/json' if body.startswith(b'{') else 'text/plain'
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
         pass
+    finally:
+        await close_writer(writer)
+
+async def handle_broadcast_request(reader, writer, headers):
+    """
+    Inject a room message in native mode (loopback only, API secret required).
+    
+    Body: {"room_id": "...", "message": {...}} - broadcast as new_message.
+    
+    Returns:
+        (status, body) tuple
+    """
+    peer = writer.get_extra_info('peername')
+    if not peer or peer[0] not in ('127.0.0.1', '::1'):
+        return '403 Forbidden', b'{"success":false,"error":"Loopback only"}'
+    secret = headers.get('x-api-secret', '')
+    if not hmac.compare_digest(secret.encode(), fanout_server.api_secret.encode()):
+        return '403 Forbidden', b'{"success":false,"error":"Invalid API secret"}'
+    
+    try:
+        length = int(headers.get('content-length', '0'))
+        if not 0 < length <= NATIVE_MAX_MESSAGE_BYTES:
+            raise ValueError('invalid Content-Length')
+        data = json.loads(await asyncio.wait_for(reader.readexactly(length), timeout=HTTP_READ_TIMEOUT))
+        room_id = data['room_id']
+        message = data['message']
+        if not isinstance(room_id, str) or not isinstance(message, dict):
+            raise ValueError('room_id must be a string and message an object')
+    except (ValueError, KeyError, TypeError) as e:
+        return '400 Bad Request', json.dumps({'success': False, 'error': str(e)}).encode()
+    
+    message.setdefault('room_id', room_id)
+    delivered = fanout_server.broadcast(room_id, {'type': 'new_message', 'message': message, 'timestamp': iso_now()})
+    return '200 OK', json.dumps({'success': True, 'delivered': delivered}).encode()
 
-def run_http_server():
-    """Run HTTP server for stats endpoint"""
+async def start_http_server():
+    """Start the asyncio server for /stats (and the websocket protocol in native mode)"""
+    host = NATIVE_HOST if WS_MODE == 'native' else 'localhost'
     try:
-        httpd = HTTPServer(('localhost', PYTHON_WS_PORT), StatsHandler)
-        log_to_file(f"Python HTTP server started on port {PYTHON_WS_PORT}")
-        httpd.serve_forever()
-    except Exception as e:
+        server = await asyncio.start_server(handle_http_client, host, PYTHON_WS_PORT)
+    except OSError as e:
         log_to_file(f"HTTP server error: {e}")
+        return None
+    log_to_file(f"Python HTTP server started on port {PYTHON_WS_PORT}")
+    return server
 
 def signal_handler(sig, frame):
     """Handle shutdown signals"""
-    global node_process, monitor_thread
-    
     log_to_file("Shutdown signal received")
     
-    if node_process:
-        log_to_file("Terminating Node.js process...")
-        node_process.terminate()
-        try:
-            node_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            log_to_file("Force killing Node.js process...")
-            node_process.kill()
+    if supervisor_loop is not None and shutdown_event is not None:
+        supervisor_loop.call_soon_threadsafe(shutdown_event.set)
+    else:
+        log_writer.close()
+        sys.exit(0)
+
+def reload_handler(sig, frame):
+    """Handle SIGHUP by replacing the Node.js workers one at a time"""
+    log_to_file("Reload signal received")
+    
+    if supervisor_loop is not None and node_cluster is not None:
+        supervisor_loop.call_soon_threadsafe(start_rolling_restart)
+    else:
+        log_to_file("No Node.js workers to restart")
+
+def start_rolling_restart():
+    """Schedule a rolling restart on the supervisor loop"""
+    task = asyncio.ensure_future(node_cluster.rolling_restart())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def write_pid_file():
+    """Record the supervisor PID (Node.js workers have their own PID files)"""
+    try:
+        os.makedirs(os.path.dirname(PID_FILE), exist_ok=True)
+        with open(PID_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+    except Exception as e:
+        log_to_file(f"Failed to write PID file: {e}")
+
+async def run_supervisor():
+    """Start the websocket backend and supervise it until a shutdown signal arrives"""
+    global supervisor_loop, shutdown_event, node_cluster, fanout_server, outbox_poller
+    
+    supervisor_loop = asyncio.get_running_loop()
+    shutdown_event = asyncio.Event()
     
-    sys.exit(0)
+    if WS_MODE == 'native':
+        credentials = await asyncio.to_thread(load_credentials)
+        fanout_server = FanoutServer(credentials['api_secret'], NATIVE_SEND_QUEUE)
+    
+    # Start HTTP server for stats (and websocket clients in native mode)
+    http_server = await start_http_server()
+    tasks = [asyncio.create_task(sample_stats())]
+    
+    if WS_MODE == 'native':
+        if http_server is None:
+            log_to_file("ERROR: Failed to start native WebSocket server")
+            shutdown_event.set()
+            await asyncio.gather(*tasks)
+            return 1
+        
+        tasks.append(asyncio.create_task(fanout_server.keepalive()))
+        if pymysql is None:
+            log_to_file("PyMySQL not installed: native mode only receives messages via POST /broadcast")
+        else:
+            outbox_poller = OutboxPoller(fanout_server, credentials)
+            tasks.append(asyncio.create_task(outbox_poller.run()))
+        
+        log_to_file("Python WebSocket server running (native mode, Node.js not started)...")
+        log_to_file(f"Stats endpoint: http://localhost:{PYTHON_WS_PORT}/stats")
+        log_to_file(f"Native WebSocket: ws://{NATIVE_HOST}:{PYTHON_WS_PORT}")
+    else:
+        tasks.append(asyncio.create_task(probe_workers()))
+        
+        # Start Node.js workers
+        node_cluster = NodeCluster(resolve_worker_count(), NODE_PORT_MODE)
+        if not await node_cluster.start():
+            log_to_file("ERROR: Failed to start Node.js server")
+            shutdown_event.set()
+            await node_cluster.stop()
+            await asyncio.gather(*tasks)
+            if http_server is not None:
+                http_server.close()
+            return 1
+        
+        log_to_file("Python WebSocket server running...")
+        log_to_file(f"Stats endpoint: http://localhost:{PYTHON_WS_PORT}/stats")
+        if NODE_PORT_MODE == 'shared':
+            log_to_file(f"Node.js WebSocket: ws://localhost:{NODE_WS_PORT} ({node_cluster.size} worker(s))")
+        else:
+            log_to_file(f"Node.js WebSocket: ws://localhost:{NODE_WS_PORT}-{NODE_WS_PORT + node_cluster.size - 1}")
+    
+    # Keep serving until a shutdown signal arrives
+    await shutdown_event.wait()
+    
+    if fanout_server is not None:
+        await fanout_server.close()
+    if node_cluster is not None:
+        await node_cluster.stop()
+    await asyncio.gather(*tasks)
+    if http_server is not None:
+        http_server.close()
+        await http_server.wait_closed()
+    return 0
 
 def main():
     """Main entry point"""
-    global node_process, monitor_thread
-    
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload_handler)
+    
+    if NODE_PORT_MODE not in ('shared', 'range'):
+        print(f"Invalid NODE_PORT_MODE: {NODE_PORT_MODE} (expected 'shared' or 'range')")
+        sys.exit(2)
+    if WS_MODE not in ('node', 'native'):
+        print(f"Invalid WS_MODE: {WS_MODE} (expected 'node' or 'native')")
+        sys.exit(2)
     
     log_to_file("=" * 60)
     log_to_file("Python WebSocket Server Starting")
     log_to_file(f"Python WS Port: {PYTHON_WS_PORT}")
-    log_to_file(f"Node.js WS Port: {NODE_WS_PORT}")
+    if WS_MODE == 'native':
+        log_to_file("Mode: native fan-out (Node.js disabled)")
+    else:
+        log_to_file(f"Node.js WS Port: {NODE_WS_PORT}")
+        log_to_file(f"Node.js workers: {resolve_worker_count()} ({NODE_PORT_MODE} port mode)")
     log_to_file("=" * 60)
     
-    # Start Node.js server
-    node_process = start_node_wss()
-    
-    if not node_process:
-        log_to_file("ERROR: Failed to start Node.js server")
-        sys.exit(1)
-    
-    # Start monitoring thread
-    monitor_thread = threading.Thread(target=monitor_node_process, args=(node_process,))
-    monitor_thread.daemon = True
-    monitor_thread.start()
-    
-    # Start HTTP server for stats
-    http_thread = threading.Thread(target=run_http_server)
-    http_thread.daemon = True
-    http_thread.start()
+    write_pid_file()
     
-    log_to_file("Python WebSocket server running...")
-    log_to_file(f"Stats endpoint: http://localhost:{PYTHON_WS_PORT}/stats")
-    log_to_file(f"Node.js WebSocket: ws://localhost:{NODE_WS_PORT}")
-    
-    # Keep main thread alive
     try:
-        while True:
-            time.sleep(1)
-            # Check if Node.js process is still running
-            if node_process.poll() is not None and monitor_thread.is_alive():
-                # Process died, monitor thread should restart it
-                pass
+        exit_code = asyncio.run(run_supervisor())
     except KeyboardInterrupt:
-        signal_handler(None, None)
+        exit_code = 0
+    
+    log_to_file("Python WebSocket server stopped")
+    log_writer.close()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
-
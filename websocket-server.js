@@ -15,9 +15,16 @@ const http = require('http');
 const mysql = require('mysql2/promise');
 const url = require('url');
 const crypto = require('crypto');
+const readline = require('readline');
 
 // Configuration
 const WS_PORT = process.env.WS_PORT || 8420; // Default to 8420 (secondary server)
+const WS_LISTEN_FD = process.env.WS_LISTEN_FD; // Listening socket inherited from the Python supervisor (cluster mode)
+const WS_WORKER_ID = process.env.WS_WORKER_ID || '0';
+const SUPERVISOR_IPC = process.env.SUPERVISOR_IPC === '1'; // Running as a worker of the Python supervisor (stdout/stdin channel)
+const STATS_INTERVAL_MS = parseInt(process.env.WS_STATS_INTERVAL_MS || '2000', 10);
+const CLUSTER_STATS_MAX_AGE_MS = 3 * STATS_INTERVAL_MS; // Older cluster totals from the supervisor are ignored
+const DELIVERED_MARK_DELAY_MS = 1000; // Delay before a broadcast temp_outbox row is marked delivered
 const DB_HOST = process.env.DB_HOST || '127.0.0.1';
 const DB_PORT = process.env.DB_PORT || 3306;
 const DB_NAME = process.env.DB_NAME || 'sentinel_temp';
@@ -37,6 +44,23 @@ const wsMetadata = new Map();
 // Server start time for uptime tracking
 let serverStartTime = null;
 
+// A standalone server polls temp_outbox itself; under the supervisor only
+// the one worker it elects does, so each row is broadcast once
+let pollOutbox = !SUPERVISOR_IPC;
+// temp_outbox IDs broadcast but not yet marked delivered (skipped by later polls)
+const pendingDelivery = new Set();
+
+// Cluster-wide connection totals pushed by the supervisor
+let clusterStats = null;
+let clusterStatsAt = 0;
+
+// Cumulative message counters (reported to the supervisor for rate calculations)
+const messageCounters = {
+    messages_received: 0,
+    broadcasts: 0,
+    messages_delivered: 0
+};
+
 // Create HTTP server
 const server = http.createServer();
 
@@ -229,17 +253,25 @@ async function validateConnection(req) {
 }
 
 /**
- * Broadcast message to all clients in a room
+ * Pass a broadcast to the other workers through the supervisor
+ * (payloadStr is a JSON object the receiving workers deliver locally)
  */
-function broadcastToRoom(roomId, message, excludeWs = null) {
+function relayToWorkers(payloadStr) {
+    if (SUPERVISOR_IPC) {
+        process.stdout.write(`@@relay ${payloadStr}\n`);
+    }
+}
+
+/**
+ * Send a serialized message to this worker's clients in a room
+ */
+function sendToRoomClients(roomId, messageStr, excludeWs = null) {
     const subscribers = roomSubscriptions.get(roomId);
     if (!subscribers || subscribers.size === 0) {
-        return;
+        return 0;
     }
     
-    const messageStr = JSON.stringify(message);
     let sentCount = 0;
-    
     subscribers.forEach((ws) => {
         if (ws !== excludeWs && ws.readyState === WebSocket.OPEN) {
             try {
@@ -251,7 +283,57 @@ function broadcastToRoom(roomId, message, excludeWs = null) {
         }
     });
     
-    console.log(`[WS] Broadcast to room "${roomId}": ${sentCount} clients`);
+    messageCounters.messages_delivered += sentCount;
+    return sentCount;
+}
+
+/**
+ * Send a serialized message to every connection of a user on this worker
+ */
+function sendToUserClients(userHandle, messageStr) {
+    const userClients = connectedClients.get(userHandle);
+    if (!userClients || userClients.size === 0) {
+        return 0;
+    }
+    
+    let sentCount = 0;
+    userClients.forEach((ws) => {
+        if (ws.readyState === WebSocket.OPEN) {
+            try {
+                ws.send(messageStr);
+                sentCount++;
+            } catch (error) {
+                console.error(`[WS] Error sending to ${userHandle}:`, error.message);
+            }
+        }
+    });
+    
+    messageCounters.messages_delivered += sentCount;
+    return sentCount;
+}
+
+/**
+ * Broadcast message to all clients in a room, on every worker
+ */
+function broadcastToRoom(roomId, message, excludeWs = null) {
+    const messageStr = JSON.stringify(message);
+    relayToWorkers(`{"type":"room","room_id":${JSON.stringify(roomId)},"message":${messageStr}}`);
+    
+    messageCounters.broadcasts++;
+    const sentCount = sendToRoomClients(roomId, messageStr, excludeWs);
+    if (sentCount > 0) {
+        console.log(`[WS] Broadcast to room "${roomId}": ${sentCount} clients`);
+    }
+}
+
+/**
+ * Send message to every connection of a user, on every worker
+ * Returns the number of connections reached on this worker
+ */
+function sendToUser(userHandle, message) {
+    const messageStr = JSON.stringify(message);
+    relayToWorkers(`{"type":"user","user_handle":${JSON.stringify(userHandle)},"message":${messageStr}}`);
+    return sendToUserClients(userHandle, messageStr);
 }
 
 /**
@@ -338,6 +420,7 @@ wss.on('connection', async (ws, req) => {
     
     // Handle incoming messages
     ws.on('message', async (data) => {
+        messageCounters.messages_received++;
         try {
             const message = JSON.parse(data.toString());
             await handleMessage(ws, message);
@@ -445,6 +528,81 @@ function getServerStats() {
     };
 }
 
+/**
+ * Server statistics with connection totals for the whole cluster
+ * (falls back to this worker's own numbers without fresh supervisor data)
+ */
+function getClusterStats() {
+    const stats = getServerStats();
+    if (clusterStats && Date.now() - clusterStatsAt < CLUSTER_STATS_MAX_AGE_MS) {
+        stats.connected_users = clusterStats.connected_users;
+        stats.total_connections = clusterStats.total_connections;
+        stats.active_rooms = clusterStats.active_rooms;
+        stats.users = clusterStats.users;
+        stats.rooms = clusterStats.rooms;
+        stats.workers = clusterStats.workers;
+    }
+    return stats;
+}
+
+/**
+ * Report stats to the Python supervisor as one stdout line
+ * (the supervisor strips these lines from the log)
+ */
+function reportStatsToSupervisor() {
+    const stats = getServerStats();
+    const cpu = process.cpuUsage();
+    const report = {
+        worker: WS_WORKER_ID,
+        pid: process.pid,
+        uptime_seconds: stats.uptime_seconds,
+        connected_users: stats.connected_users,
+        total_connections: stats.total_connections,
+        users: stats.users,
+        rooms: stats.rooms,
+        counters: messageCounters,
+        rss_bytes: process.memoryUsage().rss,
+        cpu_seconds: (cpu.user + cpu.system) / 1e6
+    };
+    process.stdout.write(`@@stats ${JSON.stringify(report)}\n`);
+}
+
+/**
+ * Liveness probe endpoint for the Python supervisor.
+ * Listens on an ephemeral loopback port and only answers ping with pong,
+ * without authentication, presence or room registration, so a slow pong
+ * means this worker's event loop is saturated.
+ */
+function setupProbeEndpoint() {
+    const probeServer = http.createServer((req, res) => {
+        res.writeHead(404);
+        res.end('Not Found');
+    });
+    const probeWss = new WebSocket.Server({
+        server: probeServer,
+        perMessageDeflate: false
+    });
+    
+    probeWss.on('connection', (ws) => {
+        ws.on('message', (data) => {
+            let message;
+            try {
+                message = JSON.parse(data.toString());
+            } catch (error) {
+                return;
+            }
+            if (message.type === 'ping') {
+                ws.send(JSON.stringify({ type: 'pong', timestamp: Date.now() }));
+            }
+        });
+        ws.on('error', () => {});
+    });
+    
+    probeServer.listen(0, '127.0.0.1', () => {
+        logToFile(`[WS] Probe endpoint listening on port ${probeServer.address().port}`);
+    });
+}
+
 /**
  * Handle incoming WebSocket messages
  */
@@ -477,7 +635,7 @@ async function handleMessage(ws, message) {
             // Return server statistics
             ws.send(JSON.stringify({
                 type: 'server_stats',
-                stats: getServerStats(),
+                stats: getClusterStats(),
                 timestamp: new Date().toISOString()
             }));
             break;
@@ -564,25 +722,12 @@ async function handleTypingIndicator(ws, message, userHandle) {
     }
     
     // Broadcast to conversation partner
-    const partnerClients = connectedClients.get(conversationWith);
-    if (partnerClients) {
-        const typingMessage = JSON.stringify({
-            type: 'typing',
-            from_user: userHandle,
-            is_typing: isTyping,
-            timestamp: new Date().toISOString()
-        });
-        
-        partnerClients.forEach((partnerWs) => {
-            if (partnerWs.readyState === WebSocket.OPEN) {
-                try {
-                    partnerWs.send(typingMessage);
-                } catch (error) {
-                    console.error('[WS] Error sending typing indicator:', error.message);
-                }
-            }
-        });
-    }
+    sendToUser(conversationWith, {
+        type: 'typing',
+        from_user: userHandle,
+        is_typing: isTyping,
+        timestamp: new Date().toISOString()
+    });
 }
 
 /**
@@ -618,33 +763,20 @@ async function handleReadReceipt(ws, message, userHandle) {
     }
     
     // Notify sender
-    const senderClients = connectedClients.get(fromUser);
-    if (senderClients) {
-        const receiptMessage = JSON.stringify({
-            type: 'read_receipt',
-            message_id: messageId,
-            read_by: userHandle,
-            is_read: true,
-            timestamp: new Date().toISOString()
-        });
-        
-        senderClients.forEach((senderWs) => {
-            if (senderWs.readyState === WebSocket.OPEN) {
-                try {
-                    senderWs.send(receiptMessage);
-                } catch (error) {
-                    console.error('[WS] Error sending read receipt:', error.message);
-                }
-            }
-        });
-    }
+    sendToUser(fromUser, {
+        type: 'read_receipt',
+        message_id: messageId,
+        read_by: userHandle,
+        is_read: true,
+        timestamp: new Date().toISOString()
+    });
 }
 
 /**
  * Poll database for new messages and broadcast them
  */
 async function pollAndBroadcastMessages() {
-    if (!dbPool) {
+    if (!dbPool || !pollOutbox) {
         return;
     }
     
@@ -662,6 +794,11 @@ async function pollAndBroadcastMessages() {
         `);
         
         for (const row of roomMessages) {
+            // Already broadcast; its delivered_at update is still pending
+            if (pendingDelivery.has(row.id)) {
+                continue;
+            }
+            
             // Broadcast message to room
             broadcastToRoom(row.room_id, {
                 type: 'new_message',
@@ -682,16 +819,8 @@ async function pollAndBroadcastMessages() {
             });
             
             // Mark as delivered after a short delay to ensure all clients received it
-            setTimeout(async () => {
-                try {
-                    await dbPool.execute(
-                        'UPDATE temp_outbox SET delivered_at = NOW() WHERE id = ?',
-                        [row.id]
-                    );
-                } catch (error) {
-                    console.error(`[DB] Error marking message as delivered:`, error.message);
-                }
-            }, 1000);
+            pendingDelivery.add(row.id);
+            setTimeout(() => markDelivered([row.id]), DELIVERED_MARK_DELAY_MS);
         }
         
         // Get IM messages that haven't been delivered yet (sent but not read)
@@ -706,61 +835,93 @@ async function pollAndBroadcastMessages() {
         `);
         
         for (const row of imMessages) {
-            // Broadcast IM to recipient if they're connected
-            const recipientClients = connectedClients.get(row.to_user);
-            if (recipientClients && recipientClients.size > 0) {
-                const imMessage = {
-                    type: 'new_im',
-                    im: {
-                        id: row.id.toString(),
-                        from_user: row.from_user,
-                        to_user: row.to_user,
-                        cipher_blob: row.cipher_blob,
-                        queued_at: row.queued_at,
-                        status: row.status,
-                        read_at: row.read_at
-                    },
-                    timestamp: new Date().toISOString()
-                };
-                
-                // Send to all of recipient's connections
-                recipientClients.forEach((ws) => {
-                    if (ws.readyState === WebSocket.OPEN) {
-                        try {
-                            ws.send(JSON.stringify(imMessage));
-                        } catch (error) {
-                            console.error(`[WS] Error sending IM to client:`, error.message);
-                        }
-                    }
-                });
-                
+            // Send IM to all of the recipient's connections (on any worker)
+            const sentCount = sendToUser(row.to_user, {
+                type: 'new_im',
+                im: {
+                    id: row.id.toString(),
+                    from_user: row.from_user,
+                    to_user: row.to_user,
+                    cipher_blob: row.cipher_blob,
+                    queued_at: row.queued_at,
+                    status: row.status,
+                    read_at: row.read_at
+                },
+                timestamp: new Date().toISOString()
+            });
+            if (sentCount > 0) {
                 logToFile(`[WS] Broadcast IM from ${row.from_user} to ${row.to_user}`);
             }
             
-            // Also notify sender that message was delivered (if they're connected)
-            const senderClients = connectedClients.get(row.from_user);
-            if (senderClients && senderClients.size > 0) {
-                senderClients.forEach((ws) => {
-                    if (ws.readyState === WebSocket.OPEN) {
-                        try {
-                            ws.send(JSON.stringify({
-                                type: 'im_delivered',
-                                im_id: row.id.toString(),
-                                to_user: row.to_user,
-                                timestamp: new Date().toISOString()
-                            }));
-                        } catch (error) {
-                            console.error(`[WS] Error sending IM delivery confirmation:`, error.message);
-                        }
-                    }
-                });
-            }
+            // Also notify sender that message was delivered
+            sendToUser(row.from_user, {
+                type: 'im_delivered',
+                im_id: row.id.toString(),
+                to_user: row.to_user,
+                timestamp: new Date().toISOString()
+            });
         }
     } catch (error) {
         console.error('[DB] Error polling messages:', error.message);
     }
 }
 
+/**
+ * Set delivered_at on broadcast temp_outbox rows still pending
+ */
+async function markDelivered(ids) {
+    ids = ids.filter((id) => pendingDelivery.has(id));
+    if (ids.length === 0 || !dbPool) {
+        return;
+    }
+    
+    try {
+        await dbPool.query('UPDATE temp_outbox SET delivered_at = NOW() WHERE id IN (?)', [ids]);
+    } catch (error) {
+        console.error(`[DB] Error marking message as delivered:`, error.message);
+    } finally {
+        // On failure the next poll broadcasts the rows again
+        ids.forEach((id) => pendingDelivery.delete(id));
+    }
+}
+
+/**
+ * Handle one line from the Python supervisor (stdin): broadcasts relayed
+ * from other workers, outbox poller election and cluster stats
+ */
+function handleSupervisorMessage(line) {
+    let message;
+    try {
+        message = JSON.parse(line);
+    } catch (error) {
+        console.error('[IPC] Invalid supervisor message:', error.message);
+        return;
+    }
+    
+    switch (message.type) {
+        case 'room':
+            sendToRoomClients(message.room_id, JSON.stringify(message.message));
+            break;
+            
+        case 'user':
+            sendToUserClients(message.user_handle, JSON.stringify(message.message));
+            break;
+            
+        case 'poll_outbox':
+            pollOutbox = message.enabled === true;
+            logToFile(`[WS] Outbox polling ${pollOutbox ? 'enabled' : 'disabled'} (worker ${WS_WORKER_ID})`);
+            break;
+            
+        case 'cluster_stats':
+            clusterStats = message.stats;
+            clusterStatsAt = Date.now();
+            break;
+            
+        default:
+            console.log(`[IPC] Unknown supervisor message type: ${message.type}`);
+    }
+}
+
 /**
  * Clean up stale connections (ping timeout)
  */
@@ -835,7 +996,7 @@ function setupHttpEndpoint() {
         
         // Stats endpoint
         if (parsedUrl.pathname === '/stats' && req.method === 'GET') {
-            const stats = getServerStats();
+            const stats = getClusterStats();
             res.writeHead(200, { 'Content-Type': 'application/json' });
             res.end(JSON.stringify({
                 success: true,
@@ -860,12 +1021,22 @@ async function start() {
     // Setup HTTP endpoint for stats
     setupHttpEndpoint();
     
-    server.listen(WS_PORT, () => {
-        logToFile(`[WS] WebSocket server listening on port ${WS_PORT}`);
+    // Cluster workers share one socket bound by the supervisor
+    const listenTarget = WS_LISTEN_FD ? { fd: parseInt(WS_LISTEN_FD, 10) } : WS_PORT;
+    
+    server.listen(listenTarget, () => {
+        logToFile(`[WS] WebSocket server listening on port ${WS_PORT} (worker ${WS_WORKER_ID}, pid ${process.pid})`);
         logToFile(`[WS] Connect with: ws://localhost:${WS_PORT}?user_handle=USER&api_secret=SECRET&room_id=ROOM`);
         logToFile(`[WS] Stats endpoint: http://localhost:${WS_PORT}/stats`);
     });
     
+    // Push stats to the supervisor and take relayed broadcasts from it when running under it
+    if (SUPERVISOR_IPC) {
+        setInterval(reportStatsToSupervisor, STATS_INTERVAL_MS);
+        setupProbeEndpoint();
+        readline.createInterface({ input: process.stdin }).on('line', handleSupervisorMessage);
+    }
+    
     // Poll for new messages every 500ms
     setInterval(pollAndBroadcastMessages, 500);
     
@@ -883,20 +1054,19 @@ async function start() {
 }
 
 // Handle graceful shutdown
-process.on('SIGTERM', () => {
+async function shutdown() {
     console.log('[WS] Shutting down gracefully...');
-    wss.close(() => {
-        if (dbPool) {
-            dbPool.end();
+    
+    // Hand temp_outbox over at once: rows broadcast in the last second are
+    // marked delivered so the next poller does not send them again
+    if (pollOutbox) {
+        pollOutbox = false;
+        await markDelivered(Array.from(pendingDelivery));
+        if (SUPERVISOR_IPC) {
+            process.stdout.write('@@outbox released\n');
         }
-        server.close(() => {
-            process.exit(0);
-        });
-    });
-});
-
-process.on('SIGINT', () => {
-    console.log('[WS] Shutting down gracefully...');
+    }
+    
     wss.close(() => {
         if (dbPool) {
             dbPool.end();
@@ -905,7 +1075,10 @@ process.on('SIGINT', () => {
             process.exit(0);
         });
     });
-});
+}
+
+process.on('SIGTERM', shutdown);
+process.on('SIGINT', shutdown);
 
 // Start the server
 start().catch((error) => {